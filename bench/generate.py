@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import os
+import os.path
+import random
+from xml.sax.saxutils import quoteattr
+
+# Scaled synthetic inputs for the benchmarks: the shipped csv files repeated
+# scale times with unique ids (and unique names, so that every copy is a new
+# geocoding query), and an osm xml built from the osm museums csv.
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+FREQUENTATION = os.path.join(ROOT, 'frequentation', 'frequentation-des-musees-de-france.csv')
+LOCALISATION = os.path.join(ROOT, 'localisation', 'liste-et-localisation-des-musees-de-france.csv')
+OSM_MUSEUMS = os.path.join(ROOT, 'osm', 'tag-museums', 'france-museums.csv')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Generate scaled synthetic inputs for the converters benchmarks')
+    parser.add_argument('-s', '--scale', type=int, default=10, help='number of copies of the shipped data')
+    parser.add_argument('-d', '--output-dir', type=str, default='./bench-data', help='output directory')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the synthetic osm geometry')
+    return parser.parse_args()
+
+def scale_frequentation(output, scale, source=FREQUENTATION):
+    # Rows are copied with a copy number appended to the museum id
+    with open(source, newline='') as csv_inputfile:
+        lines = csv_inputfile.read().splitlines()
+    header, rows = lines[0], [line.split(';', 1) for line in lines[1:] if line]
+    with open(output, 'w', newline='') as csv_outputfile:
+        csv_outputfile.write(header + '\n')
+        for copy in range(scale):
+            suffix = '{:04d}'.format(copy) if copy else ''
+            csv_outputfile.write(''.join(museum_id + suffix + ';' + rest + '\n' for museum_id, rest in rows))
+    return scale * len(rows)
+
+def scale_localisation(output, scale, source=LOCALISATION):
+    # Copies get a new museum id and a numbered name, so they are not geocoding cache hits
+    with open(source, newline='') as csv_inputfile:
+        csv_reader = csv.reader(csv_inputfile)
+        header = next(csv_reader)
+        rows = list(csv_reader)
+    with open(output, 'w', newline='') as csv_outputfile:
+        csv_writer = csv.writer(csv_outputfile)
+        csv_writer.writerow(header)
+        for copy in range(scale):
+            for row in rows:
+                if copy:
+                    row = [row[0] + ' ' + str(copy), row[1] + '{:04d}'.format(copy)] + row[2:]
+                csv_writer.writerow(row)
+    return scale * len(rows)
+
+def write_tags(osm_file, tags):
+    for k, v in tags:
+        osm_file.write('  <tag k={} v={}/>\n'.format(quoteattr(k), quoteattr(v)))
+
+def synthetic_osm(output, scale, seed=0, source=OSM_MUSEUMS):
+    # One tagged node per museum and copy, every fifth museum being a closed way
+    # of four untagged nodes instead, plus untagged nodes as geometry noise
+    with open(source, newline='', encoding='utf-8-sig') as csv_inputfile:
+        museums = [row for row in csv.DictReader(csv_inputfile) if row['lat'] and row['lon']]
+    rng = random.Random(seed)
+    timestamp = '2021-01-01T00:00:00Z'
+    node_id = 1
+    way_id = 1
+    ways = []
+    count = 0
+    with open(output, 'w', encoding='utf-8') as osm_file:
+        osm_file.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6" generator="fruseum-bench">\n')
+        for copy in range(scale):
+            for number, museum in enumerate(museums):
+                lat = float(museum['lat'])
+                lon = float(museum['lon'])
+                tags = [('tourism', 'museum'), ('name', museum['name'] + (' ' + str(copy) if copy else ''))]
+                if museum['website']:
+                    tags.append(('website', museum['website']))
+                for _ in range(2):
+                    osm_file.write('<node id="{}" lat="{:.7f}" lon="{:.7f}" timestamp="{}"/>\n'.format(
+                        node_id, lat + rng.uniform(-0.01, 0.01), lon + rng.uniform(-0.01, 0.01), timestamp))
+                    node_id += 1
+                if number % 5 == 0:
+                    refs = []
+                    for dlat, dlon in ((0, 0), (0.0005, 0), (0.0005, 0.0005), (0, 0.0005)):
+                        osm_file.write('<node id="{}" lat="{:.7f}" lon="{:.7f}" timestamp="{}"/>\n'.format(node_id, lat + dlat, lon + dlon, timestamp))
+                        refs.append(node_id)
+                        node_id += 1
+                    ways.append((way_id, refs + refs[:1], tags))
+                    way_id += 1
+                else:
+                    osm_file.write('<node id="{}" lat="{:.7f}" lon="{:.7f}" timestamp="{}">\n'.format(node_id, lat, lon, timestamp))
+                    write_tags(osm_file, tags)
+                    osm_file.write('</node>\n')
+                    node_id += 1
+                count += 1
+        for way_id, refs, tags in ways:
+            osm_file.write('<way id="{}" timestamp="{}">\n'.format(way_id, timestamp))
+            for ref in refs:
+                osm_file.write('  <nd ref="{}"/>\n'.format(ref))
+            write_tags(osm_file, tags)
+            osm_file.write('</way>\n')
+        osm_file.write('</osm>\n')
+    return count
+
+def generate(output_dir, scale, seed=0):
+    # Write the three inputs of the given scale, return their filenames and number of rows
+    os.makedirs(output_dir, exist_ok=True)
+    inputs = {
+        'frequentation': os.path.join(output_dir, 'frequentation-x{}.csv'.format(scale)),
+        'localisation': os.path.join(output_dir, 'localisation-x{}.csv'.format(scale)),
+        'osm2csv': os.path.join(output_dir, 'museums-x{}.osm'.format(scale)),
+    }
+    rows = {
+        'frequentation': scale_frequentation(inputs['frequentation'], scale),
+        'localisation': scale_localisation(inputs['localisation'], scale),
+        'osm2csv': synthetic_osm(inputs['osm2csv'], scale, seed),
+    }
+    return inputs, rows
+
+def main():
+    args = parse_args()
+    inputs, rows = generate(args.output_dir, args.scale, args.seed)
+    for name in inputs:
+        print('{}: {} rows in {} ({:.1f} MB)'.format(name, rows[name], inputs[name], os.path.getsize(inputs[name]) / 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import http.client
+import json
+import os.path
+import random
+import threading
+import time
+import urllib.parse
+from generate import ROOT
+
+# Load test of the query server (python3 -m fruseum serve): concurrent
+# keep-alive clients send a mix of lookups built from the localisation csv,
+# then the latency percentiles of each endpoint are reported.
+LOCALISATION = os.path.join(ROOT, 'localisation', 'data', 'liste-et-localisation-des-musees-de-france.csv')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load test the museum query server')
+    parser.add_argument('-u', '--url', type=str, default='http://127.0.0.1:8000', help='query server url')
+    parser.add_argument('-l', '--localisation', type=str, default=LOCALISATION, help='structured localisation csv the queries are built from')
+    parser.add_argument('-c', '--concurrency', type=int, default=8, help='number of concurrent clients')
+    parser.add_argument('-d', '--duration', type=float, default=10.0, help='duration of the test, in seconds')
+    parser.add_argument('-o', '--output', type=str, default=None, help='also save the results to this json file')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the queries')
+    return parser.parse_args()
+
+def build_queries(filename, rng):
+    # (endpoint, path) couples, in the proportions of the endpoints
+    with open(filename, newline='', encoding='utf-8-sig') as csv_inputfile:
+        rows = list(csv.DictReader(csv_inputfile))
+    quote = urllib.parse.quote
+    queries = []
+    for row in rng.sample(rows, min(len(rows), 500)):
+        queries.append(('museum', '/museum/' + quote(row['id'])))
+        queries.append(('attendance', '/attendance/' + quote(row['id'])))
+        if row['osm_id']:
+            queries.append(('osm', '/osm/' + quote(row['osm_id'])))
+        words = row['name'].split()
+        if words:
+            word = rng.choice(words)
+            queries.append(('search', '/search?name=' + quote(word[:max(3, len(word) // 2)]) + '&limit=20'))
+        if row['city']:
+            queries.append(('city', '/city/' + quote(row['city'])))
+        if row['postal_code'][:2].isdigit():
+            queries.append(('department', '/department/' + row['postal_code'][:2]))
+        try:
+            lat, lon = float(row['lat']), float(row['lon'])
+        except ValueError:
+            continue
+        queries.append(('bbox', '/bbox?south={}&west={}&north={}&east={}'.format(lat - 0.1, lon - 0.1, lat + 0.1, lon + 0.1)))
+    return queries
+
+def percentile(values, ratio):
+    return values[min(len(values) - 1, int(ratio * len(values)))] if values else 0.0
+
+def client(url, queries, deadline, latencies, errors, rng):
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=10)
+    while time.perf_counter() < deadline:
+        endpoint, path = rng.choice(queries)
+        start = time.perf_counter()
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors[endpoint] = errors.get(endpoint, 0) + 1
+            connection.close()
+            connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=10)
+            continue
+        latencies.setdefault(endpoint, []).append(time.perf_counter() - start)
+        if response.status >= 500:
+            errors[endpoint] = errors.get(endpoint, 0) + 1
+    connection.close()
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    queries = build_queries(args.localisation, rng)
+    url = urllib.parse.urlsplit(args.url)
+
+    deadline = time.perf_counter() + args.duration
+    # One latency table per client, merged at the end, so that clients never share a lock
+    tables = [({}, {}) for _ in range(args.concurrency)]
+    threads = [threading.Thread(target=client, args=(url, queries, deadline, latencies, errors, random.Random(args.seed + number)))
+               for number, (latencies, errors) in enumerate(tables)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = {}
+    errors = {}
+    for client_latencies, client_errors in tables:
+        for endpoint, values in client_latencies.items():
+            latencies.setdefault(endpoint, []).extend(values)
+        for endpoint, count in client_errors.items():
+            errors[endpoint] = errors.get(endpoint, 0) + count
+    every = sorted(value for values in latencies.values() for value in values)
+
+    results = {'concurrency': args.concurrency, 'elapsed_s': round(elapsed, 3), 'requests': len(every),
+               'requests_per_sec': round(len(every) / elapsed, 1), 'endpoints': {}}
+    print('{} requests in {:.1f}s ({:.0f} requests/sec), {} clients'.format(len(every), elapsed, len(every) / elapsed, args.concurrency))
+    for endpoint, values in sorted(latencies.items()) + [('all', every)]:
+        values.sort()
+        summary = {'requests': len(values), 'errors': errors.get(endpoint, 0) if endpoint != 'all' else sum(errors.values()),
+                   'p50_ms': round(percentile(values, 0.5) * 1000, 3), 'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+                   'max_ms': round(values[-1] * 1000, 3) if values else 0.0}
+        results['endpoints'][endpoint] = summary
+        print('{:<12} {:>8} requests  p50 {:>8.3f} ms  p99 {:>8.3f} ms  max {:>8.3f} ms  {} errors'.format(
+            endpoint, summary['requests'], summary['p50_ms'], summary['p99_ms'], summary['max_ms'], summary['errors']))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+if __name__ == '__main__':
+    main()
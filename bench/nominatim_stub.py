@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.parse
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in of the nominatim search and lookup endpoints for the
+# benchmarks: deterministic answers derived from the query, a configurable
+# latency, error (503) rate and search "no match" rate, and request counters
+# served on /stats (and reset with /reset).
+OSM_TYPES = {'N': 'node', 'W': 'way', 'R': 'relation'}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Serve a fake nominatim search and lookup api')
+    parser.add_argument('-p', '--port', type=int, default=8080, help='port to listen on')
+    parser.add_argument('-l', '--latency', type=float, default=0.0, help='latency added to each request, in milliseconds')
+    parser.add_argument('-e', '--error-rate', type=float, default=0.0, help='ratio of requests answered with a 503')
+    parser.add_argument('-m', '--miss-rate', type=float, default=0.0, help='ratio of searches without any result')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the errors')
+    return parser.parse_args()
+
+def place(osm_type, osm_id):
+    # Same answer for the same element, somewhere in metropolitan France
+    h = zlib.crc32('{}{}'.format(osm_type, osm_id).encode('utf-8'))
+    lat = 42.5 + (h % 10000) / 10000 * 8.5
+    lon = -4.5 + (h // 10000 % 10000) / 10000 * 12.5
+    town = 'Ville {}'.format(h % 1000)
+    return {
+        'place_id': h,
+        'osm_type': osm_type,
+        'osm_id': osm_id,
+        'lat': '{:.7f}'.format(lat),
+        'lon': '{:.7f}'.format(lon),
+        'class': 'tourism',
+        'type': 'museum',
+        'display_name': 'Musée {}, {}, France'.format(osm_id, town),
+        'address': {
+            'house_number': str(h % 200 + 1),
+            'road': 'Rue {}'.format(h % 5000),
+            'town': town,
+            'postcode': '{:05d}'.format(1000 + h % 94000),
+            'country': 'France',
+            'country_code': 'fr',
+        },
+        'namedetails': {'name': 'Musée {}'.format(osm_id)},
+        'extratags': {},
+    }
+
+class NominatimStub(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, error_rate=0.0, miss_rate=0.0, seed=0):
+        super().__init__(address, StubHandler)
+        self.latency = latency / 1000
+        self.error_rate = error_rate
+        self.miss_rate = miss_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address[:2])
+
+    def reset(self):
+        with self.lock:
+            self.stats = {'search': 0, 'lookup': 0, 'ids': 0, 'errors': 0, 'misses': 0}
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.stats[name] += n
+
+    def fails(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def search(self, query):
+        if zlib.crc32(query.encode('utf-8')) % 10000 < self.miss_rate * 10000:
+            self.count('misses')
+            return []
+        return [place('node', zlib.crc32(query.encode('utf-8')))]
+
+    def lookup(self, osm_ids):
+        results = []
+        for osm_id in osm_ids.split(','):
+            if osm_id[:1] in OSM_TYPES and osm_id[1:].isdigit():
+                results.append(place(OSM_TYPES[osm_id[0]], int(osm_id[1:])))
+        self.count('ids', len(results))
+        return results
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, without Nagle keep-alive answers are not delayed
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        stub = self.server
+        if url.path == '/stats':
+            with stub.lock:
+                return self.reply(200, dict(stub.stats))
+        if url.path == '/reset':
+            stub.reset()
+            return self.reply(200, {})
+        if url.path not in ('/search', '/lookup'):
+            return self.reply(404, {'error': 'unknown endpoint'})
+
+        stub.count(url.path[1:])
+        if stub.latency:
+            time.sleep(stub.latency)
+        if stub.fails():
+            stub.count('errors')
+            return self.reply(503, {'error': 'service unavailable'})
+        if url.path == '/search':
+            return self.reply(200, stub.search(params.get('q', '')))
+        return self.reply(200, stub.lookup(params.get('osm_ids', '')))
+
+    def reply(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    args = parse_args()
+    stub = NominatimStub(('127.0.0.1', args.port), args.latency, args.error_rate, args.miss_rate, args.seed)
+    print('fake nominatim listening on {}'.format(stub.url))
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import os.path
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from generate import ROOT, generate
+from nominatim_stub import NominatimStub
+
+# Run the three converters on scaled synthetic inputs against the local
+# nominatim stub, measuring the wall time, rows/sec, peak RSS and requests
+# issued of each run, and save everything as json.
+CONVERTERS = ('frequentation', 'localisation', 'osm2csv')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the converters on scaled synthetic inputs')
+    parser.add_argument('-s', '--scale', type=int, action='append', help='scale of the inputs (repeatable, default: 10)')
+    parser.add_argument('-c', '--converter', choices=CONVERTERS, action='append', help='converter to run (repeatable, default: all)')
+    parser.add_argument('-o', '--output', type=str, default='bench-results.json', help='json results filename')
+    parser.add_argument('-d', '--data-dir', type=str, default=None, help='keep the generated inputs and outputs in this directory')
+    parser.add_argument('-l', '--latency', type=float, default=5.0, help='latency of the fake nominatim, in milliseconds')
+    parser.add_argument('-e', '--error-rate', type=float, default=0.0, help='ratio of fake nominatim requests answered with a 503')
+    parser.add_argument('-m', '--miss-rate', type=float, default=0.1, help='ratio of fake nominatim searches without any result')
+    parser.add_argument('-w', '--workers', type=int, default=8, help='number of geocoding requests in flight')
+    parser.add_argument('--retries', type=int, default=3, help='number of retries on errors')
+    return parser.parse_args()
+
+def command(converter, input_file, work_dir, nominatim, args):
+    output = os.path.join(work_dir, converter + '-output')
+    common = ['--quiet', '--report', os.path.join(work_dir, converter + '-report.json')]
+    geocoding = ['--cache', os.path.join(work_dir, converter + '-cache.sqlite'), '--nominatim', nominatim,
+                 '--workers', str(args.workers), '--rate', '0', '--retries', str(args.retries)]
+    if converter == 'frequentation':
+        return [sys.executable, os.path.join(ROOT, 'frequentation', 'frequentation-musees.py'), '--input', input_file, '--output-dir', output] + common
+    if converter == 'localisation':
+        return [sys.executable, os.path.join(ROOT, 'localisation', 'localisation-musees.py'), '--input', input_file, '--output', output + '.csv'] + geocoding + common
+    return [sys.executable, os.path.join(ROOT, 'osm', 'osm2csv.py'), '--input', input_file, '--output', output + '.csv', '--stream'] + geocoding + common
+
+def measure(cmd, log_file):
+    # Wall time, exit code and peak RSS (in MB) of the converter process
+    start = time.perf_counter()
+    with open(log_file, 'w') as log:
+        proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in kilobytes on linux, in bytes on macos
+    peak_rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return elapsed, proc.returncode, peak_rss
+
+def run(converter, scale, input_file, rows, work_dir, stub, args):
+    for name in ('-cache.sqlite', '-report.json', '-output.csv', '-output.csv.part', '-output.csv.journal'):
+        if os.path.exists(os.path.join(work_dir, converter + name)):
+            os.remove(os.path.join(work_dir, converter + name))
+    stub.reset()
+    cmd = command(converter, input_file, work_dir, stub.url, args)
+    log_file = os.path.join(work_dir, converter + '.log')
+    elapsed, returncode, peak_rss = measure(cmd, log_file)
+    with stub.lock:
+        requests = dict(stub.stats)
+
+    result = {
+        'converter': converter,
+        'scale': scale,
+        'input_rows': rows,
+        'input_mb': round(os.path.getsize(input_file) / 1e6, 3),
+        'returncode': returncode,
+        'elapsed_s': round(elapsed, 3),
+        'rows_per_sec': round(rows / elapsed, 1) if elapsed > 0 else 0.0,
+        'peak_rss_mb': round(peak_rss, 1),
+        'requests': requests,
+    }
+    report_file = os.path.join(work_dir, converter + '-report.json')
+    if os.path.isfile(report_file):
+        with open(report_file) as report:
+            result['report'] = json.load(report)
+    if returncode != 0:
+        with open(log_file) as log:
+            result['error'] = log.read()[-2000:]
+    return result
+
+def main():
+    args = parse_args()
+    scales = args.scale or [10]
+    converters = args.converter or list(CONVERTERS)
+
+    stub = NominatimStub(('127.0.0.1', 0), args.latency, args.error_rate, args.miss_rate)
+    stub.start()
+    work_dir = args.data_dir or tempfile.mkdtemp(prefix='fruseum-bench-')
+    os.makedirs(work_dir, exist_ok=True)
+
+    results = {
+        'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'settings': {'latency_ms': args.latency, 'error_rate': args.error_rate, 'miss_rate': args.miss_rate,
+                     'workers': args.workers, 'retries': args.retries},
+        'runs': [],
+    }
+    try:
+        for scale in scales:
+            print('generating the x{} inputs...'.format(scale))
+            inputs, rows = generate(work_dir, scale)
+            for converter in converters:
+                result = run(converter, scale, inputs[converter], rows[converter], work_dir, stub, args)
+                results['runs'].append(result)
+                print('{} x{}: {} rows in {}s ({} rows/sec), peak rss {} MB, {} search and {} lookup requests{}'.format(
+                    converter, scale, rows[converter], result['elapsed_s'], result['rows_per_sec'], result['peak_rss_mb'],
+                    result['requests']['search'], result['requests']['lookup'],
+                    '' if result['returncode'] == 0 else ', FAILED (exit code {})'.format(result['returncode'])))
+    finally:
+        stub.shutdown()
+        if not args.data_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    tmp_file = args.output + '.tmp'
+    with open(tmp_file, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    os.replace(tmp_file, args.output)
+    print('results saved to {}'.format(args.output))
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,16 @@
 #!/usr/bin/env python3
 import argparse
+import os
 import os.path
+import sys
 import csv
-import json
-import geopy
-from datetime import datetime
-from geopy.geocoders import Nominatim
-from geopy.extra.rate_limiter import RateLimiter
-##import reverse_geocode
+import time
+from collections import OrderedDict
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fruseum import metrics as instrumentation
+from fruseum.writers import FORMATS, RowWriter, has_footer, row_type
+
+metrics = instrumentation.Metrics('frequentation')
 
 class bcolors:
     HEADER = '\033[95m'
@@ -24,42 +27,127 @@ def parse_args():
     parser = argparse.ArgumentParser(description='Convert messy frequentation-des-musees-de-france csv files to structured by year files')
     parser.add_argument('-i', '--input', type=str, required=True, help='input messy csv filename')
     parser.add_argument('-y', '--year', type=str, required=False, help='extract data for ths given year (format: xxxx)')
+    parser.add_argument('-d', '--output-dir', type=str, default='./data', help='output directory for the by year files')
+    parser.add_argument('-s', '--store', type=str, required=False, help='also export a typed columnar store (numpy) to this directory')
+    parser.add_argument('-m', '--max-open', type=int, default=32, help='maximum number of by year files kept open at once')
+    parser.add_argument('-f', '--format', type=str, choices=FORMATS, default='csv', help='format of the by year files')
+    instrumentation.add_arguments(parser)
     parser.add_argument('-v', '--version', action='version', version='1.0')
     return parser.parse_args()
 
+# Output row, one slot per field instead of a dict per row (see fruseum/writers.py)
+Entry = row_type([
+    "id",
+    "osm_id",
+    "name",
+    #"number",
+    #"street",
+    #"postal_code",
+    "city",
+    "country",
+    "country_code",
+    "status",
+    #"lat",
+    #"lon",
+    #"website",
+    #"phone",
+    #"fax",
+    #"email",
+    "year",
+    "stats",
+    "tags",
+    #"description",
+    #"wikidata",
+    #"museofile",
+    #"mhs",
+])
+
 def create_entry():
-    return {
-        "id": None,
-        "osm_id": None,
-        "name": None,
-        #"number": None,
-        #"street": None,
-        #"postal_code": None,
-        "city": None,
-        "country": None,
-        "country_code": None,
-        "status": None,
-        #"lat": None,
-        #"lon": None,
-        #"website": None,
-        #"phone": None,
-        #"fax": None,
-        #"email": None,
-        "year": None,
-        "stats": None,
-        "tags": None,
-        #"description": None,
-        #"wikidata": None,
-        #"museofile": None,
-        #"mhs": None,
-    }
+    return Entry()
+
+class YearWriterPool:
+    # Keep one buffered writer per year, at most max_open of them open at once.
+    # Rows are written into a temporary file which replaces the real output on commit,
+    # so a rerun truncates the old file instead of appending duplicates to it.
+    def __init__(self, output_dir, fieldnames, max_open=32, output_format='csv'):
+        self.output_dir = output_dir
+        self.fieldnames = fieldnames
+        self.max_open = max(1, max_open)
+        self.output_format = output_format
+        self.writers = OrderedDict()
+        # Number of rows written in each year file
+        self.started = {}
+
+    def output_file(self, year):
+        return os.path.join(self.output_dir, 'frequentation-des-musees-de-france-pour-' + year + '.' + self.output_format)
+
+    def writer(self, year):
+        if year in self.writers:
+            self.writers.move_to_end(year)
+            return self.writers[year]
+
+        if len(self.writers) >= self.max_open:
+            evicted_year, evicted = self.writers.popitem(last=False)
+            self.started[evicted_year] = evicted.rows
+            evicted.close()
+
+        # First time we see the year: create the temporary file and its header,
+        # otherwise reopen it in append mode after an eviction
+        tmp_file = self.output_file(year) + '.tmp'
+        if year in self.started:
+            writer = RowWriter(tmp_file, self.fieldnames, self.output_format, append=True, rows=self.started[year])
+        else:
+            writer = RowWriter(tmp_file, self.fieldnames, self.output_format)
+            self.started[year] = 0
+
+        self.writers[year] = writer
+        return writer
+
+    def writerow(self, year, entry):
+        self.writer(year).writerow(entry)
+
+    def close(self):
+        for year, writer in self.writers.items():
+            self.started[year] = writer.rows
+            writer.close()
+        self.writers.clear()
+
+    def commit(self):
+        self.close()
+        for year in sorted(self.started):
+            output_file = self.output_file(year)
+            if has_footer(self.output_format):
+                RowWriter(output_file + '.tmp', self.fieldnames, self.output_format, append=True, rows=self.started[year]).finish()
+            os.replace(output_file + '.tmp', output_file)
+        return sorted(self.started)
+
+    def abort(self):
+        self.close()
+        for year in self.started:
+            tmp_file = self.output_file(year) + '.tmp'
+            if os.path.isfile(tmp_file):
+                os.remove(tmp_file)
 
 def main():
     args = parse_args()
 
     fieldnames = ['id', 'osm_id', 'name', 'city', 'country', 'country_code', 'status', 'year', 'stats', 'tags']
 
+    os.makedirs(args.output_dir, exist_ok=True)
+    pool = YearWriterPool(args.output_dir, fieldnames, args.max_open, args.format)
+    store = None
+    if args.store:
+        # numpy is only needed for the columnar export
+        from fruseum.attendance import AttendanceStoreWriter
+        store = AttendanceStoreWriter()
+    time_start = time.perf_counter()
+
     with open(args.input, newline='') as csv_inputfile:
+        # Count the lines for the progress line, without parsing them
+        total = sum(1 for _ in csv_inputfile) - 1
+        csv_inputfile.seek(0)
+        metrics.configure(instrumentation.level(args), total=max(0, total), report=args.report)
+
         # Setup counters (data,skipped and total)
         rows_total = 0
         rows_data = 0
@@ -69,69 +157,75 @@ def main():
         csv_reader = csv.reader(csv_inputfile, delimiter=';', quotechar='|')
         headers = next(csv_reader, None)
 
-        # Initiate entry
-        entry = create_entry()
-
-        for row in csv_reader:
-            rows_total += 1
-            print(f"{bcolors.OKGREEN}Row #", rows_total, f": analyzing data...{bcolors.ENDC}")
+        try:
+            for row in csv_reader:
+                rows_total += 1
 
-            # Extract only frequentation for this year
-            if args.year and (row[4] != args.year):
+                # Extract only frequentation for this year
+                if args.year and (row[4] != args.year):
                     rows_skipped += 1
-                    print(f"{bcolors.FAIL}Row #", rows_total, f": skipped for unmatched year.{bcolors.ENDC}")
+                    metrics.row()
                     continue
 
-            # If row not skipped, let's go!
-            print(f"{bcolors.OKCYAN}Row data:", row, f"{bcolors.ENDC}")
-
-            entry['year'] = row[4]
-            entry['id'] = row[0]
-            entry['name'] = row[1]
-            entry['city'] = row[3]
-            entry['country'] = 'France'
-            entry['country_code'] = 'fr'
-
-            if row[10] == 'F':
-                entry['status'] = 'closed'
-            else:
-                entry['status'] = 'open'
-
-            if row[10] == 'R':
-                entry['tags'] = 'unlabel:musee de france'
-            else:
-                entry['tags'] = 'label:musee de france'
-
-            if row[7]:
-                entry['stats'] = 'payant:' + row[7]
-            else:
-                entry['stats'] = 'payant:0'
-
-            if row[8]:
-                entry['stats'] = entry['stats'] + ';' + 'gratuit:' + row[8]
-            else:
-                entry['stats'] = entry['stats'] + ';' + 'gratuit:0'
-
-            entry['stats'] = entry['stats'] + ';' + 'total:' + row[9]
-
-            if row[6]:
-                entry['stats'] = entry['stats'] + ';' + 'mdf-date:' + row[6]
-
-            output_file = './data/frequentation-des-musees-de-france-pour-' + row[4] + '.csv'
-            if os.path.isfile(output_file):
-                with open(output_file, 'a+', newline='') as csv_outputfile:
-                    csv_writer = csv.DictWriter(csv_outputfile, fieldnames=fieldnames)
-                    csv_writer.writerow(entry)
-            else:
-                with open(output_file, 'a+', newline='') as csv_outputfile:
-                    csv_writer = csv.DictWriter(csv_outputfile, fieldnames=fieldnames)
-                    csv_writer.writeheader()
-                    csv_writer.writerow(entry)
-
-            rows_data += 1
-            entry = create_entry()
-
-        print('Wrote {0} rows for {1}, with {2} extracted and {3} skipped.'.format(rows_total, args.year, rows_data, rows_skipped))
+                with metrics.stage('parse'):
+                    entry = create_entry()
+                    entry['year'] = row[4]
+                    entry['id'] = row[0]
+                    entry['name'] = row[1]
+                    entry['city'] = row[3]
+                    entry['country'] = 'France'
+                    entry['country_code'] = 'fr'
+
+                    if row[10] == 'F':
+                        entry['status'] = 'closed'
+                    else:
+                        entry['status'] = 'open'
+
+                    if row[10] == 'R':
+                        entry['tags'] = 'unlabel:musee de france'
+                    else:
+                        entry['tags'] = 'label:musee de france'
+
+                    if row[7]:
+                        entry['stats'] = 'payant:' + row[7]
+                    else:
+                        entry['stats'] = 'payant:0'
+
+                    if row[8]:
+                        entry['stats'] = entry['stats'] + ';' + 'gratuit:' + row[8]
+                    else:
+                        entry['stats'] = entry['stats'] + ';' + 'gratuit:0'
+
+                    entry['stats'] = entry['stats'] + ';' + 'total:' + row[9]
+
+                    if row[6]:
+                        entry['stats'] = entry['stats'] + ';' + 'mdf-date:' + row[6]
+
+                with metrics.stage('write'):
+                    pool.writerow(row[4], entry)
+                    if store is not None:
+                        store.append(row)
+                rows_data += 1
+                metrics.debug(f"{bcolors.OKCYAN}Row data: ", entry, f"{bcolors.ENDC}")
+                metrics.row()
+        except BaseException:
+            pool.abort()
+            raise
+
+        years = pool.commit()
+        if store is not None:
+            store.write(args.store)
+
+    elapsed = time.perf_counter() - time_start
+    rate = rows_total / elapsed if elapsed > 0 else 0
+    metrics.count('rows_extracted', rows_data)
+    metrics.count('rows_skipped', rows_skipped)
+    metrics.count('year_files', len(years))
+    metrics.close()
+    metrics.info(f"{bcolors.OKGREEN}Wrote", len(years), f"by year files in {args.output_dir}.{bcolors.ENDC}")
+    if store is not None:
+        metrics.info(f"{bcolors.OKGREEN}Wrote", len(store), f"rows to the columnar store {args.store}.{bcolors.ENDC}")
+    metrics.info('Read {0} rows for {1}, with {2} extracted and {3} skipped, in {4:.2f}s ({5:.0f} rows/sec).'.format(rows_total, args.year, rows_data, rows_skipped, elapsed, rate))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1 @@
+# Shared helpers for the fruseumpy converters (frequentation, localisation and osm)
@@ -0,0 +1,48 @@
+import os.path
+import runpy
+import sys
+
+# fruseum command line: python3 -m fruseum <command> [options]. Nothing is
+# imported before a command is chosen, the command's script or module being
+# then run as if it was called directly.
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+COMMANDS = {
+    'frequentation': ('frequentation/frequentation-musees.py', 'convert the frequentation csv to by year files'),
+    'localisation': ('localisation/localisation-musees.py', 'convert and geocode the Musees de France list'),
+    'osm2csv': ('osm/osm2csv.py', 'convert an osm xml or pbf extract of museums to csv'),
+    'classify': ('fruseum.classifier', 'reclassify the tags of a structured csv'),
+    'link': ('fruseum.linker', 'link the frequentation, localisation and osm files'),
+    'match': ('fruseum.matcher', 'match the osm museums with the Musees de France list'),
+    'reverse': ('fruseum.reverse', 'fill postal codes, cities and countries offline'),
+    'spatial': ('fruseum.spatial', 'build a spatial index of structured csv files'),
+    'serve': ('fruseum.server', 'serve the museum csv files as a read-only json api'),
+    'pipeline': ('fruseum.pipeline', 'run the stages whose inputs changed since the last run'),
+}
+
+def usage():
+    lines = ['usage: fruseum <command> [options]', '', 'commands:']
+    for command, (_, description) in COMMANDS.items():
+        lines.append('  {:<15} {}'.format(command, description))
+    lines.append('')
+    lines.append('Run "fruseum <command> --help" for the options of a command.')
+    return '\n'.join(lines)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return 0
+    if argv[0] not in COMMANDS:
+        print('fruseum: unknown command {!r}\n\n{}'.format(argv[0], usage()), file=sys.stderr)
+        return 2
+
+    target, _ = COMMANDS[argv[0]]
+    sys.argv = ['fruseum ' + argv[0]] + argv[1:]
+    if target.endswith('.py'):
+        runpy.run_path(os.path.join(ROOT, target), run_name='__main__')
+    else:
+        runpy.run_module(target, run_name='__main__', alter_sys=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import array
+import datetime
+import json
+import os
+import os.path
+import shutil
+import numpy as np
+
+# Columnar, typed store of the attendance of the Musées de France: one .npy
+# file per column, memory-mapped on load, and a manifest.json holding the
+# dictionaries of the dictionary-encoded columns.
+STORE_VERSION = 1
+MISSING = -1
+COUNTS = ('payant', 'gratuit', 'total')
+DICTIONARIES = ('museum', 'name', 'region', 'department', 'city', 'note')
+
+def parse_count(value):
+    value = value.strip()
+    return int(value) if value.isdigit() else MISSING
+
+def parse_date(value):
+    # dd/mm/yyyy, as days since the epoch (NaT when missing)
+    try:
+        date = datetime.datetime.strptime(value.strip(), '%d/%m/%Y').date()
+    except ValueError:
+        return np.iinfo(np.int64).min
+    return (date - datetime.date(1970, 1, 1)).days
+
+class AttendanceStoreWriter:
+    # Accumulate the rows of the national csv (ref_musee, nom_du_musee, regions,
+    # ville, annee, departements, date_appellation, payant, gratuit, total, note...)
+    # in compact arrays, then write them as a store
+    def __init__(self):
+        self.year = array.array('h')
+        self.mdf_date = array.array('q')
+        self.counts = {column: array.array('q') for column in COUNTS}
+        self.codes = {column: array.array('i') for column in DICTIONARIES}
+        self.dictionaries = {column: {} for column in DICTIONARIES}
+
+    def encode(self, column, value):
+        dictionary = self.dictionaries[column]
+        code = dictionary.get(value)
+        if code is None:
+            code = dictionary[value] = len(dictionary)
+        self.codes[column].append(code)
+
+    def append(self, row):
+        self.encode('museum', row[0])
+        self.encode('name', row[1])
+        self.encode('region', row[2])
+        self.encode('city', row[3])
+        self.year.append(int(row[4]))
+        self.encode('department', row[5])
+        self.mdf_date.append(parse_date(row[6]))
+        self.counts['payant'].append(parse_count(row[7]))
+        self.counts['gratuit'].append(parse_count(row[8]))
+        self.counts['total'].append(parse_count(row[9]))
+        self.encode('note', row[10] if len(row) > 10 else '')
+
+    def __len__(self):
+        return len(self.year)
+
+    def write(self, path):
+        # Written next to the store then swapped with it, never half written
+        tmp_path = path.rstrip('/') + '.tmp'
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+
+        columns = {
+            'year': np.frombuffer(self.year, dtype=np.int16),
+            'mdf_date': np.frombuffer(self.mdf_date, dtype=np.int64).view('datetime64[D]'),
+        }
+        for column in COUNTS:
+            columns[column] = np.frombuffer(self.counts[column], dtype=np.int64)
+        for column in DICTIONARIES:
+            columns[column] = np.frombuffer(self.codes[column], dtype=np.int32)
+
+        for column, values in columns.items():
+            np.save(os.path.join(tmp_path, column + '.npy'), values)
+
+        manifest = {
+            'version': STORE_VERSION,
+            'rows': len(self),
+            'columns': {column: str(values.dtype) for column, values in columns.items()},
+            'dictionaries': {column: list(self.dictionaries[column]) for column in DICTIONARIES},
+        }
+        with open(os.path.join(tmp_path, 'manifest.json'), 'w') as manifest_file:
+            json.dump(manifest, manifest_file, ensure_ascii=False)
+
+        if os.path.isdir(path):
+            old_path = path.rstrip('/') + '.old'
+            os.replace(path, old_path)
+            os.replace(tmp_path, path)
+            shutil.rmtree(old_path)
+        else:
+            os.replace(tmp_path, path)
+
+class AttendanceStore:
+    # Columns are numpy arrays (memory-mapped by default), dictionary-encoded
+    # columns being int32 codes into self.dictionaries[column]
+    def __init__(self, path, mmap=True):
+        with open(os.path.join(path, 'manifest.json')) as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest['version'] != STORE_VERSION:
+            raise ValueError('unsupported attendance store version: {}'.format(manifest['version']))
+
+        self.path = path
+        self.rows = manifest['rows']
+        self.dictionaries = manifest['dictionaries']
+        self.columns = {}
+        for column in manifest['columns']:
+            self.columns[column] = np.load(os.path.join(path, column + '.npy'), mmap_mode='r' if mmap else None)
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def decode(self, column, codes):
+        dictionary = self.dictionaries[column]
+        if np.isscalar(codes):
+            return dictionary[codes]
+        return [dictionary[code] for code in codes]
+
+    def code(self, column, value):
+        # Code of a value in a dictionary-encoded column, -1 if unknown
+        try:
+            return self.dictionaries[column].index(value)
+        except ValueError:
+            return -1
+
+def load_store(path, mmap=True):
+    return AttendanceStore(path, mmap=mmap)
@@ -0,0 +1,110 @@
+import json
+import os
+import os.path
+import sqlite3
+import threading
+import time
+import unicodedata
+
+DEFAULT_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'geocache.sqlite')
+
+def normalize_query(query):
+    # Same query, same key: no accents, no case, single spaces
+    query = unicodedata.normalize('NFKD', query)
+    query = ''.join(c for c in query if not unicodedata.combining(c))
+    return ' '.join(query.casefold().split())
+
+class GeoCache:
+    # SQLite backed cache of geocoding results, shared by the converters.
+    # Values are stored as json, None being a cached "no match".
+    # Entries older than ttl seconds are ignored and the least recently used
+    # entries are evicted beyond max_entries. It can be shared by several threads
+    # and processes: a hit does not write, its access time is kept aside and
+    # written with the next set, eviction or close, so no write transaction
+    # stays open between them.
+    def __init__(self, filename=DEFAULT_CACHE, ttl=None, max_entries=None):
+        self.filename = filename
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.accessed = {}
+
+        directory = os.path.dirname(os.path.abspath(filename))
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS cache (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL,
+            PRIMARY KEY (namespace, key))''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+        self.db.commit()
+
+    def expired(self, created):
+        return self.ttl is not None and created + self.ttl < time.time()
+
+    def get(self, namespace, key):
+        # Return (found, value), value may be None for a cached "no match"
+        with self.lock:
+            row = self.db.execute('SELECT value, created FROM cache WHERE namespace = ? AND key = ?', (namespace, key)).fetchone()
+            if row is None or self.expired(row[1]):
+                self.misses += 1
+                return False, None
+
+            self.hits += 1
+            self.accessed[namespace, key] = time.time()
+        if row[0] is None:
+            return True, None
+        return True, json.loads(row[0])
+
+    def flush_accessed(self):
+        # Access times of the hits since the last write, in the current transaction
+        if self.accessed:
+            self.db.executemany('UPDATE cache SET accessed = ? WHERE namespace = ? AND key = ?',
+                                [(accessed, namespace, key) for (namespace, key), accessed in self.accessed.items()])
+            self.accessed = {}
+
+    def set(self, namespace, key, value):
+        now = time.time()
+        value = None if value is None else json.dumps(value)
+        with self.lock:
+            self.flush_accessed()
+            self.db.execute('INSERT OR REPLACE INTO cache (namespace, key, value, created, accessed) VALUES (?, ?, ?, ?, ?)',
+                            (namespace, key, value, now, now))
+            self.writes += 1
+            if self.max_entries is not None and self.writes % 100 == 0:
+                self.evict()
+            self.db.commit()
+
+    def delete(self, namespace, key):
+        # Forget an entry known to be stale
+        with self.lock:
+            self.db.execute('DELETE FROM cache WHERE namespace = ? AND key = ?', (namespace, key))
+            self.db.commit()
+
+    def evict(self):
+        with self.lock:
+            self.flush_accessed()
+            if self.ttl is not None:
+                self.db.execute('DELETE FROM cache WHERE created < ?', (time.time() - self.ttl,))
+            if self.max_entries is not None:
+                self.db.execute('''DELETE FROM cache WHERE rowid IN (
+                    SELECT rowid FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)''', (self.max_entries,))
+            self.db.commit()
+
+    def close(self):
+        self.evict()
+        with self.lock:
+            self.db.close()
+
+    def summary(self):
+        total = self.hits + self.misses
+        ratio = 100.0 * self.hits / total if total else 0.0
+        return 'cache: {} hits, {} misses ({:.1f}% hit ratio)'.format(self.hits, self.misses, ratio)
@@ -0,0 +1,107 @@
+import json
+import os
+import os.path
+from fruseum.writers import BatchEncoder
+
+class CheckpointedOutput:
+    # Output committed by batches to output + '.part', each commit being
+    # fsynced and recorded in a journal (output + '.journal') with the last
+    # committed input offset, the committed size and the ids written since
+    # the previous commit, one json line per commit.
+    # On resume, anything written after the last commit is truncated, so
+    # partial rows never appear, and the ids of the journal can be skipped.
+    # The output itself is only replaced by close, once every row is written,
+    # so an interrupted run never truncates the previous one.
+    # Any format of fruseum/writers.py works, compressed batches being
+    # independent gzip members or zstd frames and the GeoJSON footer being
+    # written after the last commit only.
+    def __init__(self, output, fieldnames, resume=False, batch_size=50, output_format='csv'):
+        self.output = output
+        self.part = output + '.part'
+        self.journal = output + '.journal'
+        self.fieldnames = fieldnames
+        self.encoder = BatchEncoder(fieldnames, output_format)
+        self.batch_size = max(1, batch_size)
+        self.buffer = []
+        self.pending_ids = []
+        self.offset = 0
+        self.ids = set()
+        self.rows = 0
+        self.resumed = False
+
+        state = self.load() if resume else None
+        if state is not None and os.path.isfile(self.part):
+            self.offset = state['offset']
+            self.ids = state['ids']
+            self.rows = state.get('rows', len(self.ids))
+            self.file = open(self.part, 'r+b')
+            self.file.truncate(state['size'])
+            self.file.seek(state['size'])
+            # A line torn by the interruption is dropped before appending
+            self.journal_file = open(self.journal, 'r+b')
+            self.journal_file.truncate(state['end'])
+            self.journal_file.seek(state['end'])
+            self.resumed = True
+        else:
+            self.file = open(self.part, 'wb')
+            self.file.write(self.encoder.header())
+            self.journal_file = open(self.journal, 'wb')
+            self.commit()
+
+    def load(self):
+        # State of the last complete journal line, with the ids of every line
+        if not os.path.isfile(self.journal):
+            return None
+        state = None
+        ids = set()
+        end = 0
+        with open(self.journal, 'rb') as journal_file:
+            for line in journal_file:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    state = json.loads(line)
+                except ValueError:
+                    break
+                ids.update(state['ids'])
+                end += len(line)
+        if state is not None:
+            state['ids'] = ids
+            state['end'] = end
+        return state
+
+    def done(self, key):
+        return key in self.ids
+
+    def writerow(self, key, entry, offset):
+        self.buffer.append(entry)
+        self.pending_ids.append(key)
+        self.offset = offset
+        if len(self.buffer) >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        if self.buffer:
+            self.file.write(self.encoder.rows(self.buffer, self.rows == 0))
+            self.rows += len(self.buffer)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+        # The commit is journaled only once its rows are on disk, with the new ids only
+        state = {'offset': self.offset, 'size': self.file.tell(), 'rows': self.rows, 'ids': self.pending_ids}
+        self.journal_file.write(json.dumps(state).encode('utf-8') + b'\n')
+        self.journal_file.flush()
+        os.fsync(self.journal_file.fileno())
+        self.ids.update(self.pending_ids)
+        self.buffer = []
+        self.pending_ids = []
+
+    def close(self):
+        self.commit()
+        self.file.write(self.encoder.footer())
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        self.journal_file.close()
+        os.replace(self.part, self.output)
+        os.remove(self.journal)
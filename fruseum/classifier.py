@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import re
+import unidecode
+
+# Keyword found in the (unidecoded, casefolded) museum name, tags given to the
+# museum and priority: when several keywords are found, the lowest priority wins.
+RULES = [
+    ('archeologique', "type:musee archeologique;art:prehistoire", 1),
+    ('antique', "type:musee archeologique;art:antiquite", 2),
+    ('arts decoratifs', "type:musee d'arts decoratifs", 3),
+    ('agricole', "type:musee technique et industriel", 4),
+    ('outil', "type:musee technique et industriel", 5),
+    ('ouvrier', "type:musee d'arts populaires", 6),
+    ('populaire', "type:musee d'arts populaires", 7),
+    ('prehistoire', "type:musee archeologique;art:prehistoire", 8),
+    ('atelier', "type:atelier d'artiste", 9),
+    ('beaux-arts', "type:musee de beaux-arts", 10),
+    ('ecomusee', "type:ecomusee", 11),
+    ('geologie', "type:musee d'histoire naturelle", 12),
+    ('industrie', "type:musee technique et industriel", 13),
+    ('technique', "type:musee technique et industriel", 14),
+    ('histoire', "type:musee historique", 15),
+    ('historique', "type:musee historique", 16),
+    ('museum', "type:museum", 17),
+    ('musee', "type:musee", 18),
+]
+UNCLASSIFIED = 'type:a classer'
+
+def normalize_name(name):
+    return unidecode.unidecode(name).casefold()
+
+class Classifier:
+    # All the keywords are matched in a single pass over the name: the pattern
+    # is a lookahead tried at each position, alternatives being sorted by
+    # priority so that overlapping keywords (prehistoire, histoire) are all seen
+    def __init__(self, rules=RULES, default=UNCLASSIFIED):
+        self.rules = {}
+        for keyword, tags, priority in rules:
+            self.rules[keyword] = (priority, tags)
+        self.default = default
+        keywords = sorted(self.rules, key=lambda keyword: (self.rules[keyword][0], keyword))
+        self.pattern = re.compile('(?=(' + '|'.join(re.escape(keyword) for keyword in keywords) + '))')
+        self.memo = {}
+
+    def classify(self, name):
+        # Tags for a museum name, default tags if no keyword is found
+        if not name:
+            return self.default
+        name = normalize_name(name)
+        if name in self.memo:
+            return self.memo[name]
+
+        best = None
+        for match in self.pattern.finditer(name):
+            rule = self.rules[match.group(1)]
+            if best is None or rule[0] < best[0]:
+                best = rule
+        tags = best[1] if best is not None else self.default
+        self.memo[name] = tags
+        return tags
+
+    def classify_all(self, names):
+        # Tags for a whole column of names, each distinct name classified once
+        return [self.classify(name) for name in names]
+
+_classifier = None
+
+def classify(name):
+    global _classifier
+    if _classifier is None:
+        _classifier = Classifier()
+    return _classifier.classify(name)
+
+def classify_all(names):
+    global _classifier
+    if _classifier is None:
+        _classifier = Classifier()
+    return _classifier.classify_all(names)
+
+def retag(tags, classified):
+    # Replace the type: and art: tags, keep the other ones (label:, osm:...)
+    kept = [tag for tag in (tags or '').split(';') if tag and not tag.startswith(('type:', 'art:'))]
+    return ';'.join(kept + [classified])
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Reclassify the museums of a structured csv file with the rules table')
+    parser.add_argument('-i', '--input', type=str, required=True, help='input structured csv filename')
+    parser.add_argument('-o', '--output', type=str, required=True, help='output structured csv filename')
+    parser.add_argument('-v', '--version', action='version', version='1.0')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    with open(args.input, newline='', encoding='utf-8-sig') as csv_inputfile:
+        csv_reader = csv.DictReader(csv_inputfile)
+        fieldnames = csv_reader.fieldnames
+        rows = list(csv_reader)
+
+    classified = classify_all([row['name'] for row in rows])
+    for row, tags in zip(rows, classified):
+        row['tags'] = retag(row['tags'], tags)
+
+    with open(args.output, 'w', newline='', encoding='utf-8') as csv_outputfile:
+        csv_writer = csv.DictWriter(csv_outputfile, fieldnames=fieldnames)
+        csv_writer.writeheader()
+        csv_writer.writerows(rows)
+
+    print('reclassified {} rows to {}'.format(len(rows), args.output))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+import csv
+import numpy as np
+from fruseum.attendance import COUNTS, MISSING, parse_count
+
+# Attendance of the Musées de France as dense museum x year matrices (one per
+# measure, NaN when a museum has no figure for a year) with precomputed
+# roll-ups per region and department. Queries are array operations.
+LEVELS = ('museum', 'region', 'department')
+
+class AttendanceCube:
+    def __init__(self):
+        self.museums = []
+        self.names = []
+        self.museum_index = {}
+        self.regions = []
+        self.departments = []
+        self.region_index = {}
+        self.department_index = {}
+        self.years = np.zeros(0, dtype=np.int64)
+        self.measures = {measure: np.zeros((0, 0)) for measure in COUNTS}
+        self.rollups = {level: {measure: np.zeros((0, 0)) for measure in COUNTS} for level in ('region', 'department')}
+
+    @classmethod
+    def from_csv(cls, filename):
+        # From the national frequentation-des-musees-de-france.csv
+        with open(filename, newline='') as csv_inputfile:
+            csv_reader = csv.reader(csv_inputfile, delimiter=';', quotechar='|')
+            next(csv_reader, None)
+            cube = cls()
+            cube.append(csv_reader)
+        return cube
+
+    @classmethod
+    def from_store(cls, store):
+        # From a columnar store (see fruseum/attendance.py), without any text parsing
+        cube = cls()
+        cube.append_arrays(
+            store.dictionaries['museum'],
+            store.dictionaries['name'],
+            store.dictionaries['region'],
+            store.dictionaries['department'],
+            np.asarray(store['museum']), np.asarray(store['name']),
+            np.asarray(store['region']), np.asarray(store['department']),
+            np.asarray(store['year'], dtype=np.int64),
+            {measure: np.asarray(store[measure]) for measure in COUNTS})
+        return cube
+
+    def append(self, rows):
+        # Add the csv rows of new years, the years already in the cube are refused
+        museums, names, regions, departments = {}, {}, {}, {}
+        codes = {'museum': [], 'name': [], 'region': [], 'department': []}
+        years = []
+        counts = {measure: [] for measure in COUNTS}
+        for row in rows:
+            for column, dictionary, value in (('museum', museums, row[0]), ('name', names, row[1]),
+                                              ('region', regions, row[2]), ('department', departments, row[5])):
+                codes[column].append(dictionary.setdefault(value, len(dictionary)))
+            years.append(int(row[4]))
+            counts['payant'].append(parse_count(row[7]))
+            counts['gratuit'].append(parse_count(row[8]))
+            counts['total'].append(parse_count(row[9]))
+
+        self.append_arrays(list(museums), list(names), list(regions), list(departments),
+                           np.array(codes['museum'], dtype=np.int32), np.array(codes['name'], dtype=np.int32),
+                           np.array(codes['region'], dtype=np.int32), np.array(codes['department'], dtype=np.int32),
+                           np.array(years, dtype=np.int64),
+                           {measure: np.array(values, dtype=np.int64) for measure, values in counts.items()})
+
+    def append_arrays(self, museums, names, regions, departments, museum, name, region, department, year, counts):
+        # Rows given as dictionary codes: only the new years and museums are added,
+        # the existing matrices are extended, never rebuilt
+        if len(year) == 0:
+            return
+        new_years = np.unique(year)
+        clash = np.intersect1d(new_years, self.years)
+        if len(clash):
+            raise ValueError('years already in the cube: {}'.format(', '.join(str(y) for y in clash)))
+
+        # Translate the local codes into the cube indexes, adding the new museums,
+        # regions and departments
+        region_map = np.array([self.region_index.setdefault(value, len(self.region_index)) for value in regions], dtype=np.int32)
+        department_map = np.array([self.department_index.setdefault(value, len(self.department_index)) for value in departments], dtype=np.int32)
+        self.regions = list(self.region_index)
+        self.departments = list(self.department_index)
+
+        museum_count = len(self.museums)
+        first_row = {}
+        for index in range(len(museum)):
+            first_row.setdefault(museum[index], index)
+        museum_map = np.zeros(len(museums), dtype=np.int64)
+        for code, value in enumerate(museums):
+            if value not in self.museum_index:
+                self.museum_index[value] = len(self.museums)
+                self.museums.append(value)
+                self.names.append(names[name[first_row.get(code, 0)]])
+            museum_map[code] = self.museum_index[value]
+
+        # Extend the matrices with NaN rows (new museums) and columns (new years)
+        added_museums = len(self.museums) - museum_count
+        year_count = len(self.years)
+        self.years = np.concatenate([self.years, new_years])
+        order = np.argsort(self.years, kind='stable')
+        for measure in COUNTS:
+            self.measures[measure] = np.pad(self.measures[measure], ((0, added_museums), (0, len(new_years))), constant_values=np.nan)
+
+        rows = museum_map[museum]
+        columns = year_count + np.searchsorted(new_years, year)
+        for measure in COUNTS:
+            values = counts[measure]
+            present = values != MISSING
+            matrix = self.measures[measure]
+            block = np.zeros((len(self.museums), len(new_years)))
+            seen = np.zeros((len(self.museums), len(new_years)), dtype=bool)
+            np.add.at(block, (rows[present], columns[present] - year_count), values[present])
+            seen[rows[present], columns[present] - year_count] = True
+            matrix[:, year_count:] = np.where(seen, block, np.nan)
+
+        # Roll-ups: only the new columns are computed, each row counting for its
+        # own region and department of the year (museums moved to the new
+        # regions of the 2016 reform)
+        for level, keys, count in (('region', region_map[region], len(self.regions)), ('department', department_map[department], len(self.departments))):
+            for measure in COUNTS:
+                values = counts[measure]
+                present = values != MISSING
+                rollup = self.rollups[level][measure]
+                rollup = np.pad(rollup, ((0, count - rollup.shape[0]), (0, len(new_years))))
+                block = np.zeros((count, len(new_years)))
+                np.add.at(block, (keys[present], columns[present] - year_count), values[present])
+                rollup[:, year_count:] = block
+                self.rollups[level][measure] = rollup
+
+        # Keep the years sorted
+        if not np.array_equal(order, np.arange(len(self.years))):
+            self.years = self.years[order]
+            for measure in COUNTS:
+                self.measures[measure] = self.measures[measure][:, order]
+                for level in self.rollups:
+                    self.rollups[level][measure] = self.rollups[level][measure][:, order]
+
+    def year_column(self, year):
+        column = np.searchsorted(self.years, year)
+        if column >= len(self.years) or self.years[column] != year:
+            raise KeyError('year not in the cube: {}'.format(year))
+        return column
+
+    def matrix(self, measure='total', level='museum'):
+        if level == 'museum':
+            return self.measures[measure]
+        return self.rollups[level][measure]
+
+    def labels(self, level='museum'):
+        return {'museum': self.museums, 'region': self.regions, 'department': self.departments}[level]
+
+    def top(self, year, n=10, measure='total', level='museum'):
+        # The n museums (regions, departments) with the most visitors in the year
+        values = self.matrix(measure, level)[:, self.year_column(year)]
+        values = np.where(np.isnan(values), -np.inf, values)
+        n = min(n, len(values))
+        best = np.argpartition(-values, n - 1)[:n] if n else np.zeros(0, dtype=np.int64)
+        best = best[np.argsort(-values[best], kind='stable')]
+        labels = self.labels(level)
+        return [(labels[index], float(values[index])) for index in best if values[index] != -np.inf]
+
+    def growth(self, measure='total', level='museum'):
+        # Year over year growth ratio (museums x years-1), NaN when either year is
+        # missing or the previous year has no visitor
+        matrix = self.matrix(measure, level)
+        previous, current = matrix[:, :-1], matrix[:, 1:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(previous > 0, current / previous - 1, np.nan)
+
+    def top_growth(self, year, n=10, measure='total', level='museum'):
+        column = self.year_column(year)
+        if column == 0:
+            return []
+        values = self.growth(measure, level)[:, column - 1]
+        order = np.argsort(np.where(np.isnan(values), np.inf, -values), kind='stable')[:n]
+        labels = self.labels(level)
+        return [(labels[index], float(values[index])) for index in order if not np.isnan(values[index])]
+
+    def free_share(self, level='museum'):
+        # Share of free entrances (gratuit / (payant + gratuit)), NaN when unknown
+        payant = self.matrix('payant', level)
+        gratuit = self.matrix('gratuit', level)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return gratuit / (payant + gratuit)
+
+    def missing(self, measure='total'):
+        # Boolean museums x years matrix of the missing figures
+        return np.isnan(self.measures[measure])
+
+    def missing_years(self, measure='total'):
+        # {museum: [years]} for the museums with at least one missing year
+        mask = self.missing(measure)
+        museums, columns = np.nonzero(mask)
+        result = {}
+        for museum, column in zip(museums, columns):
+            result.setdefault(self.museums[museum], []).append(int(self.years[column]))
+        return result
+
+    def history(self, museum, measure='total'):
+        # {year: visitors} of one museum
+        values = self.measures[measure][self.museum_index[museum]]
+        return {int(year): float(value) for year, value in zip(self.years, values) if not np.isnan(value)}
@@ -0,0 +1,133 @@
+import collections
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+class RetryableError(Exception):
+    # Raised by a request that may succeed later (HTTP 429, 503...),
+    # retry_after being the delay asked by the server, if any
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    # Global requests per second limit, shared by all the workers
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(burst))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class Task:
+    # An item of GeocodingEngine.map, with its result once done
+    __slots__ = ('item', 'attempt', 'done', 'result')
+
+    def __init__(self, item):
+        self.item = item
+        self.attempt = 0
+        self.done = False
+        self.result = None
+
+class GeocodingEngine:
+    # Run geocoding calls on a bounded thread pool under a token bucket,
+    # retrying with exponential backoff, results being yielded in input order
+    def __init__(self, workers=4, rate=1.0, burst=1, retries=3, backoff=1.0, retry_on=(TimeoutError, ConnectionError), window=None):
+        self.workers = max(1, workers)
+        self.bucket = TokenBucket(rate, burst)
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_on = (RetryableError,) + tuple(retry_on)
+        # Items waiting to be yielded in order, far more than the calls in
+        # flight so that an item waiting for its retry does not stall the others
+        self.window = window or max(1024, 128 * self.workers)
+        self.requests = 0
+        self.retried = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+
+    def limit(self):
+        # To be called right before each network request
+        self.bucket.acquire()
+        with self.lock:
+            self.requests += 1
+
+    def delay(self, attempt, error):
+        delay = self.backoff * (2 ** attempt) * (1 + random.random() / 10)
+        if isinstance(error, RetryableError) and error.retry_after:
+            delay = max(delay, error.retry_after)
+        return delay
+
+    def map(self, func, items):
+        # Yield (item, result) pairs in the order of items, keeping at most
+        # twice the number of workers in flight so that inputs are streamed.
+        # A failed call is not retried by its worker but scheduled again after
+        # its backoff, the next items going on meanwhile up to the window.
+        items = iter(items)
+        tasks = collections.deque()
+        running = {}
+        scheduled = []
+        sequence = itertools.count()
+        exhausted = False
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                now = time.monotonic()
+                while scheduled and scheduled[0][0] <= now and len(running) < 2 * self.workers:
+                    task = heapq.heappop(scheduled)[2]
+                    running[executor.submit(func, task.item)] = task
+                while not exhausted and len(running) < 2 * self.workers and len(tasks) < self.window:
+                    try:
+                        task = Task(next(items))
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    tasks.append(task)
+                    running[executor.submit(func, task.item)] = task
+
+                if tasks and tasks[0].done:
+                    task = tasks.popleft()
+                    yield task.item, task.result
+                    continue
+                if not tasks:
+                    return
+
+                # Wait for a call to end or for the next retry to be due
+                timeout = max(0.0, scheduled[0][0] - now) if scheduled else None
+                if not running:
+                    time.sleep(timeout)
+                    continue
+                done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    try:
+                        task.result = future.result()
+                        task.done = True
+                    except self.retry_on as e:
+                        if task.attempt >= self.retries:
+                            with self.lock:
+                                self.failed += 1
+                            raise
+                        with self.lock:
+                            self.retried += 1
+                        heapq.heappush(scheduled, (time.monotonic() + self.delay(task.attempt, e), next(sequence), task))
+                        task.attempt += 1
+
+    def summary(self):
+        return 'geocoding: {} requests, {} retried, {} failed'.format(self.requests, self.retried, self.failed)
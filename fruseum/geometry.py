@@ -0,0 +1,148 @@
+import array
+import bisect
+
+# Local geometry of osm elements: node coordinates are kept in a compact,
+# array-backed id -> (lat, lon) map (16 bytes per node) and way and
+# multipolygon relation centroids are computed from it, without any lookup.
+SCALE = 10000000
+
+class NodeIndex:
+    def __init__(self):
+        self.ids = array.array('q')
+        self.lats = array.array('i')
+        self.lons = array.array('i')
+        self.sorted = True
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, node_id, lat, lon):
+        node_id = int(node_id)
+        if self.ids and node_id <= self.ids[-1]:
+            self.sorted = False
+        self.ids.append(node_id)
+        self.lats.append(int(round(float(lat) * SCALE)))
+        self.lons.append(int(round(float(lon) * SCALE)))
+
+    def sort(self):
+        # Called once after the last add: osm files are sorted by id, this
+        # only reorders unsorted inputs
+        if self.sorted:
+            return
+        order = sorted(range(len(self.ids)), key=self.ids.__getitem__)
+        self.ids = array.array('q', (self.ids[i] for i in order))
+        self.lats = array.array('i', (self.lats[i] for i in order))
+        self.lons = array.array('i', (self.lons[i] for i in order))
+        self.sorted = True
+
+    def get(self, node_id):
+        # (lat, lon) of a node, None if unknown
+        if not self.sorted:
+            raise ValueError('node index not sorted, sort() must be called after the last add')
+        node_id = int(node_id)
+        position = bisect.bisect_left(self.ids, node_id)
+        if position == len(self.ids) or self.ids[position] != node_id:
+            return None
+        return self.lats[position] / SCALE, self.lons[position] / SCALE
+
+def format_coordinate(value):
+    # Latitude or longitude as written in the outputs, with the 7 decimals of
+    # osm coordinates, whether it comes from a pbf, an xml attribute or a centroid
+    return '{:.7f}'.format(float(value))
+
+def coordinates(refs, nodes):
+    points = []
+    for ref in refs:
+        point = nodes.get(ref)
+        if point is not None:
+            points.append(point)
+    return points
+
+def ring_centroid(points):
+    # (area, lat, lon) of a closed ring, planar shoelace formula in degrees
+    # (fine at the scale of a building or a park), None if degenerate
+    if len(points) < 4 or points[0] != points[-1]:
+        return None
+    area = 0.0
+    lat_sum = 0.0
+    lon_sum = 0.0
+    lat0, lon0 = points[0]
+    for (lat1, lon1), (lat2, lon2) in zip(points, points[1:]):
+        x1, y1, x2, y2 = lon1 - lon0, lat1 - lat0, lon2 - lon0, lat2 - lat0
+        cross = x1 * y2 - x2 * y1
+        area += cross
+        lon_sum += (x1 + x2) * cross
+        lat_sum += (y1 + y2) * cross
+    if area == 0:
+        return None
+    area /= 2
+    return abs(area), lat0 + lat_sum / (6 * area), lon0 + lon_sum / (6 * area)
+
+def mean(points):
+    if not points:
+        return None
+    return sum(lat for lat, _ in points) / len(points), sum(lon for _, lon in points) / len(points)
+
+def way_centroid(refs, nodes):
+    # Area centroid of a closed way, mean of its nodes otherwise
+    points = coordinates(refs, nodes)
+    centroid = ring_centroid(points)
+    if centroid is not None:
+        return centroid[1], centroid[2]
+    return mean(points)
+
+def assemble_rings(ways):
+    # Join the member ways (lists of node refs) of a multipolygon into closed rings
+    rings = []
+    open_ways = [list(refs) for refs in ways if len(refs) > 1]
+    while open_ways:
+        ring = open_ways.pop(0)
+        while ring[0] != ring[-1]:
+            for position, refs in enumerate(open_ways):
+                if refs[0] == ring[-1]:
+                    ring.extend(refs[1:])
+                elif refs[-1] == ring[-1]:
+                    ring.extend(reversed(refs[:-1]))
+                elif refs[-1] == ring[0]:
+                    ring[:0] = refs[:-1]
+                elif refs[0] == ring[0]:
+                    ring[:0] = list(reversed(refs[1:]))
+                else:
+                    continue
+                open_ways.pop(position)
+                break
+            else:
+                return None
+        rings.append(ring)
+    return rings
+
+def relation_centroid(members, ways, nodes):
+    # Centroid of a relation: outer rings minus inner rings for a multipolygon,
+    # mean of the member nodes and ways otherwise. ways is a way id -> refs map.
+    outer = [ways[member] for member_type, member, role in members if member_type == 'W' and role != 'inner' and member in ways]
+    inner = [ways[member] for member_type, member, role in members if member_type == 'W' and role == 'inner' and member in ways]
+
+    outer_rings = assemble_rings(outer)
+    inner_rings = assemble_rings(inner) or []
+    if outer_rings:
+        area = lat_sum = lon_sum = 0.0
+        for rings, sign in ((outer_rings, 1), (inner_rings, -1)):
+            for ring in rings:
+                centroid = ring_centroid(coordinates(ring, nodes))
+                if centroid is None:
+                    continue
+                area += sign * centroid[0]
+                lat_sum += sign * centroid[0] * centroid[1]
+                lon_sum += sign * centroid[0] * centroid[2]
+        if area > 0:
+            return lat_sum / area, lon_sum / area
+
+    points = []
+    for member_type, member, _ in members:
+        if member_type == 'N':
+            point = nodes.get(member)
+            if point is not None:
+                points.append(point)
+        elif member_type == 'W' and member in ways:
+            points.extend(coordinates(ways[member], nodes))
+    return mean(points)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import glob
+import os
+import os.path
+
+# Link the frequentation, localisation and osm datasets: every id column of
+# the localisation and osm files is indexed in a dict, then each record is
+# joined with a few lookups, in a single linear pass over each file.
+# Shared ids of the osm and localisation rows, osm ids being looked up with
+# their osm_type since a node and a way may have the same id
+OSM_KEYS = (('osm_id', 'osm_id'), ('musee_id', 'id'), ('museofile_id', 'museofile_id'), ('wikidata_id', 'wikidata'))
+MERGED_FIELDNAMES = ['id', 'osm_id', 'osm_type', 'name', 'number', 'street', 'postal_code', 'city', 'country', 'country_code',
+                     'lat', 'lon', 'website', 'phone', 'email', 'wikidata', 'museofile_id', 'status', 'tags',
+                     'first_year', 'last_year', 'sources']
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Link frequentation, localisation and osm museum files')
+    parser.add_argument('-f', '--frequentation', type=str, default='frequentation/data', help='directory of the by year frequentation files')
+    parser.add_argument('-l', '--localisation', type=str, default='localisation/data/liste-et-localisation-des-musees-de-france.csv', help='structured localisation csv filename')
+    parser.add_argument('-m', '--osm', type=str, nargs='*', default=None, help='osm csv filenames (default: osm/tag-museums/*-museums.csv)')
+    parser.add_argument('-d', '--output-dir', type=str, default=None, help='write the backfilled by year files there instead of in place')
+    parser.add_argument('-o', '--output', type=str, default='museums.csv', help='merged museum table csv filename')
+    parser.add_argument('-v', '--version', action='version', version='1.0')
+    return parser.parse_args()
+
+def read_csv(filename):
+    with open(filename, newline='', encoding='utf-8-sig') as csv_inputfile:
+        csv_reader = csv.DictReader(csv_inputfile)
+        return csv_reader.fieldnames, list(csv_reader)
+
+def write_csv(filename, fieldnames, rows):
+    # Replace the file atomically
+    tmp_file = filename + '.tmp'
+    with open(tmp_file, 'w', newline='', encoding='utf-8') as csv_outputfile:
+        csv_writer = csv.DictWriter(csv_outputfile, fieldnames=fieldnames, extrasaction='ignore')
+        csv_writer.writeheader()
+        csv_writer.writerows(rows)
+    os.replace(tmp_file, filename)
+
+def build_index(rows, columns):
+    # {column: {value: row}}, the first row wins for duplicated values.
+    # osm_id values are (osm_type, osm_id) keys, osm_type being '' in the files
+    # written before the osm_type column.
+    index = {column: {} for column in columns}
+    for row in rows:
+        for column in columns:
+            value = row.get(column)
+            if value:
+                if column == 'osm_id':
+                    value = (row.get('osm_type') or '', value)
+                index[column].setdefault(value, row)
+    return index
+
+def find_osm_id(index, osm_type, osm_id):
+    # Row of an osm id in an osm_id index. Without a type on either side, the
+    # id must be unique: a node and a way of the same id are not guessed.
+    if osm_type and (osm_type, osm_id) in index:
+        return index[osm_type, osm_id]
+    if ('', osm_id) in index:
+        return index['', osm_id]
+    if not osm_type:
+        found = [index[key] for key in (('node', osm_id), ('way', osm_id), ('relation', osm_id)) if key in index]
+        if len(found) == 1:
+            return found[0]
+    return None
+
+class Linker:
+    def __init__(self, localisation_rows, osm_rows):
+        self.localisation = localisation_rows
+        self.osm = osm_rows
+        self.localisation_index = build_index(localisation_rows, ('id', 'osm_id', 'wikidata'))
+        self.osm_index = build_index(osm_rows, [column for column, _ in OSM_KEYS])
+        self.linked_osm = set()
+
+    def find_osm(self, museum):
+        # The osm row of a localisation row, through any of the shared ids
+        for osm_column, museum_column in OSM_KEYS:
+            value = museum.get(museum_column)
+            if not value:
+                continue
+            if osm_column == 'osm_id':
+                osm = find_osm_id(self.osm_index['osm_id'], museum.get('osm_type'), value)
+                if osm is not None:
+                    return osm
+            elif value in self.osm_index[osm_column]:
+                return self.osm_index[osm_column][value]
+        return None
+
+    def find_museum(self, museum_id):
+        return self.localisation_index['id'].get(museum_id)
+
+    def backfill(self, row):
+        # osm_id, coordinates and city of a frequentation row
+        museum = self.find_museum(row['id'])
+        if museum is None:
+            return False
+        osm = self.find_osm(museum)
+        row['osm_id'] = museum.get('osm_id') or (osm['osm_id'] if osm else '') or row.get('osm_id', '')
+        row['lat'] = museum.get('lat') or (osm['lat'] if osm else '')
+        row['lon'] = museum.get('lon') or (osm['lon'] if osm else '')
+        row['city'] = museum.get('city') or (osm['city'] if osm else '') or row['city']
+        return True
+
+    def merge(self, years):
+        # One row per museum: Musées de France (with their osm data), then the
+        # museums only known by their attendance, then the osm only museums
+        merged = []
+        for museum in self.localisation:
+            entry = {column: museum.get(column, '') for column in MERGED_FIELDNAMES}
+            sources = ['mdf']
+            osm = self.find_osm(museum)
+            if osm is not None:
+                self.linked_osm.add(id(osm))
+                sources.append('osm')
+                for column in MERGED_FIELDNAMES:
+                    if not entry[column] and osm.get(column):
+                        entry[column] = osm[column]
+                if entry['osm_id'] != osm['osm_id']:
+                    # Linked through another id, the osm_type is the one of the museum osm_id
+                    entry['osm_type'] = museum.get('osm_type', '')
+                if not entry['wikidata']:
+                    entry['wikidata'] = osm.get('wikidata_id', '')
+                tags = [tag for tag in (museum.get('tags') or '').split(';') + (osm.get('tags') or '').split(';') if tag]
+                entry['tags'] = ';'.join(dict.fromkeys(tags))
+                entry['osm_id'] = entry['osm_id'] or osm['osm_id']
+            if museum['id'] in years:
+                sources.append('frequentation')
+                entry['first_year'], entry['last_year'] = min(years[museum['id']][0]), max(years[museum['id']][0])
+            entry['sources'] = ';'.join(sources)
+            merged.append(entry)
+
+        for museum_id, (museum_years, row) in years.items():
+            if museum_id in self.localisation_index['id']:
+                continue
+            entry = {column: row.get(column, '') for column in MERGED_FIELDNAMES}
+            entry['first_year'], entry['last_year'] = min(museum_years), max(museum_years)
+            entry['sources'] = 'frequentation'
+            merged.append(entry)
+
+        for osm in self.osm:
+            if id(osm) in self.linked_osm:
+                continue
+            entry = {column: osm.get(column, '') for column in MERGED_FIELDNAMES}
+            entry['id'] = osm.get('musee_id', '')
+            entry['wikidata'] = osm.get('wikidata_id', '')
+            entry['sources'] = 'osm'
+            merged.append(entry)
+        return merged
+
+def main():
+    args = parse_args()
+
+    _, localisation_rows = read_csv(args.localisation)
+    osm_rows = []
+    for filename in sorted(args.osm if args.osm is not None else glob.glob('osm/tag-museums/*-museums.csv')):
+        osm_rows.extend(read_csv(filename)[1])
+    linker = Linker(localisation_rows, osm_rows)
+
+    output_dir = args.output_dir or args.frequentation
+    os.makedirs(output_dir, exist_ok=True)
+
+    rows_total = 0
+    rows_linked = 0
+    years = {}
+    for filename in sorted(glob.glob(os.path.join(args.frequentation, 'frequentation-des-musees-de-france-pour-*.csv'))):
+        fieldnames, rows = read_csv(filename)
+        for column in ('lat', 'lon'):
+            if column not in fieldnames:
+                fieldnames.append(column)
+        for row in rows:
+            rows_total += 1
+            if linker.backfill(row):
+                rows_linked += 1
+            museum_years = years.setdefault(row['id'], ([], row))[0]
+            museum_years.append(row['year'])
+        write_csv(os.path.join(output_dir, os.path.basename(filename)), fieldnames, rows)
+
+    merged = linker.merge(years)
+    write_csv(args.output, MERGED_FIELDNAMES, merged)
+
+    print('linked {} of {} frequentation rows, {} osm museums matched.'.format(rows_linked, rows_total, len(linker.linked_osm)))
+    print('wrote {} museums to {}'.format(len(merged), args.output))
+
+if __name__ == '__main__':
+    main()
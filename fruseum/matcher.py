@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import difflib
+import math
+import re
+from fruseum.classifier import normalize_name
+
+# Offline reconciliation of the osm museums with the Musées de France list.
+# Candidates are blocked by postal code, city and coarse spatial cell, so that
+# only the museums sharing a block are compared, never all the pairs.
+STOPWORDS = {'a', 'au', 'aux', 'd', 'de', 'des', 'du', 'en', 'et', 'l', 'la', 'le', 'les', 'sur',
+             'musee', 'musees', 'museum', 'maison', 'municipal', 'municipale'}
+CELL_SIZE = 0.02
+
+def tokens(name):
+    words = re.split(r'[^a-z0-9]+', normalize_name(name or ''))
+    return [word for word in words if word and word not in STOPWORDS]
+
+def normalize_city(city):
+    return ' '.join(re.split(r'[^a-z0-9]+', normalize_name(city or ''))).strip()
+
+def parse_coordinate(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def read_museums(filename):
+    # Structured csv (id or osm_id, name, postal_code, city, lat, lon) or the raw
+    # Musées de France list (REF MUSEE, NOM DU MUSEE, CP, VILLE, coordonnees_finales)
+    museums = []
+    with open(filename, newline='', encoding='utf-8-sig') as csv_inputfile:
+        csv_reader = csv.DictReader(csv_inputfile)
+        for row in csv_reader:
+            if 'REF MUSEE' in row:
+                coordinates = (row.get('coordonnees_finales') or '').split(',')
+                lat, lon = (parse_coordinate(coordinates[0]), parse_coordinate(coordinates[1])) if len(coordinates) == 2 else (None, None)
+                museum = {'id': row['REF MUSEE'], 'name': row['NOM DU MUSEE'], 'postal_code': row['CP'], 'city': row['VILLE'], 'lat': lat, 'lon': lon}
+            else:
+                museum = {'id': row.get('id') or row.get('osm_id'), 'name': row.get('name'), 'postal_code': row.get('postal_code'),
+                          'city': row.get('city'), 'lat': parse_coordinate(row.get('lat')), 'lon': parse_coordinate(row.get('lon'))}
+            museum['tokens'] = tokens(museum['name'])
+            museum['sorted'] = ' '.join(sorted(museum['tokens']))
+            museums.append(museum)
+    return museums
+
+def blocks(museum, neighbours=False):
+    keys = []
+    if museum['postal_code']:
+        keys.append('cp:' + museum['postal_code'].strip())
+    city = normalize_city(museum['city'])
+    if city:
+        keys.append('city:' + city)
+    if museum['lat'] is not None and museum['lon'] is not None:
+        row = int(math.floor(museum['lat'] / CELL_SIZE))
+        column = int(math.floor(museum['lon'] / CELL_SIZE))
+        offsets = (-1, 0, 1) if neighbours else (0,)
+        for d_row in offsets:
+            for d_column in offsets:
+                keys.append('cell:{}:{}'.format(row + d_row, column + d_column))
+    return keys
+
+def distance(a, b):
+    if a['lat'] is None or b['lat'] is None or a['lon'] is None or b['lon'] is None:
+        return None
+    lat1, lon1, lat2, lon2 = map(math.radians, (a['lat'], a['lon'], b['lat'], b['lon']))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0088 * math.asin(math.sqrt(min(h, 1.0)))
+
+def score(a, b):
+    # Token based name similarity (Dice coefficient of the token sets or ratio
+    # of the sorted tokens), then location agreement. A name without tokens
+    # (empty or only stopwords) matches nothing.
+    set_a, set_b = set(a['tokens']), set(b['tokens'])
+    if set_a and set_b:
+        dice = 2.0 * len(set_a & set_b) / (len(set_a) + len(set_b))
+        ratio = difflib.SequenceMatcher(None, a['sorted'], b['sorted']).ratio()
+        name = max(dice, ratio)
+    else:
+        name = 0.0
+    location = 0.0
+    km = distance(a, b)
+    if km is not None:
+        location = 1.0 if km < 0.3 else 0.5 if km < 2 else 0.0
+    elif a['postal_code'] and a['postal_code'] == b['postal_code']:
+        location = 0.5
+    return 0.75 * name + 0.25 * location, name, km
+
+def match(mdf, osm, threshold=0.6):
+    # Best one to one pairs, (mdf, osm, confidence, km), highest confidence first
+    index = {}
+    for position, museum in enumerate(mdf):
+        for key in blocks(museum):
+            index.setdefault(key, []).append(position)
+
+    pairs = []
+    comparisons = 0
+    for osm_position, museum in enumerate(osm):
+        candidates = set()
+        for key in blocks(museum, neighbours=True):
+            candidates.update(index.get(key, ()))
+        for mdf_position in candidates:
+            comparisons += 1
+            confidence, name, km = score(mdf[mdf_position], museum)
+            # The location alone is never enough
+            if name > 0 and confidence >= threshold:
+                pairs.append((confidence, mdf_position, osm_position, km))
+
+    pairs.sort(key=lambda pair: (-pair[0], pair[1], pair[2]))
+    matched_mdf, matched_osm, matches = set(), set(), []
+    for confidence, mdf_position, osm_position, km in pairs:
+        if mdf_position in matched_mdf or osm_position in matched_osm:
+            continue
+        matched_mdf.add(mdf_position)
+        matched_osm.add(osm_position)
+        matches.append((mdf[mdf_position], osm[osm_position], confidence, km))
+    return matches, comparisons
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Match osm museums with the Musees de France list, offline')
+    parser.add_argument('-m', '--mdf', type=str, default='localisation/liste-et-localisation-des-musees-de-france.csv', help='Musees de France csv filename (raw or structured)')
+    parser.add_argument('-s', '--osm', type=str, default='osm/tag-museums/france-museums.csv', help='osm museums csv filename')
+    parser.add_argument('-o', '--output', type=str, required=True, help='output matched pairs csv filename')
+    parser.add_argument('-t', '--threshold', type=float, default=0.6, help='minimum confidence of a pair')
+    parser.add_argument('-v', '--version', action='version', version='1.0')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    mdf = read_museums(args.mdf)
+    osm = read_museums(args.osm)
+    matches, comparisons = match(mdf, osm, args.threshold)
+
+    with open(args.output, 'w', newline='', encoding='utf-8') as csv_outputfile:
+        csv_writer = csv.writer(csv_outputfile)
+        csv_writer.writerow(['id', 'osm_id', 'name', 'osm_name', 'city', 'distance_km', 'confidence'])
+        for museum, osm_museum, confidence, km in matches:
+            csv_writer.writerow([museum['id'], osm_museum['id'], museum['name'], osm_museum['name'], museum['city'],
+                                 '' if km is None else '{:.3f}'.format(km), '{:.3f}'.format(confidence)])
+
+    print('matched {} of {} museums with {} comparisons ({} would be all pairs)'.format(len(matches), len(mdf), comparisons, len(mdf) * len(osm)))
+
+if __name__ == '__main__':
+    main()
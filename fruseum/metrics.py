@@ -0,0 +1,171 @@
+import atexit
+import json
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Instrumentation shared by the converters: counters, per stage latency
+# histograms, a throttled progress line and a json run report written at exit.
+# Levels: quiet (summary only), progress (default) and debug (every row).
+LEVELS = {'quiet': 0, 'progress': 1, 'debug': 2}
+BUCKETS_PER_OCTAVE = 4
+
+class Histogram:
+    # Log-scaled latency histogram, 4 buckets per power of two microseconds
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        micros = max(seconds * 1e6, 1.0)
+        bucket = int(math.log2(micros) * BUCKETS_PER_OCTAVE)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, ratio):
+        # Upper bound of the bucket holding the percentile, in milliseconds
+        if not self.count:
+            return 0.0
+        rank = ratio * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE) / 1000, self.max * 1000)
+        return self.max * 1000
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total_ms': round(self.total * 1000, 3),
+            'mean_ms': round(self.total * 1000 / self.count, 3) if self.count else 0.0,
+            'p50_ms': round(self.percentile(0.5), 3),
+            'p90_ms': round(self.percentile(0.9), 3),
+            'p99_ms': round(self.percentile(0.99), 3),
+            'max_ms': round(self.max * 1000, 3),
+        }
+
+class Metrics:
+    def __init__(self, name, level='progress', total=None, report=None, interval=1.0, stream=None):
+        self.name = name
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.stages = {}
+        self.rows = 0
+        self.started = time.time()
+        self.clock = time.perf_counter()
+        self.last_progress = self.clock
+        self.closed = False
+        self.configure(level, total, report, interval, stream)
+        atexit.register(self.close)
+
+    def configure(self, level='progress', total=None, report=None, interval=1.0, stream=None):
+        self.level = LEVELS[level]
+        self.total = total
+        self.report = report
+        self.interval = interval
+        self.stream = stream or sys.stderr
+
+    @contextmanager
+    def stage(self, name):
+        # Time a stage (parse, lookup, geocode, classify, write...)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                histogram = self.stages.get(name)
+                if histogram is None:
+                    histogram = self.stages[name] = Histogram()
+                histogram.add(elapsed)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def row(self, n=1):
+        # One more row done, the progress line being printed at most once per interval
+        self.rows += n
+        if self.level < LEVELS['progress']:
+            return
+        now = time.perf_counter()
+        if now - self.last_progress >= self.interval:
+            self.last_progress = now
+            self.progress(now)
+
+    def rate(self, now=None):
+        elapsed = (now or time.perf_counter()) - self.clock
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def progress(self, now=None):
+        rate = self.rate(now)
+        line = '{}: {} rows, {:.0f} rows/sec'.format(self.name, self.rows, rate)
+        if self.total:
+            line += ', {:.1f}%'.format(100.0 * self.rows / self.total)
+            if rate > 0 and self.rows < self.total:
+                line += ', eta {}'.format(format_duration((self.total - self.rows) / rate))
+        print(line, file=self.stream, flush=True)
+
+    def debug(self, *args):
+        if self.level >= LEVELS['debug']:
+            print(*args)
+
+    def info(self, *args):
+        # Summaries, printed whatever the level
+        print(*args)
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.clock
+        return {
+            'script': self.name,
+            'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.started)),
+            'elapsed_s': round(elapsed, 3),
+            'rows': self.rows,
+            'rows_per_sec': round(self.rows / elapsed, 1) if elapsed > 0 else 0.0,
+            'counters': dict(self.counters),
+            'stages': {name: histogram.summary() for name, histogram in sorted(self.stages.items())},
+        }
+
+    def close(self):
+        # Final progress line and json report, also called at exit
+        if self.closed:
+            return
+        self.closed = True
+        if self.level >= LEVELS['progress'] and self.rows:
+            self.progress()
+        if self.report:
+            summary = self.summary()
+            tmp_file = self.report + '.tmp'
+            with open(tmp_file, 'w') as report_file:
+                json.dump(summary, report_file, indent=2)
+            os.replace(tmp_file, self.report)
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return '{}h{:02d}m'.format(seconds // 3600, seconds % 3600 // 60)
+    if seconds >= 60:
+        return '{}m{:02d}s'.format(seconds // 60, seconds % 60)
+    return '{}s'.format(seconds)
+
+def add_arguments(parser):
+    # --quiet, --debug and --report options of the converters
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('-q', '--quiet', action='store_true', help='only print the summary of the run')
+    group.add_argument('--debug', action='store_true', help='print every row (slow on large inputs)')
+    parser.add_argument('--report', type=str, default=None, help='write a json run report (counters, per stage timings) to this file')
+
+def level(args):
+    if args.quiet:
+        return 'quiet'
+    if args.debug:
+        return 'debug'
+    return 'progress'
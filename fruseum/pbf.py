@@ -0,0 +1,393 @@
+import collections
+import datetime
+import lzma
+import os
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from fruseum.geometry import NodeIndex, format_coordinate, relation_centroid, way_centroid
+
+# Reader of OpenStreetMap .osm.pbf files, decoding only the protobuf messages
+# needed to keep the elements with a given tag (tourism=museum by default).
+# Blobs are read sequentially and decoded in parallel by a process pool; a
+# block whose string table lacks the tag key or value is skipped undecoded.
+# Ways and relations are then located by two more passes, collecting only the
+# member ways and nodes they need, to compute their centroids locally.
+
+def read_varint(data, position):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, position
+        shift += 7
+
+def zigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+def signed(value):
+    # int32/int64 fields are encoded as two's complement varints
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def fields(data):
+    # Yield (field number, wire type, value) of a message, length delimited
+    # values being memoryviews
+    data = memoryview(data)
+    position = 0
+    end = len(data)
+    while position < end:
+        key, position = read_varint(data, position)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, position = read_varint(data, position)
+        elif wire_type == 2:
+            length, position = read_varint(data, position)
+            value = data[position:position + length]
+            position += length
+        elif wire_type == 1:
+            value = data[position:position + 8]
+            position += 8
+        elif wire_type == 5:
+            value = data[position:position + 4]
+            position += 4
+        else:
+            raise ValueError('unsupported protobuf wire type: {}'.format(wire_type))
+        yield number, wire_type, value
+
+def packed(wire_type, value):
+    # Values of a repeated varint field, packed or not
+    if wire_type == 0:
+        return [value]
+    values = []
+    position = 0
+    end = len(value)
+    while position < end:
+        item, position = read_varint(value, position)
+        values.append(item)
+    return values
+
+def delta(values, decode=zigzag):
+    result = []
+    current = 0
+    for value in values:
+        current += decode(value)
+        result.append(current)
+    return result
+
+def read_blobs(filename):
+    # Yield (type, blob) of each fileblock: 4 bytes header length, BlobHeader, Blob
+    with open(filename, 'rb') as pbf_file:
+        while True:
+            length = pbf_file.read(4)
+            if len(length) < 4:
+                return
+            header = pbf_file.read(struct.unpack('>I', length)[0])
+            blob_type, size = None, 0
+            for number, _, value in fields(header):
+                if number == 1:
+                    blob_type = bytes(value).decode('utf-8')
+                elif number == 3:
+                    size = value
+            yield blob_type, pbf_file.read(size)
+
+def decompress(blob):
+    raw_size = None
+    for number, _, value in fields(blob):
+        if number == 1:
+            return bytes(value)
+        if number == 2:
+            raw_size = value
+        elif number == 3:
+            return zlib.decompress(value)
+        elif number == 4:
+            return lzma.decompress(value)
+        elif number in (5, 6, 7):
+            raise ValueError('unsupported pbf blob compression (field {})'.format(number))
+    raise ValueError('empty pbf blob (raw size {})'.format(raw_size))
+
+def timestamp(seconds):
+    if not seconds:
+        return None
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+def info_timestamp(info, date_granularity):
+    for number, _, value in fields(info):
+        if number == 2:
+            return timestamp(signed(value) * date_granularity // 1000)
+    return None
+
+def keep(tags, key, value):
+    return any(k == key and v == value for k, v in tags)
+
+def decode_block(data, key='tourism', value='museum'):
+    # Elements of a PrimitiveBlock having the tag key=value, as dicts
+    # {type, id, timestamp, tags, and lat/lon (nodes), refs (ways) or members (relations)}
+    strings = []
+    groups = []
+    granularity, lat_offset, lon_offset, date_granularity = 100, 0, 0, 1000
+    for number, _, field in fields(data):
+        if number == 1:
+            strings = [bytes(s).decode('utf-8') for n, _, s in fields(field) if n == 1]
+        elif number == 2:
+            groups.append(field)
+        elif number == 17:
+            granularity = field
+        elif number == 18:
+            date_granularity = field
+        elif number == 19:
+            lat_offset = signed(field)
+        elif number == 20:
+            lon_offset = signed(field)
+
+    if key not in strings or value not in strings:
+        return []
+
+    def coordinate(offset, raw):
+        return format_coordinate((offset + granularity * raw) / 1e9)
+
+    elements = []
+    for group in groups:
+        for number, _, field in fields(group):
+            if number == 1:
+                element = decode_node(field, strings, date_granularity)
+                element['lat'] = coordinate(lat_offset, element.pop('raw_lat'))
+                element['lon'] = coordinate(lon_offset, element.pop('raw_lon'))
+                if keep(element['tags'], key, value):
+                    elements.append(element)
+            elif number == 2:
+                for element in decode_dense(field, strings, date_granularity):
+                    if keep(element['tags'], key, value):
+                        element['lat'] = coordinate(lat_offset, element.pop('raw_lat'))
+                        element['lon'] = coordinate(lon_offset, element.pop('raw_lon'))
+                        elements.append(element)
+            elif number == 3:
+                element = decode_way(field, strings, date_granularity)
+                if keep(element['tags'], key, value):
+                    elements.append(element)
+            elif number == 4:
+                element = decode_relation(field, strings, date_granularity)
+                if keep(element['tags'], key, value):
+                    elements.append(element)
+    return elements
+
+def decode_tags(keys, values, strings):
+    return [(strings[k], strings[v]) for k, v in zip(keys, values)]
+
+def decode_node(data, strings, date_granularity):
+    element = {'type': 'N', 'id': None, 'timestamp': None, 'raw_lat': 0, 'raw_lon': 0}
+    keys, values = [], []
+    for number, wire_type, value in fields(data):
+        if number == 1:
+            element['id'] = str(zigzag(value))
+        elif number == 2:
+            keys.extend(packed(wire_type, value))
+        elif number == 3:
+            values.extend(packed(wire_type, value))
+        elif number == 4:
+            element['timestamp'] = info_timestamp(value, date_granularity)
+        elif number == 8:
+            element['raw_lat'] = zigzag(value)
+        elif number == 9:
+            element['raw_lon'] = zigzag(value)
+    element['tags'] = decode_tags(keys, values, strings)
+    return element
+
+def decode_dense(data, strings, date_granularity):
+    ids, lats, lons, keys_vals, timestamps = [], [], [], [], []
+    for number, wire_type, value in fields(data):
+        if number == 1:
+            ids = delta(packed(wire_type, value))
+        elif number == 5:
+            for info_number, info_wire_type, info_value in fields(value):
+                if info_number == 2:
+                    timestamps = delta(packed(info_wire_type, info_value))
+        elif number == 8:
+            lats = delta(packed(wire_type, value))
+        elif number == 9:
+            lons = delta(packed(wire_type, value))
+        elif number == 10:
+            keys_vals = packed(wire_type, value)
+
+    position = 0
+    for index, node_id in enumerate(ids):
+        tags = []
+        while position < len(keys_vals) and keys_vals[position] != 0:
+            tags.append((strings[keys_vals[position]], strings[keys_vals[position + 1]]))
+            position += 2
+        position += 1
+        yield {
+            'type': 'N',
+            'id': str(node_id),
+            'timestamp': timestamp(timestamps[index] * date_granularity // 1000) if timestamps else None,
+            'tags': tags,
+            'raw_lat': lats[index],
+            'raw_lon': lons[index],
+        }
+
+def decode_way(data, strings, date_granularity):
+    element = {'type': 'W', 'id': None, 'timestamp': None, 'refs': []}
+    keys, values = [], []
+    for number, wire_type, value in fields(data):
+        if number == 1:
+            element['id'] = str(signed(value))
+        elif number == 2:
+            keys.extend(packed(wire_type, value))
+        elif number == 3:
+            values.extend(packed(wire_type, value))
+        elif number == 4:
+            element['timestamp'] = info_timestamp(value, date_granularity)
+        elif number == 8:
+            element['refs'] = [str(ref) for ref in delta(packed(wire_type, value))]
+    element['tags'] = decode_tags(keys, values, strings)
+    return element
+
+def decode_relation(data, strings, date_granularity):
+    element = {'type': 'R', 'id': None, 'timestamp': None}
+    keys, values, roles, members, types = [], [], [], [], []
+    for number, wire_type, value in fields(data):
+        if number == 1:
+            element['id'] = str(signed(value))
+        elif number == 2:
+            keys.extend(packed(wire_type, value))
+        elif number == 3:
+            values.extend(packed(wire_type, value))
+        elif number == 4:
+            element['timestamp'] = info_timestamp(value, date_granularity)
+        elif number == 8:
+            roles.extend(packed(wire_type, value))
+        elif number == 9:
+            members = delta(packed(wire_type, value))
+        elif number == 10:
+            types.extend(packed(wire_type, value))
+    element['tags'] = decode_tags(keys, values, strings)
+    element['members'] = [('NWR'[member_type], str(member), strings[role])
+                          for member_type, member, role in zip(types, members, roles)]
+    return element
+
+def decode_blob(blob, key='tourism', value='museum'):
+    return decode_block(decompress(blob), key, value)
+
+def read_block(data):
+    # (strings, groups, granularity, lat_offset, lon_offset) of a PrimitiveBlock
+    strings, groups = [], []
+    granularity, lat_offset, lon_offset = 100, 0, 0
+    for number, _, field in fields(data):
+        if number == 1:
+            strings = [bytes(s).decode('utf-8') for n, _, s in fields(field) if n == 1]
+        elif number == 2:
+            groups.append(field)
+        elif number == 17:
+            granularity = field
+        elif number == 19:
+            lat_offset = signed(field)
+        elif number == 20:
+            lon_offset = signed(field)
+    return strings, groups, granularity, lat_offset, lon_offset
+
+_wanted = frozenset()
+
+def set_wanted(wanted):
+    # Ids looked for by the worker processes, sent once per process
+    global _wanted
+    _wanted = wanted
+
+def decode_way_refs(blob):
+    # {way id: refs} of the wanted ways of a block
+    strings, groups, _, _, _ = read_block(decompress(blob))
+    refs = {}
+    for group in groups:
+        for number, _, field in fields(group):
+            if number == 3:
+                way = decode_way(field, strings, 1000)
+                if way['id'] in _wanted:
+                    refs[way['id']] = way['refs']
+    return refs
+
+def decode_node_coordinates(blob):
+    # {node id: (lat, lon)} of the wanted nodes of a block
+    strings, groups, granularity, lat_offset, lon_offset = read_block(decompress(blob))
+    found = {}
+    for group in groups:
+        for number, wire_type, field in fields(group):
+            if number == 1:
+                node = decode_node(field, strings, 1000)
+                if node['id'] in _wanted:
+                    found[node['id']] = ((lat_offset + granularity * node['raw_lat']) / 1e9, (lon_offset + granularity * node['raw_lon']) / 1e9)
+            elif number == 2:
+                ids, lats, lons = [], [], []
+                for dense_number, dense_wire_type, value in fields(field):
+                    if dense_number == 1:
+                        ids = delta(packed(dense_wire_type, value))
+                    elif dense_number == 8:
+                        lats = delta(packed(dense_wire_type, value))
+                    elif dense_number == 9:
+                        lons = delta(packed(dense_wire_type, value))
+                for node_id, lat, lon in zip(ids, lats, lons):
+                    if str(node_id) in _wanted:
+                        found[str(node_id)] = ((lat_offset + granularity * lat) / 1e9, (lon_offset + granularity * lon) / 1e9)
+    return found
+
+def map_blobs(filename, func, workers, args=(), initializer=None, initargs=()):
+    # Yield func(blob, *args) of each data blob in file order, a bounded number
+    # of blobs being in flight
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as executor:
+        pending = collections.deque()
+        for blob_type, blob in read_blobs(filename):
+            if blob_type != 'OSMData':
+                continue
+            pending.append(executor.submit(func, blob, *args))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def locate(filename, elements, workers):
+    # Centroids of the ways and relations: one pass for the member ways of the
+    # relations, one pass for the coordinates of the nodes they all use
+    ways = {element['id']: element['refs'] for element in elements if element['type'] == 'W'}
+    member_ways = {member for element in elements if element['type'] == 'R'
+                   for member_type, member, _ in element['members'] if member_type == 'W'} - set(ways)
+    if member_ways:
+        for refs in map_blobs(filename, decode_way_refs, workers, initializer=set_wanted, initargs=(frozenset(member_ways),)):
+            ways.update(refs)
+
+    wanted = set()
+    for refs in ways.values():
+        wanted.update(refs)
+    for element in elements:
+        if element['type'] == 'R':
+            wanted.update(member for member_type, member, _ in element['members'] if member_type == 'N')
+
+    nodes = NodeIndex()
+    if wanted:
+        for found in map_blobs(filename, decode_node_coordinates, workers, initializer=set_wanted, initargs=(frozenset(wanted),)):
+            for node_id, (lat, lon) in found.items():
+                nodes.add(node_id, lat, lon)
+    nodes.sort()
+
+    for element in elements:
+        if element['type'] == 'W':
+            centroid = way_centroid(element['refs'], nodes)
+        else:
+            centroid = relation_centroid(element['members'], ways, nodes)
+        if centroid is not None:
+            element['lat'] = format_coordinate(centroid[0])
+            element['lon'] = format_coordinate(centroid[1])
+
+def read_elements(filename, key='tourism', value='museum', workers=None, geometry=True):
+    # Yield the matching elements in file order, nodes as soon as they are
+    # decoded, ways and relations after their centroids have been computed
+    workers = workers or os.cpu_count() or 1
+    located = []
+    for elements in map_blobs(filename, decode_blob, workers, args=(key, value)):
+        for element in elements:
+            if geometry and element['type'] != 'N':
+                located.append(element)
+            else:
+                yield element
+    if located:
+        locate(filename, located, workers)
+        yield from located
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+import argparse
+import glob
+import hashlib
+import json
+import os
+import os.path
+import subprocess
+import sys
+import time
+
+# Run the converters as a DAG of stages. A stage is skipped when the hash of
+# its code, command line and input contents is the one of its last successful
+# run and its outputs were not touched since, so a nightly refresh only redoes
+# the work whose inputs changed. The outputs found without any recorded run
+# (e.g. the shipped csv files) are adopted as the result of the current key,
+# and a stage only pulled in as a dependency of the named ones is not run
+# again while its outputs exist, unless --force.
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+DEFAULT_STATE = os.path.join(ROOT, '.fruseum-pipeline.json')
+CHUNK_SIZE = 1 << 20
+
+class Stage:
+    def __init__(self, name, command, inputs, outputs, code):
+        self.name = name
+        self.command = command
+        self.inputs = inputs
+        self.outputs = outputs
+        self.code = code
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run the stages of the pipeline whose inputs changed since the last run')
+    parser.add_argument('stages', type=str, nargs='*', help='stages to bring up to date, with the ones they depend on (default: all)')
+    parser.add_argument('-n', '--dry-run', action='store_true', help='only print the stages that would run')
+    parser.add_argument('-f', '--force', action='store_true', help='run the selected stages and the ones they depend on even if they are up to date')
+    parser.add_argument('--osm-input', type=str, default='osm/museums-data/france-merged.osm', help='osm xml or pbf extract of the museums')
+    parser.add_argument('--nominatim', type=str, default=None, help='nominatim server url of the geocoding stages')
+    parser.add_argument('--reverse', type=str, default=None, help='localities dataset of the offline reverse geocoding')
+    parser.add_argument('--workers', type=int, default=None, help='number of geocoding requests in flight')
+    parser.add_argument('--rate', type=float, default=None, help='maximum number of geocoding requests per second')
+    parser.add_argument('--state', type=str, default=DEFAULT_STATE, help='file keeping the hashes of the last runs')
+    parser.add_argument('-v', '--version', action='version', version='1.0')
+    return parser.parse_args()
+
+def build_stages(args):
+    # Paths are relative to the root of the repository
+    geocoding = []
+    for option, value in (('--nominatim', args.nominatim), ('--reverse', args.reverse), ('--workers', args.workers), ('--rate', args.rate)):
+        if value is not None:
+            geocoding += [option, str(value)]
+    localisation = 'localisation/data/liste-et-localisation-des-musees-de-france.csv'
+    osm = 'osm/tag-museums/france-museums.csv'
+    osm_files = sorted(set(glob.glob(os.path.join(ROOT, 'osm/tag-museums/*-museums.csv'))) | {os.path.join(ROOT, osm)})
+    osm_files = [os.path.relpath(filename, ROOT) for filename in osm_files]
+    reverse = [args.reverse] if args.reverse else []
+    # Code of a stage: its script and every fruseum module it imports, but
+    # fruseum/metrics.py, which never changes the outputs
+    writers = ['fruseum/writers.py']
+    geocoding_code = ['fruseum/cache.py', 'fruseum/checkpoint.py', 'fruseum/classifier.py', 'fruseum/geocoder.py',
+                      'fruseum/reverse.py', 'fruseum/spatial.py'] + writers
+
+    return [
+        Stage('osm', ['osm2csv', '--input', args.osm_input, '--output', osm] + geocoding,
+              [args.osm_input] + reverse, [osm],
+              ['osm/osm2csv.py', 'fruseum/geometry.py', 'fruseum/pbf.py'] + geocoding_code),
+        Stage('frequentation', ['frequentation', '--input', 'frequentation/frequentation-des-musees-de-france.csv', '--output-dir', 'frequentation/data'],
+              ['frequentation/frequentation-des-musees-de-france.csv'], ['frequentation/data'],
+              ['frequentation/frequentation-musees.py'] + writers),
+        Stage('localisation', ['localisation', '--input', 'localisation/liste-et-localisation-des-musees-de-france.csv', '--output', localisation] + geocoding,
+              ['localisation/liste-et-localisation-des-musees-de-france.csv'] + reverse, [localisation],
+              ['localisation/localisation-musees.py'] + geocoding_code),
+        Stage('link', ['link', '--frequentation', 'frequentation/data', '--localisation', localisation, '--osm'] + osm_files
+              + ['--output-dir', 'frequentation/linked', '--output', 'museums.csv'],
+              ['frequentation/data', localisation] + osm_files, ['frequentation/linked', 'museums.csv'],
+              ['fruseum/linker.py']),
+    ]
+
+class Hasher:
+    # sha256 of files and directories, file hashes being reused while their
+    # size and modification time do not change (large extracts are read once)
+    def __init__(self, files=None):
+        self.files = files if files is not None else {}
+
+    def file(self, filename):
+        stat = os.stat(filename)
+        name = os.path.relpath(filename, ROOT)
+        known = self.files.get(name)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+        digest = hashlib.sha256()
+        with open(filename, 'rb') as input_file:
+            for chunk in iter(lambda: input_file.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        self.files[name] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def path(self, path):
+        # None when the path does not exist
+        filename = os.path.join(ROOT, path)
+        if os.path.isfile(filename):
+            return self.file(filename)
+        if not os.path.isdir(filename):
+            return None
+        digest = hashlib.sha256()
+        for directory, dirnames, filenames in os.walk(filename):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.endswith('.tmp'):
+                    continue
+                child = os.path.join(directory, name)
+                digest.update(os.path.relpath(child, filename).encode('utf-8') + b'\0' + self.file(child).encode('ascii'))
+        return digest.hexdigest()
+
+def stage_key(stage, hasher):
+    key = {
+        'command': stage.command,
+        'code': {path: hasher.path(path) for path in stage.code},
+        'inputs': {path: hasher.path(path) for path in stage.inputs},
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+def dependencies(stages):
+    # {stage name: names of the stages producing one of its inputs}
+    produced = {}
+    for stage in stages:
+        for output in stage.outputs:
+            produced[os.path.normpath(output)] = stage.name
+    return {stage.name: {produced[os.path.normpath(path)] for path in stage.inputs if os.path.normpath(path) in produced} for stage in stages}
+
+def select(stages, targets):
+    # The target stages and, transitively, the ones they depend on, in order
+    if not targets:
+        return stages
+    depends = dependencies(stages)
+    names = {stage.name for stage in stages}
+    unknown = [target for target in targets if target not in names]
+    if unknown:
+        raise SystemExit('unknown stages: {} (known: {})'.format(', '.join(unknown), ', '.join(stage.name for stage in stages)))
+    selected = set()
+    pending = list(targets)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(depends[name])
+    return [stage for stage in stages if stage.name in selected]
+
+def load_state(filename):
+    if not os.path.isfile(filename):
+        return {'files': {}, 'stages': {}}
+    with open(filename) as state_file:
+        return json.load(state_file)
+
+def save_state(filename, state):
+    tmp_file = filename + '.tmp'
+    with open(tmp_file, 'w') as state_file:
+        json.dump(state, state_file, indent=1, sort_keys=True)
+    os.replace(tmp_file, filename)
+
+def up_to_date(stage, key, state, hasher):
+    last = state['stages'].get(stage.name)
+    if last is None or last['key'] != key:
+        return False
+    return all(hasher.path(output) is not None and hasher.path(output) == last['outputs'].get(output) for output in stage.outputs)
+
+def outputs_exist(stage, hasher):
+    return all(hasher.path(output) is not None for output in stage.outputs)
+
+def record(state, stage, key, hasher, elapsed=None):
+    state['stages'][stage.name] = {
+        'key': key,
+        'outputs': {output: hasher.path(output) for output in stage.outputs},
+        'finished': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'elapsed_s': None if elapsed is None else round(elapsed, 3),
+    }
+
+def run(stages, state, state_file, dry_run=False, force=False, targets=None):
+    # Returns the names of the failed stages, the stages depending on them being skipped.
+    # targets are the stages named on the command line, all of them by default.
+    hasher = Hasher(state['files'])
+    depends = dependencies(stages)
+    failed = set()
+    # In a dry run, the stages that would run before: the inputs they produce are not known yet
+    pending = set()
+    for stage in stages:
+        if depends[stage.name] & failed:
+            print('{}: skipped, {} failed'.format(stage.name, ', '.join(sorted(depends[stage.name] & failed))))
+            failed.add(stage.name)
+            continue
+        if depends[stage.name] & pending:
+            print('{}: would run fruseum {}'.format(stage.name, ' '.join(stage.command)))
+            pending.add(stage.name)
+            continue
+        missing = [path for path in stage.inputs if hasher.path(path) is None]
+        if missing and outputs_exist(stage, hasher):
+            # e.g. the osm csv files are shipped but not the extract they come from
+            print('{}: missing inputs {}, keeping the existing outputs'.format(stage.name, ', '.join(missing)))
+            continue
+        if missing:
+            print('{}: missing inputs {}'.format(stage.name, ', '.join(missing)))
+            failed.add(stage.name)
+            continue
+
+        key = stage_key(stage, hasher)
+        if not force and up_to_date(stage, key, state, hasher):
+            print('{}: up to date'.format(stage.name))
+            continue
+        if not force and stage.name not in state['stages'] and outputs_exist(stage, hasher):
+            # Outputs made before the pipeline kept hashes: they are the current ones
+            print('{}: existing outputs recorded as up to date'.format(stage.name))
+            record(state, stage, key, hasher)
+            continue
+        if not force and targets and stage.name not in targets and outputs_exist(stage, hasher):
+            print('{}: out of date, keeping the existing outputs (name it or use --force to run it)'.format(stage.name))
+            continue
+        if dry_run:
+            print('{}: would run fruseum {}'.format(stage.name, ' '.join(stage.command)))
+            pending.add(stage.name)
+            continue
+
+        print('{}: running fruseum {}'.format(stage.name, ' '.join(stage.command)), flush=True)
+        started = time.perf_counter()
+        if subprocess.call([sys.executable, '-m', 'fruseum'] + stage.command, cwd=ROOT) != 0:
+            print('{}: failed'.format(stage.name))
+            failed.add(stage.name)
+            continue
+        record(state, stage, key, hasher, time.perf_counter() - started)
+        save_state(state_file, state)
+        print('{}: done in {:.1f}s'.format(stage.name, time.perf_counter() - started))
+    if not dry_run:
+        save_state(state_file, state)
+    return failed
+
+def main():
+    args = parse_args()
+    stages = select(build_stages(args), args.stages)
+    state = load_state(args.state)
+    failed = run(stages, state, args.state, args.dry_run, args.force, set(args.stages))
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import math
+import numpy as np
+from fruseum.spatial import SpatialIndex, parse_coordinate
+
+# Offline reverse geocoding: the nearest locality of a point gives its city,
+# postal code and country. Localities come from a GeoNames postal code dump
+# (https://download.geonames.org/export/zip/, e.g. FR.txt) or from structured
+# csv files already geocoded (postal_code, city, country, country_code, lat, lon).
+FRANCE = {'FR', 'GP', 'MQ', 'GF', 'RE', 'YT', 'PM', 'BL', 'MF', 'PF', 'NC', 'WF', 'TF'}
+
+class ReverseGeocoder:
+    def __init__(self, lats, lons, postal_codes, cities, countries, country_codes, cell_size=0.05):
+        self.postal_codes = list(postal_codes)
+        self.cities = list(cities)
+        self.countries = list(countries)
+        self.country_codes = list(country_codes)
+        labels = [str(position) for position in range(len(self.cities))]
+        self.index = SpatialIndex(lats, lons, labels, self.cities, [0] * len(labels), ['localities'], cell_size)
+
+    @classmethod
+    def from_geonames(cls, filename):
+        # Tab separated: country code, postal code, place name, admin names and
+        # codes (6 columns), latitude, longitude, accuracy
+        lats, lons, postal_codes, cities, countries, country_codes = [], [], [], [], [], []
+        with open(filename, encoding='utf-8') as geonames_file:
+            for line in geonames_file:
+                columns = line.rstrip('\n').split('\t')
+                if len(columns) < 11:
+                    continue
+                lat, lon = parse_coordinate(columns[9]), parse_coordinate(columns[10])
+                if math.isnan(lat) or math.isnan(lon):
+                    continue
+                lats.append(lat)
+                lons.append(lon)
+                postal_codes.append(columns[1])
+                cities.append(columns[2])
+                countries.append('France' if columns[0] in FRANCE else columns[0])
+                country_codes.append('fr' if columns[0] in FRANCE else columns[0].lower())
+        return cls(lats, lons, postal_codes, cities, countries, country_codes)
+
+    @classmethod
+    def from_csv(cls, filenames):
+        lats, lons, postal_codes, cities, countries, country_codes = [], [], [], [], [], []
+        for filename in filenames:
+            with open(filename, newline='', encoding='utf-8-sig') as csv_inputfile:
+                for row in csv.DictReader(csv_inputfile):
+                    lat, lon = parse_coordinate(row.get('lat')), parse_coordinate(row.get('lon'))
+                    if math.isnan(lat) or math.isnan(lon) or not row.get('city'):
+                        continue
+                    lats.append(lat)
+                    lons.append(lon)
+                    postal_codes.append(row.get('postal_code') or '')
+                    cities.append(row['city'])
+                    countries.append(row.get('country') or '')
+                    country_codes.append(row.get('country_code') or '')
+        return cls(lats, lons, postal_codes, cities, countries, country_codes)
+
+    @classmethod
+    def load(cls, filename):
+        # .txt: GeoNames dump, otherwise a structured csv
+        if filename.endswith('.txt'):
+            return cls.from_geonames(filename)
+        return cls.from_csv([filename])
+
+    def __len__(self):
+        return len(self.cities)
+
+    def lookup(self, lats, lons, max_km=50.0):
+        # One {postal_code, city, country, country_code, distance} per point,
+        # None for the points without coordinates or without a locality within max_km
+        results = []
+        for lat, lon in zip(np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64)):
+            if math.isnan(lat) or math.isnan(lon) or not len(self):
+                results.append(None)
+                continue
+            nearest = self.index.knn(lat, lon, 1, max_km=max_km)
+            if not nearest or nearest[0]['distance'] > max_km:
+                results.append(None)
+                continue
+            position = int(nearest[0]['id'])
+            results.append({
+                'postal_code': self.postal_codes[position],
+                'city': self.cities[position],
+                'country': self.countries[position],
+                'country_code': self.country_codes[position],
+                'distance': nearest[0]['distance'],
+            })
+        return results
+
+def fill(entries, geocoder, overwrite=False):
+    # Fill postal_code, city, country and country_code of the entries from
+    # their lat/lon, only the empty fields unless overwrite is set
+    lats = [parse_coordinate(entry.get('lat')) for entry in entries]
+    lons = [parse_coordinate(entry.get('lon')) for entry in entries]
+    filled = 0
+    for entry, result in zip(entries, geocoder.lookup(lats, lons)):
+        if result is None:
+            continue
+        for field in ('postal_code', 'city', 'country', 'country_code'):
+            if field in entry and (overwrite or not entry[field]):
+                entry[field] = result[field]
+        filled += 1
+    return filled
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Fill city, postal code and country of a structured csv file from its coordinates, offline')
+    parser.add_argument('-d', '--dataset', type=str, required=True, help='localities: GeoNames postal codes dump (.txt) or structured csv')
+    parser.add_argument('-i', '--input', type=str, required=True, help='input structured csv filename')
+    parser.add_argument('-o', '--output', type=str, required=True, help='output structured csv filename')
+    parser.add_argument('--overwrite', action='store_true', help='replace the fields already filled')
+    parser.add_argument('-v', '--version', action='version', version='1.0')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    geocoder = ReverseGeocoder.load(args.dataset)
+
+    with open(args.input, newline='', encoding='utf-8-sig') as csv_inputfile:
+        csv_reader = csv.DictReader(csv_inputfile)
+        fieldnames = csv_reader.fieldnames
+        rows = list(csv_reader)
+
+    filled = fill(rows, geocoder, args.overwrite)
+
+    with open(args.output, 'w', newline='', encoding='utf-8') as csv_outputfile:
+        csv_writer = csv.DictWriter(csv_outputfile, fieldnames=fieldnames)
+        csv_writer.writeheader()
+        csv_writer.writerows(rows)
+
+    print('reverse geocoded {} of {} rows with {} localities'.format(filled, len(rows), len(geocoder)))
+
+if __name__ == '__main__':
+    main()
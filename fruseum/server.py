@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+import argparse
+import bisect
+import csv
+import glob
+import json
+import os
+import os.path
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from fruseum.classifier import normalize_name
+from fruseum.spatial import SpatialIndex, parse_coordinate
+
+# Read-only json api over the generated csv files. They are loaded once into
+# tuples and indexes (dicts of positions, a sorted name table for prefix
+# searches and the spatial grid index for bounding boxes), then reloaded in
+# the background when a pipeline run replaces them.
+FIELDS = ('id', 'osm_id', 'name', 'street', 'postal_code', 'city', 'department', 'country_code',
+          'lat', 'lon', 'website', 'phone', 'tags', 'source')
+FIELD = {field: position for position, field in enumerate(FIELDS)}
+ATTENDANCE = ('payant', 'gratuit', 'total')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Serve the museum csv files as a read-only json api')
+    parser.add_argument('-l', '--localisation', type=str, default='localisation/data/liste-et-localisation-des-musees-de-france.csv', help='structured localisation csv filename')
+    parser.add_argument('-m', '--osm', type=str, nargs='*', default=None, help='osm csv filenames (default: osm/tag-museums/*-museums.csv)')
+    parser.add_argument('-f', '--frequentation', type=str, default='frequentation/data', help='directory of the by year frequentation files')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='address to listen on')
+    parser.add_argument('-p', '--port', type=int, default=8000, help='port to listen on')
+    parser.add_argument('-r', '--reload-interval', type=float, default=5.0, help='seconds between two checks of the files (0: never reload)')
+    parser.add_argument('-v', '--version', action='version', version='1.0')
+    return parser.parse_args()
+
+def department(postal_code):
+    # Département code of a french postal code (2A/2B in Corsica, 3 digits overseas)
+    if not postal_code or len(postal_code) != 5 or not postal_code.isdigit():
+        return ''
+    if postal_code.startswith(('97', '98')):
+        return postal_code[:3]
+    if postal_code.startswith('20'):
+        return '2A' if postal_code < '20200' else '2B'
+    return postal_code[:2]
+
+def parse_stats(stats):
+    # (payant, gratuit, total) of a "payant:1;gratuit:2;total:3" stats field, None when empty
+    values = dict(item.split(':', 1) for item in stats.split(';') if ':' in item)
+    return tuple(int(values[key]) if values.get(key, '').isdigit() else None for key in ATTENDANCE)
+
+class MuseumIndexes:
+    def __init__(self, records, attendance):
+        self.records = records
+        self.attendance = attendance
+        self.by_id = {}
+        self.by_osm_id = {}
+        self.by_city = {}
+        self.by_department = {}
+        names = []
+        for position, record in enumerate(records):
+            if record[FIELD['id']]:
+                self.by_id.setdefault(record[FIELD['id']], []).append(position)
+            if record[FIELD['osm_id']]:
+                self.by_osm_id.setdefault(record[FIELD['osm_id']], []).append(position)
+            if record[FIELD['city']]:
+                self.by_city.setdefault(normalize_name(record[FIELD['city']]), []).append(position)
+            if record[FIELD['department']]:
+                self.by_department.setdefault(record[FIELD['department']], []).append(position)
+            # Every word of the name starts an entry, so "louvre" finds "Musée du Louvre"
+            words = normalize_name(record[FIELD['name']]).split()
+            for start in range(len(words)):
+                names.append((' '.join(words[start:]), position))
+        names.sort()
+        self.name_keys = [name for name, _ in names]
+        self.name_positions = [position for _, position in names]
+
+        located = [position for position, record in enumerate(records) if record[FIELD['lat']] is not None]
+        self.spatial = SpatialIndex([records[position][FIELD['lat']] for position in located],
+                                    [records[position][FIELD['lon']] for position in located],
+                                    [str(position) for position in located], [''] * len(located),
+                                    [0] * len(located), ['records'])
+        self.loaded = time.time()
+
+    @classmethod
+    def load(cls, localisation, osm_files, frequentation):
+        records = []
+        for source, filename, id_column in [('localisation', localisation, 'id')] + [(os.path.basename(osm), osm, 'musee_id') for osm in osm_files]:
+            with open(filename, newline='', encoding='utf-8-sig') as csv_inputfile:
+                for row in csv.DictReader(csv_inputfile):
+                    lat, lon = parse_coordinate(row.get('lat')), parse_coordinate(row.get('lon'))
+                    located = lat == lat and lon == lon
+                    records.append((
+                        row.get(id_column) or '', row.get('osm_id') or '', row.get('name') or '', row.get('street') or '',
+                        row.get('postal_code') or '', row.get('city') or '', department(row.get('postal_code')),
+                        row.get('country_code') or '', lat if located else None, lon if located else None,
+                        row.get('website') or '', row.get('phone') or '', row.get('tags') or '', source))
+
+        # {museum id: [(year, payant, gratuit, total)]}, by year
+        attendance = {}
+        for filename in sorted(glob.glob(os.path.join(frequentation, 'frequentation-des-musees-de-france-pour-*.csv'))):
+            with open(filename, newline='', encoding='utf-8-sig') as csv_inputfile:
+                for row in csv.DictReader(csv_inputfile):
+                    if row.get('id') and row.get('year', '').isdigit():
+                        attendance.setdefault(row['id'], []).append((int(row['year']),) + parse_stats(row.get('stats') or ''))
+        for history in attendance.values():
+            history.sort()
+        return cls(records, attendance)
+
+    def record(self, position):
+        return dict(zip(FIELDS, self.records[position]))
+
+    def records_at(self, positions, limit):
+        return [self.record(position) for position in positions[:limit]]
+
+    def name_prefix(self, prefix, limit):
+        # Museums with a word of the name starting with the prefix, without duplicates
+        prefix = ' '.join(normalize_name(prefix).split())
+        positions = []
+        seen = set()
+        start = bisect.bisect_left(self.name_keys, prefix)
+        for i in range(start, len(self.name_keys)):
+            if not self.name_keys[i].startswith(prefix) or len(positions) >= limit:
+                break
+            position = self.name_positions[i]
+            if position not in seen:
+                seen.add(position)
+                positions.append(position)
+        return [self.record(position) for position in positions]
+
+    def bbox(self, min_lat, min_lon, max_lat, max_lon, limit):
+        found = self.spatial.bbox(min_lat, min_lon, max_lat, max_lon)
+        return [self.record(int(result['id'])) for result in found[:limit]]
+
+    def history(self, museum_id):
+        return [dict(zip(('year',) + ATTENDANCE, entry)) for entry in self.attendance.get(museum_id, [])]
+
+    def status(self):
+        return {
+            'records': len(self.records),
+            'museums_with_attendance': len(self.attendance),
+            'loaded': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.loaded)),
+        }
+
+class MuseumServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, localisation, osm_files, frequentation, reload_interval=5.0):
+        self.localisation = localisation
+        self.osm_files = osm_files
+        self.frequentation = frequentation
+        self.signature = self.files_signature()
+        self.indexes = MuseumIndexes.load(localisation, osm_files, frequentation)
+        self.reload_interval = reload_interval
+        super().__init__(address, QueryHandler)
+
+    def files_signature(self):
+        # Size and modification time of every served file
+        filenames = [self.localisation] + list(self.osm_files)
+        filenames += sorted(glob.glob(os.path.join(self.frequentation, 'frequentation-des-musees-de-france-pour-*.csv')))
+        signature = []
+        for filename in filenames:
+            try:
+                stat = os.stat(filename)
+                signature.append((filename, stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                signature.append((filename, None, None))
+        return signature
+
+    def watch(self):
+        # Build the new indexes aside, then swap them: requests keep the
+        # indexes they started with, a failed load keeps the old ones and
+        # never stops the watching thread
+        while True:
+            time.sleep(self.reload_interval)
+            try:
+                signature = self.files_signature()
+                if signature == self.signature:
+                    continue
+                indexes = MuseumIndexes.load(self.localisation, self.osm_files, self.frequentation)
+            except Exception as error:
+                print('reload failed, keeping the previous data: {!r}'.format(error), file=sys.stderr, flush=True)
+                continue
+            self.indexes = indexes
+            self.signature = signature
+            print('reloaded {} records'.format(len(indexes.records)), flush=True)
+
+    def start_watching(self):
+        if self.reload_interval > 0:
+            threading.Thread(target=self.watch, daemon=True).start()
+
+class QueryHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, without Nagle keep-alive answers are not delayed
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        parts = [urllib.parse.unquote(part) for part in url.path.strip('/').split('/')]
+        indexes = self.server.indexes
+        try:
+            limit = min(max(1, int(params.get('limit', 50))), 1000)
+            endpoint = parts[0]
+            if endpoint == 'museum' and len(parts) == 2:
+                return self.found(indexes.records_at(indexes.by_id.get(parts[1], []), limit))
+            if endpoint == 'osm' and len(parts) == 2:
+                return self.found(indexes.records_at(indexes.by_osm_id.get(parts[1], []), limit))
+            if endpoint == 'search' and params.get('name'):
+                return self.reply(200, indexes.name_prefix(params['name'], limit))
+            if endpoint == 'city' and len(parts) == 2:
+                return self.reply(200, indexes.records_at(indexes.by_city.get(normalize_name(parts[1]), []), limit))
+            if endpoint == 'department' and len(parts) == 2:
+                return self.reply(200, indexes.records_at(indexes.by_department.get(parts[1].upper(), []), limit))
+            if endpoint == 'bbox':
+                box = [float(params[key]) for key in ('south', 'west', 'north', 'east')]
+                return self.reply(200, indexes.bbox(*box, limit))
+            if endpoint == 'attendance' and len(parts) == 2:
+                history = indexes.history(parts[1])
+                return self.found(history)
+            if endpoint == 'status':
+                return self.reply(200, indexes.status())
+        except (KeyError, ValueError):
+            return self.reply(400, {'error': 'invalid parameters'})
+        return self.reply(404, {'error': 'unknown endpoint'})
+
+    def found(self, results):
+        if not results:
+            return self.reply(404, {'error': 'not found'})
+        return self.reply(200, results)
+
+    def reply(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    args = parse_args()
+    osm_files = sorted(args.osm if args.osm is not None else glob.glob('osm/tag-museums/*-museums.csv'))
+    server = MuseumServer((args.host, args.port), args.localisation, osm_files, args.frequentation, args.reload_interval)
+    server.start_watching()
+    print('serving {} records on http://{}:{}'.format(len(server.indexes.records), *server.server_address[:2]), flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import math
+import os.path
+import numpy as np
+
+# Grid index over museum coordinates: points are sorted by grid cell (rows of
+# latitude, then longitude) so that the points of a row of cells are a
+# contiguous slice found by binary search. Radius, bounding box and k nearest
+# neighbours queries only look at the cells they cover.
+EARTH_RADIUS = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS / 180
+
+def haversine(lat, lon, lats, lons):
+    # Distances in km from one point to arrays of points
+    lat, lon, lats, lons = np.radians(lat), np.radians(lon), np.radians(lats), np.radians(lons)
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def parse_coordinate(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+class SpatialIndex:
+    def __init__(self, lats, lons, labels, names, sources, source_names, cell_size=0.05):
+        self.cell_size = float(cell_size)
+        self.columns = int(math.ceil(360 / self.cell_size)) + 1
+        self.source_names = list(source_names)
+
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        keys = self.cell_keys(lats, lons)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.lats = lats[order]
+        self.lons = lons[order]
+        self.labels = np.asarray(labels, dtype=str)[order]
+        self.names = np.asarray(names, dtype=str)[order]
+        self.sources = np.asarray(sources, dtype=np.int16)[order]
+
+    @classmethod
+    def from_csv(cls, filenames, cell_size=0.05):
+        # Index the rows with coordinates of the structured csv files, labelled by
+        # their id (Musées de France) or osm_id (osm)
+        lats, lons, labels, names, sources = [], [], [], [], []
+        for source, filename in enumerate(filenames):
+            with open(filename, newline='', encoding='utf-8-sig') as csv_inputfile:
+                csv_reader = csv.DictReader(csv_inputfile)
+                label = 'id' if 'id' in csv_reader.fieldnames else 'osm_id'
+                for row in csv_reader:
+                    lat, lon = parse_coordinate(row.get('lat')), parse_coordinate(row.get('lon'))
+                    if math.isnan(lat) or math.isnan(lon):
+                        continue
+                    lats.append(lat)
+                    lons.append(lon)
+                    labels.append(row[label])
+                    names.append(row.get('name') or '')
+                    sources.append(source)
+        source_names = [os.path.basename(filename) for filename in filenames]
+        return cls(lats, lons, labels, names, sources, source_names, cell_size)
+
+    def save(self, filename):
+        np.savez(filename, lats=self.lats, lons=self.lons, labels=self.labels, names=self.names,
+                 sources=self.sources, source_names=np.asarray(self.source_names, dtype=str),
+                 cell_size=np.float64(self.cell_size))
+
+    @classmethod
+    def load(cls, filename):
+        # The points are saved sorted, the grid is rebuilt without any parsing
+        with np.load(filename) as data:
+            index = cls.__new__(cls)
+            index.cell_size = float(data['cell_size'])
+            index.columns = int(math.ceil(360 / index.cell_size)) + 1
+            index.source_names = [str(name) for name in data['source_names']]
+            index.lats = data['lats']
+            index.lons = data['lons']
+            index.labels = data['labels']
+            index.names = data['names']
+            index.sources = data['sources']
+            index.keys = index.cell_keys(index.lats, index.lons)
+        return index
+
+    def __len__(self):
+        return len(self.lats)
+
+    def cell_keys(self, lats, lons):
+        rows = np.floor((np.asarray(lats) + 90) / self.cell_size).astype(np.int64)
+        columns = np.floor((np.asarray(lons) + 180) / self.cell_size).astype(np.int64)
+        return rows * self.columns + columns
+
+    def candidates(self, min_lat, min_lon, max_lat, max_lon):
+        # Positions of the points in the cells covering the bounding box
+        min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+        min_lon, max_lon = max(min_lon, -180.0), min(max_lon, 180.0)
+        first_row = int(math.floor((min_lat + 90) / self.cell_size))
+        last_row = int(math.floor((max_lat + 90) / self.cell_size))
+        first_column = int(math.floor((min_lon + 180) / self.cell_size))
+        last_column = int(math.floor((max_lon + 180) / self.cell_size))
+        rows = np.arange(first_row, last_row + 1, dtype=np.int64) * self.columns
+        starts = np.searchsorted(self.keys, rows + first_column, side='left')
+        ends = np.searchsorted(self.keys, rows + last_column, side='right')
+        if len(starts) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+
+    def result(self, positions, distances=None):
+        results = []
+        for rank, position in enumerate(positions):
+            result = {
+                'id': str(self.labels[position]),
+                'name': str(self.names[position]),
+                'source': self.source_names[self.sources[position]],
+                'lat': float(self.lats[position]),
+                'lon': float(self.lons[position]),
+            }
+            if distances is not None:
+                result['distance'] = float(distances[rank])
+            results.append(result)
+        return results
+
+    def bbox(self, min_lat, min_lon, max_lat, max_lon):
+        # Points inside the bounding box
+        positions = self.candidates(min_lat, min_lon, max_lat, max_lon)
+        lats, lons = self.lats[positions], self.lons[positions]
+        inside = (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+        return self.result(positions[inside])
+
+    def radius_positions(self, lat, lon, km):
+        lat_span = km / KM_PER_DEGREE
+        lon_span = km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+        positions = self.candidates(lat - lat_span, lon - lon_span, lat + lat_span, lon + lon_span)
+        distances = haversine(lat, lon, self.lats[positions], self.lons[positions])
+        keep = distances <= km
+        positions, distances = positions[keep], distances[keep]
+        order = np.argsort(distances, kind='stable')
+        return positions[order], distances[order]
+
+    def radius(self, lat, lon, km):
+        # Points within km of (lat, lon), nearest first
+        return self.result(*self.radius_positions(lat, lon, km))
+
+    def knn(self, lat, lon, k=1, max_km=20000.0):
+        # k nearest points: radius searches over a growing radius, a radius
+        # search being exact, the k nearest found within it are the k nearest
+        km = self.cell_size * KM_PER_DEGREE
+        k = min(k, len(self))
+        while True:
+            positions, distances = self.radius_positions(lat, lon, km)
+            if len(positions) >= k or km >= max_km:
+                return self.result(positions[:k], distances[:k])
+            km *= 2
+
+    def knn_many(self, lats, lons, k=1):
+        return [self.knn(lat, lon, k) for lat, lon in zip(lats, lons)]
+
+    def radius_many(self, lats, lons, km):
+        return [self.radius(lat, lon, km) for lat, lon in zip(lats, lons)]
+
+    def bbox_many(self, boxes):
+        return [self.bbox(*box) for box in boxes]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Build a spatial index of museum coordinates from structured csv files')
+    parser.add_argument('input', type=str, nargs='+', help='structured csv filenames (lat and lon columns)')
+    parser.add_argument('-o', '--output', type=str, required=True, help='output index filename (.npz)')
+    parser.add_argument('-c', '--cell-size', type=float, default=0.05, help='grid cell size, in degrees')
+    parser.add_argument('-v', '--version', action='version', version='1.0')
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    index = SpatialIndex.from_csv(args.input, cell_size=args.cell_size)
+    index.save(args.output)
+    print('indexed {} museums to {}'.format(len(index), args.output))
+
+if __name__ == '__main__':
+    main()
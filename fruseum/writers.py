@@ -0,0 +1,262 @@
+import csv
+import gzip
+import io
+import json
+import operator
+import os
+
+# Output layer shared by the converters: compact row objects (one slot per
+# field instead of a dict per row) and streaming encoders for csv, json lines
+# and GeoJSON, optionally gzip or zstd compressed. Compressed outputs are
+# written as a sequence of independent gzip members or zstd frames, which
+# decompress as a single stream, so that batches can be appended and a
+# checkpointed output truncated back to its last commit.
+BASE_FORMATS = ('csv', 'jsonl', 'geojson')
+COMPRESSIONS = {'': None, '.gz': 'gzip', '.zst': 'zstd'}
+FORMATS = tuple(base + suffix for base in BASE_FORMATS for suffix in COMPRESSIONS)
+
+class Row:
+    # Base of the row types made by row_type(), read and written like a dict
+    __slots__ = ()
+    fields = ()
+
+    def __init__(self):
+        for field in self.fields:
+            setattr(self, field, None)
+
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def __setitem__(self, field, value):
+        try:
+            setattr(self, field, value)
+        except AttributeError:
+            raise KeyError(field) from None
+
+    def __contains__(self, field):
+        return field in self.fields
+
+    def get(self, field, default=None):
+        return getattr(self, field, default)
+
+    def keys(self):
+        return self.fields
+
+    def values(self):
+        return tuple(getattr(self, field) for field in self.fields)
+
+    def items(self):
+        return zip(self.fields, self.values())
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join('{}={!r}'.format(field, value) for field, value in self.items()))
+
+def row_type(fields, name='Entry'):
+    return type(name, (Row,), {'__slots__': tuple(fields), 'fields': tuple(fields)})
+
+def parse_format(output_format):
+    # ('csv', 'gzip') for 'csv.gz'
+    for suffix, compression in COMPRESSIONS.items():
+        base = output_format[:len(output_format) - len(suffix)] if suffix else output_format
+        if (not suffix or output_format.endswith(suffix)) and base in BASE_FORMATS:
+            return base, compression
+    raise ValueError('unknown output format {!r} (known: {})'.format(output_format, ', '.join(FORMATS)))
+
+def has_footer(output_format):
+    # Only GeoJSON has to be closed once every row is written
+    return parse_format(output_format)[0] == 'geojson'
+
+def output_name(filename, output_format):
+    # The .csv extension of an output filename replaced by the one of the format
+    if filename.endswith('.csv'):
+        return filename[:-len('.csv')] + '.' + output_format
+    return filename
+
+def zstd_module():
+    # zstd is in the standard library from python 3.14, in zstandard before
+    try:
+        from compression import zstd
+        return zstd
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        return zstandard
+    except ImportError as error:
+        raise ImportError('zstd outputs need python 3.14 or the zstandard package (pip install zstandard)') from error
+
+def compress(data, compression):
+    # One complete gzip member or zstd frame
+    if compression == 'gzip':
+        return gzip.compress(data, mtime=0)
+    if compression == 'zstd':
+        return zstd_module().compress(data)
+    return data
+
+def open_binary(filename, compression, mode='wb'):
+    # Binary file for writing ('wb') or appending ('ab') through the compression
+    if compression == 'gzip':
+        return gzip.GzipFile(filename, mode, mtime=0)
+    if compression == 'zstd':
+        return zstd_module().open(filename, mode)
+    return open(filename, mode)
+
+def open_text(filename):
+    # Read any of the formats, compressed or not, as text
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rt', encoding='utf-8-sig', newline='')
+    if filename.endswith('.zst'):
+        return zstd_module().open(filename, 'rt', encoding='utf-8-sig', newline='')
+    return open(filename, newline='', encoding='utf-8-sig')
+
+def row_values(fieldnames):
+    # Values of a row in the fieldnames order, through the slots for Row objects
+    attributes = operator.attrgetter(*fieldnames)
+    def values(row):
+        if isinstance(row, Row):
+            return attributes(row)
+        return [row.get(field) for field in fieldnames]
+    return values
+
+class CsvEncoder:
+    def __init__(self, out, fieldnames):
+        self.writer = csv.writer(out)
+        self.fieldnames = fieldnames
+        self.values = row_values(fieldnames)
+
+    def header(self):
+        self.writer.writerow(self.fieldnames)
+
+    def write(self, rows, first):
+        self.writer.writerows(self.values(row) for row in rows)
+
+    def footer(self):
+        pass
+
+class JsonLinesEncoder:
+    def __init__(self, out, fieldnames):
+        self.out = out
+        self.fieldnames = fieldnames
+        self.values = row_values(fieldnames)
+
+    def header(self):
+        pass
+
+    def write(self, rows, first):
+        self.out.write(''.join(json.dumps(dict(zip(self.fieldnames, self.values(row))), ensure_ascii=False) + '\n' for row in rows))
+
+    def footer(self):
+        pass
+
+def coordinate(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+class GeoJsonEncoder:
+    # FeatureCollection of points (from the lat and lon fields), one feature per line
+    def __init__(self, out, fieldnames):
+        self.out = out
+        self.fieldnames = fieldnames
+        self.values = row_values(fieldnames)
+        self.lat = fieldnames.index('lat') if 'lat' in fieldnames else None
+        self.lon = fieldnames.index('lon') if 'lon' in fieldnames else None
+
+    def header(self):
+        self.out.write('{"type": "FeatureCollection", "features": [\n')
+
+    def feature(self, row):
+        values = self.values(row)
+        geometry = None
+        if self.lat is not None and self.lon is not None:
+            lat, lon = coordinate(values[self.lat]), coordinate(values[self.lon])
+            if lat is not None and lon is not None:
+                geometry = {'type': 'Point', 'coordinates': [lon, lat]}
+        return json.dumps({'type': 'Feature', 'geometry': geometry, 'properties': dict(zip(self.fieldnames, values))}, ensure_ascii=False)
+
+    def write(self, rows, first):
+        features = [self.feature(row) for row in rows]
+        if features:
+            self.out.write(('' if first else ',\n') + ',\n'.join(features))
+
+    def footer(self):
+        self.out.write('\n]}\n')
+
+ENCODERS = {'csv': CsvEncoder, 'jsonl': JsonLinesEncoder, 'geojson': GeoJsonEncoder}
+
+class BatchEncoder:
+    # Batches of rows encoded to bytes, each batch compressed on its own
+    def __init__(self, fieldnames, output_format='csv'):
+        base, self.compression = parse_format(output_format)
+        self.buffer = io.StringIO()
+        self.encoder = ENCODERS[base](self.buffer, list(fieldnames))
+
+    def render(self, method, *args):
+        getattr(self.encoder, method)(*args)
+        data = self.buffer.getvalue().encode('utf-8')
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return compress(data, self.compression) if data else data
+
+    def header(self):
+        return self.render('header')
+
+    def rows(self, rows, first):
+        return self.render('write', rows, first)
+
+    def footer(self):
+        return self.render('footer')
+
+class RowWriter:
+    # Streaming writer of one output file. With append, rows are added to a
+    # file closed before (rows being the number of rows it already holds) and
+    # the header is not written again; the footer is only written by finish.
+    def __init__(self, filename, fieldnames, output_format='csv', append=False, rows=0):
+        base, compression = parse_format(output_format)
+        self.filename = filename
+        self.binary = open_binary(filename, compression, 'ab' if append else 'wb')
+        self.file = io.TextIOWrapper(self.binary, encoding='utf-8', newline='')
+        self.encoder = ENCODERS[base](self.file, list(fieldnames))
+        self.rows = rows
+        if not append:
+            self.encoder.header()
+
+    def writerow(self, row):
+        self.encoder.write((row,), self.rows == 0)
+        self.rows += 1
+
+    def writerows(self, rows):
+        rows = list(rows)
+        self.encoder.write(rows, self.rows == 0)
+        self.rows += len(rows)
+
+    def close(self, sync=False):
+        self.file.close()
+        if sync:
+            fd = os.open(self.filename, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def finish(self, sync=False):
+        self.encoder.footer()
+        self.close(sync)
+
+def read_rows(filename):
+    # Dicts of the rows of an output of any format, and its fieldnames
+    with open_text(filename) as input_file:
+        if '.geojson' in filename:
+            features = json.load(input_file)['features']
+            rows = [feature['properties'] for feature in features]
+            return (list(rows[0]) if rows else None), rows
+        if '.jsonl' in filename:
+            rows = [json.loads(line) for line in input_file if line.strip()]
+            return (list(rows[0]) if rows else None), rows
+        csv_reader = csv.DictReader(input_file)
+        rows = list(csv_reader)
+        return csv_reader.fieldnames, rows
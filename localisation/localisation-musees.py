@@ -2,12 +2,20 @@
 import argparse
 import csv
 import os.path
+import sys
 import json
-import geopy
-import unidecode
+import urllib.parse
 from geopy.geocoders import Nominatim
-from geopy.extra.rate_limiter import RateLimiter
-##import reverse_geocode
+from geopy.exc import GeocoderRateLimited, GeocoderTimedOut, GeocoderUnavailable
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fruseum.cache import DEFAULT_CACHE, GeoCache, normalize_query
+from fruseum.checkpoint import CheckpointedOutput
+from fruseum.classifier import classify
+from fruseum.geocoder import GeocodingEngine
+from fruseum import metrics as instrumentation
+from fruseum.writers import FORMATS, output_name, row_type
+
+metrics = instrumentation.Metrics('localisation')
 
 class bcolors:
     HEADER = '\033[95m'
@@ -23,118 +31,166 @@ class bcolors:
 def parse_args():
     parser = argparse.ArgumentParser(description='Convert messy liste-et-localisation-des-musees-de-france csv files to structured file')
     parser.add_argument('-i', '--input', type=str, required=True, help='input messy csv filename')
-    #parser.add_argument('-o', '--output', type=str, required=True, help='input structured csv filename')
+    parser.add_argument('-o', '--output', type=str, default='./data/liste-et-localisation-des-musees-de-france.csv', help='output structured csv filename')
+    parser.add_argument('--resume', action='store_true', help='resume an interrupted run, skipping the museums already written')
+    parser.add_argument('--commit-every', type=int, default=50, help='number of rows written to disk at once')
+    parser.add_argument('--reverse', type=str, default=None, help='fill postal code, city and country offline from this localities dataset (GeoNames .txt or structured csv)')
+    parser.add_argument('-c', '--cache', type=str, default=DEFAULT_CACHE, help='geocoding cache filename')
+    parser.add_argument('--cache-ttl', type=float, default=None, help='geocoding cache entries lifetime, in days')
+    parser.add_argument('--cache-size', type=int, default=None, help='maximum number of geocoding cache entries')
+    parser.add_argument('-f', '--format', type=str, choices=FORMATS, default='csv', help='output format, the .csv extension of the output being replaced by it')
+    parser.add_argument('-n', '--nominatim', type=str, default=None, help='nominatim server url (default: the public nominatim.openstreetmap.org)')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='number of geocoding requests in flight')
+    parser.add_argument('-r', '--rate', type=float, default=1.0, help='maximum number of geocoding requests per second')
+    parser.add_argument('--retries', type=int, default=3, help='number of retries on timeouts and rate limiting')
+    instrumentation.add_arguments(parser)
     parser.add_argument('-v', '--version', action='version', version='1.0')
     return parser.parse_args()
 
+# Output row, one slot per field instead of a dict per row (see fruseum/writers.py)
+Entry = row_type([
+    "id",
+    "osm_id",
+    "osm_type",
+    "name",
+    "number",
+    "street",
+    "postal_code",
+    "city",
+    "country",
+    "country_code",
+    "status",
+    "lat",
+    "lon",
+    "website",
+    "phone",
+    "fax",
+    "email",
+    "opening_days",
+    "closing_days",
+    "stats",
+    "tags",
+    "description",
+    "wikidata",
+])
+
 def create_entry():
-    return {
-        "id": None,
-        "osm_id": None,
-        "name": None,
-        "number": None,
-        "street": None,
-        "postal_code": None,
-        "city": None,
-        "country": None,
-        "country_code": None,
-        "status": None,
-        "lat": None,
-        "lon": None,
-        "website": None,
-        "phone": None,
-        "fax": None,
-        "email": None,
-        "stats": None,
-        "tags": None,
-        "description": None,
-        "wikidata": None
-    }
+    return Entry()
+
+def geocode(locator, cache, engine, query):
+    # Raw nominatim result for the query, or None, from the cache when possible
+    key = normalize_query(query)
+    found, raw = cache.get('search', key)
+    if found:
+        metrics.count('cache_hits')
+        return raw
+
+    metrics.count('cache_misses')
+    engine.limit()
+    with metrics.stage('geocode'):
+        location = locator.geocode(query, addressdetails=True)
+    metrics.count('geocode_requests')
+    raw = location.raw if hasattr(location, 'raw') else None
+    cache.set('search', key, raw)
+    return raw
+
+def locate(locator, cache, engine, row):
+    # Search the museum name and city, then only the significant words of the name
+    raw = geocode(locator, cache, engine, row[0] + ' ' + row[4])
+    if raw is not None:
+        return raw
+
+    words = row[0].replace(',', ' ')
+    words = words.replace('\'', ' ')
+    words = words.replace('’', ' ')
+    words = words.replace('-', ' ')
+    words = words.split()
+    words = ' '.join([w for w in words if (len(w) > 3 and len(w) < 7)])
+
+    metrics.debug(words + ' ' + row[4])
+    return geocode(locator, cache, engine, words + ' ' + row[4])
+
+def fill_location(entry, raw):
+    metrics.debug(raw)
+    json_dump = json.dumps(str(raw))
+    osmdata = json.loads(json_dump)
+
+    if 'osm_id' in osmdata: entry['osm_id'] = raw['osm_id']
+    if 'osm_type' in osmdata: entry['osm_type'] = raw['osm_type']
+    if 'lat' in osmdata: entry['lat'] = raw['lat']
+    if 'lon' in osmdata: entry['lon'] = raw['lon']
+    if 'house_number' in osmdata: entry['number'] = raw['address']['house_number']
+    if 'road' in osmdata: entry['street'] = raw['address']['road']
+    if 'postcode' in osmdata: entry['postal_code'] = raw['address']['postcode']
+    if 'village' in osmdata:
+        entry['city'] = raw['address']['village']
+    elif 'town' in osmdata:
+        entry['city'] = raw['address']['town']
+    elif 'municipality' in osmdata:
+        entry['city'] = raw['address']['municipality']
+    elif 'city' in osmdata:
+        entry['city'] = raw['address']['city']
+    else:
+        entry['city'] = ""
+    if 'country' in osmdata: entry['country'] = raw['address']['country']
+    if 'country_code' in osmdata:  entry['country_code'] = raw['address']['country_code']
 
 def main():
     args = parse_args()
-    locator = Nominatim(user_agent="fruseum-data/liste", timeout=10)
-
-    fieldnames = ['id', 'osm_id', 'name', 'number', 'street', 'postal_code', 'city', 'country', 'country_code',
+    args.output = output_name(args.output, args.format)
+    if args.nominatim:
+        nominatim = urllib.parse.urlsplit(args.nominatim)
+        locator = Nominatim(user_agent="fruseum-data/liste", timeout=10, domain=nominatim.netloc + nominatim.path.rstrip('/'), scheme=nominatim.scheme or 'https')
+    else:
+        locator = Nominatim(user_agent="fruseum-data/liste", timeout=10)
+    engine = GeocodingEngine(workers=args.workers, rate=args.rate, retries=args.retries,
+                             retry_on=(GeocoderTimedOut, GeocoderRateLimited, GeocoderUnavailable))
+    reverse = None
+    if args.reverse:
+        # numpy is only needed for the offline reverse geocoding
+        from fruseum.reverse import ReverseGeocoder, fill
+        reverse = ReverseGeocoder.load(args.reverse)
+    cache = GeoCache(args.cache, ttl=args.cache_ttl * 86400 if args.cache_ttl else None, max_entries=args.cache_size)
+
+    fieldnames = ['id', 'osm_id', 'osm_type', 'name', 'number', 'street', 'postal_code', 'city', 'country', 'country_code',
                     'status', 'lat', 'lon', 'website', 'phone', 'fax', 'email', 'opening_days', 'closing_days', 'stats',
                     'tags', 'description', 'wikidata']
 
     with open(args.input, newline='') as csv_inputfile:
+        # Count the rows for the progress line, the list being small
+        total = sum(1 for _ in csv.reader(csv_inputfile)) - 1
+        csv_inputfile.seek(0)
+
         csv_reader = csv.reader(csv_inputfile, delimiter=',', quotechar='"')
         headers = next(csv_reader, None)
 
+        output = CheckpointedOutput(args.output, fieldnames, resume=args.resume, batch_size=args.commit_every, output_format=args.format)
+        metrics.configure(instrumentation.level(args), total=max(0, total - len(output.ids)), report=args.report)
+        if output.resumed:
+            metrics.info(f"{bcolors.WARNING}Resuming after row #", output.offset, "with", len(output.ids), f"museums already written.{bcolors.ENDC}")
+
         num_rows = 0
         entry = create_entry()
 
-        for row in csv_reader:
-            print(f"{bcolors.OKGREEN}Row #", num_rows, f"{bcolors.ENDC}")
-            print(f"{bcolors.OKCYAN}Row data: ", row, f"{bcolors.ENDC}")
+        # Rows are geocoded concurrently but come back in the input order
+        rows = ((offset, row) for offset, row in enumerate(csv_reader, 1) if not output.done(row[1]))
+        for (offset, row), raw in engine.map(lambda item: locate(locator, cache, engine, item[1]), rows):
+            metrics.debug(f"{bcolors.OKGREEN}Row #", num_rows, f"{bcolors.ENDC}")
+            metrics.debug(f"{bcolors.OKCYAN}Row data: ", row, f"{bcolors.ENDC}")
 
             entry['id'] = row[1]
             entry['name'] = row[0]
 
-            location = locator.geocode(row[0] + ' ' + row[4], addressdetails=True)
-            if hasattr(location, 'raw'):
-                print(location.raw)
-                json_dump = json.dumps(str(location.raw))
-                osmdata = json.loads(json_dump)
-
-                if 'osm_id' in osmdata: entry['osm_id'] = location.raw['osm_id']
-                if 'lat' in osmdata: entry['lat'] = location.raw['lat']
-                if 'lon' in osmdata: entry['lon'] = location.raw['lon']
-                if 'house_number' in osmdata: entry['number'] = location.raw['address']['house_number']
-                if 'road' in osmdata: entry['street'] = location.raw['address']['road']
-                if 'postcode' in osmdata: entry['postal_code'] = location.raw['address']['postcode']
-                if 'village' in osmdata:
-                    entry['city'] = location.raw['address']['village']
-                elif 'town' in osmdata:
-                    entry['city'] = location.raw['address']['town']
-                elif 'municipality' in osmdata:
-                    entry['city'] = location.raw['address']['municipality']
-                elif 'city' in osmdata:
-                    entry['city'] = location.raw['address']['city']
-                else:
-                    entry['city'] = ""
-                if 'country' in osmdata: entry['country'] = location.raw['address']['country']
-                if 'country_code' in osmdata:  entry['country_code'] = location.raw['address']['country_code']
+            if raw is not None:
+                fill_location(entry, raw)
             else:
-                words = row[0].replace(',', ' ')
-                words = words.replace('\'', ' ')
-                words = words.replace('’', ' ')
-                words = words.replace('-', ' ')
-                words = words.split()
-                words = ' '.join([w for w in words if (len(w) > 3 and len(w) < 7)])
-
-                print(words + ' ' + row[4])
-                location = locator.geocode(words + ' ' + row[4], addressdetails=True)
-
-                if hasattr(location, 'raw'):
-                    print(location.raw)
-                    json_dump = json.dumps(str(location.raw))
-                    osmdata = json.loads(json_dump)
-
-                    if 'osm_id' in osmdata: entry['osm_id'] = location.raw['osm_id']
-                    if 'lat' in osmdata: entry['lat'] = location.raw['lat']
-                    if 'lon' in osmdata: entry['lon'] = location.raw['lon']
-                    if 'house_number' in osmdata: entry['number'] = location.raw['address']['house_number']
-                    if 'road' in osmdata: entry['street'] = location.raw['address']['road']
-                    if 'postcode' in osmdata: entry['postal_code'] = location.raw['address']['postcode']
-                    if 'village' in osmdata:
-                        entry['city'] = location.raw['address']['village']
-                    elif 'town' in osmdata:
-                        entry['city'] = location.raw['address']['town']
-                    elif 'municipality' in osmdata:
-                        entry['city'] = location.raw['address']['municipality']
-                    elif 'city' in osmdata:
-                        entry['city'] = location.raw['address']['city']
-                    else:
-                        entry['city'] = ""
-                    if 'country' in osmdata: entry['country'] = location.raw['address']['country']
-                    if 'country_code' in osmdata:  entry['country_code'] = location.raw['address']['country_code']
-                else:
-                    entry['city'] = row[4]
-                    entry['country'] = 'France'
-                    entry['country_code'] = 'fr'
+                entry['city'] = row[4]
+                entry['country'] = 'France'
+                entry['country_code'] = 'fr'
+
+            # Offline reverse geocoding of the fields nominatim did not fill
+            if reverse is not None:
+                fill([entry], reverse)
 
             entry['phone'] = row[5]
             entry['fax'] = row[6]
@@ -152,49 +208,9 @@ def main():
             else:
                 entry['status'] = 'open'
 
-            # Create automatic tags with the name of the museum
-            # type:ecomusee
-            name = unidecode.unidecode(row[0])
-            name = name.casefold()
-            print(name)
-            if 'archeologique' in name:
-                entry['tags'] = entry['tags'] + ';type:musee archeologique;art:prehistoire'
-            elif 'antique' in name:
-                entry['tags'] = entry['tags'] + ';type:musee archeologique;art:antiquite'
-            elif 'arts decoratifs' in name:
-                entry['tags'] = entry['tags'] + ';type:musee d\'arts decoratifs'
-            elif 'agricole' in name:
-                entry['tags'] = entry['tags'] + ';type:musee technique et industriel'
-            elif 'outil' in name:
-                entry['tags'] = entry['tags'] + ';type:musee technique et industriel'
-            elif 'ouvrier' in name:
-                entry['tags'] = entry['tags'] + ';type:musee d\'arts populaires'
-            elif 'populaire' in name:
-                entry['tags'] = entry['tags'] + ';type:musee d\'arts populaires'
-            elif 'prehistoire' in name:
-                entry['tags'] = entry['tags'] + ';type:musee archeologique;art:prehistoire'
-            elif 'atelier' in name:
-                entry['tags'] = entry['tags'] + ';type:atelier d\'artiste'
-            elif 'beaux-arts' in name:
-                entry['tags'] = entry['tags'] + ';type:musee de beaux-arts'
-            elif 'ecomusee' in name:
-                entry['tags'] = entry['tags'] + ';type:ecomusee'
-            elif 'geologie' in name:
-                entry['tags'] = entry['tags'] + ';type:musee d\'histoire naturelle'
-            elif 'industrie' in name:
-                entry['tags'] = entry['tags'] + ';type:musee technique et industriel'
-            elif 'technique' in name:
-                entry['tags'] = entry['tags'] + ';type:musee technique et industriel'
-            elif 'histoire' in name:
-                entry['tags'] = entry['tags'] + ';type:musee historique'
-            elif 'historique' in name:
-                entry['tags'] = entry['tags'] + ';type:musee historique'
-            elif 'museum' in name:
-                entry['tags'] = entry['tags'] + ';type:museum'
-            elif 'musee' in name:
-                entry['tags'] = entry['tags'] + ';type:musee'
-            else:
-                entry['tags'] = entry['tags'] + ';type:a classer'
+            # Create automatic tags with the name of the museum (see fruseum/classifier.py)
+            with metrics.stage('classify'):
+                entry['tags'] = entry['tags'] + ';' + classify(row[0])
 
             if row[11] and row[12]:
                 entry['stats'] = 'label-date:' + row[11] + ';' + 'unlabel-date:' + row[12]
@@ -205,21 +221,19 @@ def main():
             else:
                 entry['stats'] = ''
 
-            output_file = './data/liste-et-localisation-des-musees-de-france.csv'
-            if os.path.isfile(output_file):
-                with open(output_file, 'a+', newline='') as csv_outputfile:
-                    csv_writer = csv.DictWriter(csv_outputfile, fieldnames=fieldnames)
-                    csv_writer.writerow(entry)
-            else:
-                with open(output_file, 'a+', newline='') as csv_outputfile:
-                    csv_writer = csv.DictWriter(csv_outputfile, fieldnames=fieldnames)
-                    csv_writer.writeheader()
-                    csv_writer.writerow(entry)
+            with metrics.stage('write'):
+                output.writerow(row[1], entry, offset)
 
             num_rows += 1
+            metrics.row()
             entry = create_entry()
 
-        print('wrote {} rows.'.format(num_rows))
+        output.close()
+        metrics.info('wrote {} rows to {}.'.format(num_rows, args.output))
+        metrics.info(engine.summary())
+        metrics.info(cache.summary())
+        cache.close()
+        metrics.close()
 
 if __name__ == '__main__':
     main()
@@ -1,9 +1,24 @@
 #!/usr/bin/env python3
 import argparse
-import unicodecsv as csv
+import bz2
+import gzip
+import os
+import os.path
+import sys
 import urllib3.request
 import json
 import xml.etree.ElementTree as ET
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fruseum.cache import DEFAULT_CACHE, GeoCache
+from fruseum.checkpoint import CheckpointedOutput
+from fruseum.classifier import UNCLASSIFIED, classify_all
+from fruseum.geometry import NodeIndex, format_coordinate, relation_centroid, way_centroid
+from fruseum.pbf import read_elements as read_pbf_elements
+from fruseum.geocoder import GeocodingEngine, RetryableError
+from fruseum import metrics as instrumentation
+from fruseum.writers import FORMATS, RowWriter, output_name, read_rows, row_type
+
+metrics = instrumentation.Metrics('osm2csv')
 
 class bcolors:
     HEADER = '\033[95m'
@@ -18,161 +33,495 @@ class bcolors:
 
 def parse_args():
     parser = argparse.ArgumentParser(description='Convert museum osm files to csv')
-    parser.add_argument('-i', '--input', type=str, required=True, help='input osm xml filename')
+    parser.add_argument('-i', '--input', type=str, required=True, help='input osm xml (.osm, .osm.bz2, .osm.gz) or pbf (.osm.pbf) filename')
     parser.add_argument('-o', '--output', type=str, required=True, help='output csv filename')
+    parser.add_argument('-u', '--update', action='store_true', help='apply the osmChange (.osc, .osc.gz) input to the existing output csv')
+    parser.add_argument('-s', '--stream', action='store_true', help='parse the osm xml incrementally, for country or planet sized files')
+    parser.add_argument('-p', '--pbf-workers', type=int, default=None, help='number of processes decoding a pbf input (default: one per cpu)')
+    parser.add_argument('--resume', action='store_true', help='resume an interrupted run, skipping the osm ids already written')
+    parser.add_argument('--commit-every', type=int, default=50, help='number of rows written to disk at once')
+    parser.add_argument('-b', '--batch-size', type=int, default=50, help='number of osm ids sent in each nominatim lookup request (max 50)')
+    parser.add_argument('-n', '--nominatim', type=str, default='https://nominatim.openstreetmap.org', help='nominatim server url')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='number of lookup requests in flight')
+    parser.add_argument('-r', '--rate', type=float, default=1.0, help='maximum number of lookup requests per second')
+    parser.add_argument('--retries', type=int, default=3, help='number of retries on timeouts and rate limiting')
+    parser.add_argument('--timeout', type=float, default=30, help='timeout of the nominatim requests, in seconds')
+    parser.add_argument('--reverse', type=str, default=None, help='fill postal code, city and country offline from this localities dataset (GeoNames .txt or structured csv)')
+    parser.add_argument('-c', '--cache', type=str, default=DEFAULT_CACHE, help='geocoding cache filename')
+    parser.add_argument('--cache-ttl', type=float, default=None, help='geocoding cache entries lifetime, in days')
+    parser.add_argument('--cache-size', type=int, default=None, help='maximum number of geocoding cache entries')
+    parser.add_argument('-f', '--format', type=str, choices=FORMATS, default='csv', help='output format, the .csv extension of the output being replaced by it')
+    instrumentation.add_arguments(parser)
     parser.add_argument('-v', '--version', action='version', version='1.0')
     return parser.parse_args()
 
+# Output row, one slot per field instead of a dict per row (see fruseum/writers.py)
+Entry = row_type([
+    "osm_id",
+    "osm_type",
+    "musee_id",
+    "name",
+    "number",
+    "street",
+    "postal_code",
+    "city",
+    "country",
+    "country_code",
+    "lat",
+    "lon",
+    "website",
+    "email",
+    "phone",
+    "fax",
+    "tags",
+    "description",
+    "date_added",
+    "wikidata_id",
+    "mhs_id",
+    "museofile_id",
+])
+
+# osm_type column of the output, named as by nominatim
+OSM_TYPES = {'N': 'node', 'W': 'way', 'R': 'relation'}
+
 def create_entry():
-    return {
-        "osm_id": None,
-        "musee_id": None,
-        "name": None,
-        "number": None,
-        "street": None,
-        "postal_code": None,
-        "city": None,
-        "country": None,
-        "country_code": None,
-        "lat": None,
-        "lon": None,
-        "website": None,
-        "email": None,
-        "phone": None,
-        "fax": None,
-        "tags": None,
-        "description": None,
-        "date_added": None,
-        "wikidata_id": None,
-        "mhs_id": None,
-        "museofile_id": None,
+    return Entry()
+
+def open_input(filename):
+    # Compressed extracts are decompressed on the fly
+    if filename.endswith('.bz2'):
+        return bz2.open(filename, 'rb')
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rb')
+    return open(filename, 'rb')
+
+def load_elements(filename):
+    # Load the whole tree once, the returned function yielding nodes first,
+    # ways and relations after, for each pass
+    with open_input(filename) as osm_file:
+        root = ET.parse(osm_file).getroot()
+    def elements():
+        for tag in ('node', 'way', 'relation'):
+            yield from root.iterfind(tag)
+    return elements
+
+def stream_elements(filename):
+    # Yield each node, way and relation as soon as it is closed, then drop it from the tree
+    # so that memory stays flat whatever the size of the input
+    with open_input(filename) as osm_file:
+        root = None
+        depth = 0
+        for event, element in ET.iterparse(osm_file, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element
+                depth += 1
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+            if element.tag in ('node', 'way', 'relation'):
+                yield element
+            element.clear()
+            root.clear()
+
+def read_element(node):
+    # Keep only what the conversion needs, the element itself may be cleared
+    # by the streaming parser before its batch is looked up
+    if node.find('tag') is None:
+        return None
+    element = {
+        'type': node.tag[0].upper(),
+        'id': node.get('id'),
+        'timestamp': node.get('timestamp'),
+        'tags': [(tag.get('k'), tag.get('v')) for tag in node.findall('tag')],
     }
+    if node.tag == 'node':
+        if node.get('lat') is not None:
+            element['lat'] = format_coordinate(node.get('lat'))
+            element['lon'] = format_coordinate(node.get('lon'))
+    elif node.tag == 'way':
+        element['refs'] = [nd.get('ref') for nd in node.findall('nd')]
+    else:
+        element['members'] = [(member.get('type')[0].upper(), member.get('ref'), member.get('role') or '') for member in node.findall('member')]
+    return element
 
-def main():
+def index_geometry(node, nodes, ways):
+    # Coordinates of every node and refs of every way of an osmChange file,
+    # untagged ones included
+    if node.tag == 'node' and node.get('lat') is not None:
+        nodes.add(node.get('id'), node.get('lat'), node.get('lon'))
+    elif node.tag == 'way':
+        ways[node.get('id')] = [nd.get('ref') for nd in node.findall('nd')]
 
-    args = parse_args()
-    #locator = Nominatim(user_agent="fruseumpy-data/osm", timeout=10)
+def locate_elements(parse, elements):
+    # Centroids of the museum ways and relations of an xml file: one pass for
+    # the member ways of the relations, one pass for the coordinates of the
+    # nodes they all use, every other node and way being skipped (query.sh
+    # keeps the nodes and ways used by the museums, not only the museums)
+    ways = {element['id']: element['refs'] for element in elements if element['type'] == 'W'}
+    member_ways = {member for element in elements if element['type'] == 'R'
+                   for member_type, member, _ in element['members'] if member_type == 'W'} - set(ways)
+    if member_ways:
+        for node in parse():
+            if node.tag == 'way' and node.get('id') in member_ways:
+                ways[node.get('id')] = [nd.get('ref') for nd in node.findall('nd')]
 
-    with open(args.output, 'wb') as csv_file:
+    wanted = set()
+    for refs in ways.values():
+        wanted.update(refs)
+    for element in elements:
+        if element['type'] == 'R':
+            wanted.update(member for member_type, member, _ in element['members'] if member_type == 'N')
 
-        fieldnames = ['osm_id', 'musee_id', 'name', 'number', 'street', 'postal_code',
-                      'city', 'country', 'country_code', 'lat', 'lon', 'website', 'email', 'phone', 'fax', 'tags', 'description', 'date_added',
-                      'wikidata_id', 'mhs_id', 'museofile_id']
-        csv_writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-        csv_writer.writeheader()
+    nodes = NodeIndex()
+    if wanted:
+        for node in parse():
+            if node.tag == 'node' and node.get('id') in wanted and node.get('lat') is not None:
+                nodes.add(node.get('id'), node.get('lat'), node.get('lon'))
+    nodes.sort()
 
-        num_rows = 0
-        entry = create_entry()
+    for element in elements:
+        locate_element(element, nodes, ways)
 
-        http = urllib3.PoolManager()
-        tree = ET.parse(args.input)
-        root = tree.getroot()
+def read_xml_elements(parse):
+    # Yield the tourism=museum elements of an xml file as dicts, nodes as soon
+    # as they are read, ways and relations once they are located. parse yields
+    # the xml elements again for each pass.
+    located = []
+    for node in parse():
+        with metrics.stage('parse'):
+            element = read_element(node)
+        if element is None or not is_museum(element):
+            continue
+        if element['type'] == 'N':
+            yield element
+        else:
+            located.append(element)
+    if located:
+        with metrics.stage('geometry'):
+            locate_elements(parse, located)
+        yield from located
 
-        # Node
-        for node in root.findall('node'):
-            print(f"{bcolors.OKGREEN}Row #", num_rows, f"{bcolors.ENDC}")
-            print(f"{bcolors.OKCYAN}Node :", node, f"{bcolors.ENDC}")
+def locate_element(element, nodes, ways):
+    # Local centroid of a way or a relation
+    if element['type'] == 'N' or element.get('lat') is not None:
+        return
+    if element['type'] == 'W':
+        centroid = way_centroid(element['refs'], nodes)
+    else:
+        centroid = relation_centroid(element['members'], ways, nodes)
+    if centroid is not None:
+        element['lat'] = format_coordinate(centroid[0])
+        element['lon'] = format_coordinate(centroid[1])
 
-            if node.find('tag') is None:
-                continue
+# Network errors retried by the geocoding engine
+RETRY_ON = (urllib3.exceptions.TimeoutError, urllib3.exceptions.ProtocolError, urllib3.exceptions.MaxRetryError)
 
-            entry['osm_id'] = node.get('id')
-            entry['date_added'] = node.get('timestamp')
-
-            osm_url = http.request('GET', 'https://nominatim.openstreetmap.org/lookup?format=jsonv2&addressdetails=1&extratags=1&namedetails=1&osm_ids=N' + node.get('id'))
-            osm_data = json.loads(osm_url.data.decode('utf-8'))
-
-            print(osm_data)
-            if (len(osm_data) > 0):
-                if 'name' in osm_data[0]['namedetails']: entry['name'] = osm_data[0]['namedetails']['name']
-
-                entry['lat'] = osm_data[0]['lat']
-                entry['lon'] = osm_data[0]['lon']
-                if 'house_number' in osm_data[0]['address']: entry['number'] = osm_data[0]['address']['house_number']
-                if 'road' in osm_data[0]['address']: entry['street'] = osm_data[0]['address']['road']
-                if 'postcode' in osm_data[0]['address']: entry['postal_code'] = osm_data[0]['address']['postcode']
-                if 'village' in osm_data[0]['address']:
-                    entry['city'] = osm_data[0]['address']['village']
-                elif 'town' in osm_data[0]['address']:
-                    entry['city'] = osm_data[0]['address']['town']
-                elif 'municipality' in osm_data[0]['address']:
-                    entry['city'] = osm_data[0]['address']['municipality']
-                elif 'city' in osm_data[0]['address']:
-                    entry['city'] = osm_data[0]['address']['city']
-                else:
-                    entry['city'] = ""
-                if 'country' in osm_data[0]['address']: entry['country'] = osm_data[0]['address']['country']
-                if 'country_code' in osm_data[0]['address']: entry['country_code'] = osm_data[0]['address']['country_code']
-
-                if 'type' in osm_data[0]:
-                    entry['tags'] = 'osm:museum;type:' + osm_data[0]['type']
-                else:
-                    entry['tags'] = 'osm:museum;type:a classer'
-
-            for tag in node.findall('tag'):
-                print(tag.get('v'))
-                if tag.get('k') == 'website': entry['website'] = tag.get('v')
-                if tag.get('k') == 'email': entry['email'] = tag.get('v')
-                if tag.get('k') == 'phone': entry['phone'] = tag.get('v')
-                if tag.get('k') == 'wikidata': entry['wikidata'] = tag.get('v')
-                if tag.get('k') == 'description': entry['description'] = tag.get('v')
+def connection_pool(workers, timeout):
+    # No retries inside urllib3 (they would end in a MaxRetryError, without
+    # the backoff of the engine) but a timeout on every request
+    return urllib3.PoolManager(maxsize=max(1, workers), retries=False,
+                               timeout=urllib3.Timeout(connect=timeout, read=timeout))
 
-            num_rows += 1
-            # add to csv
-            csv_writer.writerow(entry)
-            entry = create_entry()
+def lookup_batch(http, nominatim, engine, elements):
+    # One nominatim lookup request for the whole batch, results are keyed by type and id
+    osm_ids = ','.join(element['type'] + element['id'] for element in elements)
+    engine.limit()
+    with metrics.stage('lookup'):
+        osm_url = http.request('GET', nominatim + '/lookup?format=jsonv2&addressdetails=1&extratags=1&namedetails=1&osm_ids=' + osm_ids)
+    metrics.count('lookup_requests')
+    if osm_url.status in (429, 502, 503, 504):
+        metrics.count('lookup_retryable_errors')
+        retry_after = osm_url.headers.get('Retry-After')
+        raise RetryableError('nominatim answered {}'.format(osm_url.status), float(retry_after) if retry_after and retry_after.isdigit() else None)
+    osm_data = json.loads(osm_url.data.decode('utf-8'))
+
+    results = {}
+    for osm_item in osm_data:
+        if 'osm_type' not in osm_item or 'osm_id' not in osm_item:
+            continue
+        results[osm_item['osm_type'][0].upper() + str(osm_item['osm_id'])] = osm_item
+    return results
+
+def convert_element(element, osm_item):
+    entry = create_entry()
+    osm_type = element['type']
+
+    entry['osm_id'] = element['id']
+    entry['osm_type'] = OSM_TYPES[osm_type]
+    entry['date_added'] = element['timestamp']
+
+    metrics.debug(osm_item)
+    if osm_item is not None:
+        if 'name' in osm_item['namedetails']: entry['name'] = osm_item['namedetails']['name']
+
+        entry['lat'] = osm_item['lat']
+        entry['lon'] = osm_item['lon']
+        if 'house_number' in osm_item['address']: entry['number'] = osm_item['address']['house_number']
+        if 'road' in osm_item['address']: entry['street'] = osm_item['address']['road']
+        if 'postcode' in osm_item['address']: entry['postal_code'] = osm_item['address']['postcode']
+        if 'village' in osm_item['address']:
+            entry['city'] = osm_item['address']['village']
+        elif 'town' in osm_item['address']:
+            entry['city'] = osm_item['address']['town']
+        elif 'municipality' in osm_item['address']:
+            entry['city'] = osm_item['address']['municipality']
+        elif 'city' in osm_item['address']:
+            entry['city'] = osm_item['address']['city']
+        else:
+            entry['city'] = ""
+        if 'country' in osm_item['address']: entry['country'] = osm_item['address']['country']
+        if 'country_code' in osm_item['address']: entry['country_code'] = osm_item['address']['country_code']
+
+        if osm_type == 'N':
+            if 'type' in osm_item:
+                entry['tags'] = 'osm:museum;type:' + osm_item['type']
+            else:
+                entry['tags'] = 'osm:museum;type:a classer'
+
+    # Coordinates computed locally are preferred to nominatim's
+    if element.get('lat') is not None and element.get('lon') is not None:
+        entry['lat'] = element['lat']
+        entry['lon'] = element['lon']
+
+    for k, v in element['tags']:
+        metrics.debug(v)
+        if k == 'website': entry['website'] = v
+        if k == 'email': entry['email'] = v
+        if k == 'phone': entry['phone'] = v
+        if k == 'wikidata': entry['wikidata_id'] = v
+        if k == 'description': entry['description'] = v
+
+    if osm_type != 'N':
+        entry['tags'] = 'osm:museum;type:a classer'
+
+    return entry
 
-        # Ways
-        for node in root.findall('way'):
-            print(f"{bcolors.OKGREEN}Row #", num_rows, f"{bcolors.ENDC}")
-            print(f"{bcolors.OKCYAN}Node :", node, f"{bcolors.ENDC}")
+def iter_batches(elements, batch_size, output):
+    # Group the museums not written yet, in order, by batches of batch_size
+    batch = []
+    for offset, element in enumerate(elements, 1):
+        metrics.debug(f"{bcolors.OKCYAN}Node :", element, f"{bcolors.ENDC}")
+        if output.done(element['type'] + element['id']):
+            continue
+        element['offset'] = offset
 
-            if node.find('tag') is None:
+        batch.append(element)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def convert_batch(http, nominatim, cache, engine, elements, reverse=None):
+    # Only the ids missing from the cache are looked up, "no match" being cached too
+    results = {}
+    missing = []
+    for element in elements:
+        key = element['type'] + element['id']
+        found, osm_item = cache.get('lookup', key)
+        if found:
+            results[key] = osm_item
+        else:
+            missing.append(element)
+    metrics.count('cache_hits', len(elements) - len(missing))
+    metrics.count('cache_misses', len(missing))
+
+    requests = 0
+    if missing:
+        found_items = lookup_batch(http, nominatim, engine, missing)
+        requests += 1
+        for element in missing:
+            key = element['type'] + element['id']
+            results[key] = found_items.get(key)
+            cache.set('lookup', key, results[key])
+
+    entries = [convert_element(element, results.get(element['type'] + element['id'])) for element in elements]
+
+    # Tag the museums with the shared classifier, nominatim's type being kept
+    # when the name tells nothing
+    names = [entry['name'] or dict(element['tags']).get('name') for element, entry in zip(elements, entries)]
+    with metrics.stage('classify'):
+        classified_names = classify_all(names)
+    for entry, classified in zip(entries, classified_names):
+        if classified != UNCLASSIFIED:
+            entry['tags'] = 'osm:museum;' + classified
+
+    # Offline reverse geocoding of the fields nominatim did not fill
+    if reverse is not None:
+        from fruseum.reverse import fill
+        fill(entries, reverse)
+
+    return requests, entries
+
+def is_museum(element):
+    return ('tourism', 'museum') in element['tags']
+
+def read_changes(filename):
+    # Yield (action, element) of an osmChange file, action being create, modify
+    # or delete, elements being read incrementally and then dropped
+    with open_input(filename) as osc_file:
+        root = None
+        action = None
+        depth = 0
+        for event, element in ET.iterparse(osc_file, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = element
+                depth += 1
+                if depth == 2:
+                    action = element.tag
                 continue
+            depth -= 1
+            if depth == 2 and element.tag in ('node', 'way', 'relation'):
+                yield action, element
+                element.clear()
+            elif depth == 1:
+                element.clear()
+                root.clear()
+
+# Columns filled by hand in the outputs, kept by --update when the new row has no value
+LINKED_IDS = ('musee_id', 'mhs_id', 'museofile_id')
+
+def find_row(rows, key):
+    # Key of the existing row of an (osm_type, osm_id) key, None if there is
+    # none. Rows of outputs written before the osm_type column match any type.
+    if key in rows:
+        return key
+    if ('', key[1]) in rows:
+        return '', key[1]
+    return None
+
+def apply_changes(args, http, nominatim, cache, engine, reverse, fieldnames):
+    # Index the existing output by osm_type and osm_id (a node and a way may
+    # share an id), apply the created, modified and deleted tourism=museum
+    # elements, look up only those, then replace the output atomically
+    rows = {}
+    if os.path.isfile(args.output):
+        existing_fieldnames, existing_rows = read_rows(args.output)
+        if existing_fieldnames:
+            fieldnames = existing_fieldnames
+            if 'osm_type' not in fieldnames:
+                fieldnames.insert(fieldnames.index('osm_id') + 1, 'osm_type')
+        for row in existing_rows:
+            rows[row.get('osm_type') or '', row['osm_id']] = row
+
+    nodes = NodeIndex()
+    ways = {}
+    touched = {}
+    deleted = 0
+    for action, node in read_changes(args.input):
+        if action != 'delete':
+            index_geometry(node, nodes, ways)
+        element = read_element(node) if action != 'delete' else None
+        key = (node.tag, node.get('id'))
+        if element is not None and is_museum(element):
+            touched[key] = element
+            cache.delete('lookup', element['type'] + element['id'])
+        elif (action == 'delete' or element is not None) and (find_row(rows, key) or key in touched):
+            # Deleted, or tagged but no longer a museum (untagged nodes are only geometry)
+            rows.pop(find_row(rows, key), None)
+            touched.pop(key, None)
+            deleted += 1
+    nodes.sort()
+    for element in touched.values():
+        locate_element(element, nodes, ways)
+
+    num_requests = 0
+    batch_size = min(max(1, args.batch_size), 50)
+    elements = list(touched.values())
+    batches = [elements[start:start + batch_size] for start in range(0, len(elements), batch_size)]
+    for batch, (requests, entries) in engine.map(lambda batch: convert_batch(http, nominatim, cache, engine, batch, reverse), batches):
+        for element, entry in zip(batch, entries):
+            key = (entry['osm_type'], entry['osm_id'])
+            existing = find_row(rows, key)
+            row = rows.get(existing, {})
+            # Keep the ids linked by hand of the existing row, every other
+            # field comes from osm (a removed tag empties its column)
+            for field in LINKED_IDS:
+                if entry.get(field) is None and row.get(field):
+                    entry[field] = row[field]
+            # Written back in place of the existing row, new rows at the end
+            rows[existing if existing is not None else key] = entry
+        num_requests += requests
 
-            entry['osm_id'] = node.get('id')
-            entry['date_added'] = node.get('timestamp')
-
-            osm_url = http.request('GET', 'https://nominatim.openstreetmap.org/lookup?format=jsonv2&addressdetails=1&extratags=1&namedetails=1&osm_ids=W' + node.get('id'))
-            osm_data = json.loads(osm_url.data.decode('utf-8'))
-
-            print(osm_data)
-            if (len(osm_data) > 0):
-                if 'name' in osm_data[0]['namedetails']: entry['name'] = osm_data[0]['namedetails']['name']
-                entry['lat'] = osm_data[0]['lat']
-                entry['lon'] = osm_data[0]['lon']
-                if 'house_number' in osm_data[0]['address']: entry['number'] = osm_data[0]['address']['house_number']
-                if 'road' in osm_data[0]['address']: entry['street'] = osm_data[0]['address']['road']
-                if 'postcode' in osm_data[0]['address']: entry['postal_code'] = osm_data[0]['address']['postcode']
-                if 'village' in osm_data[0]['address']:
-                    entry['city'] = osm_data[0]['address']['village']
-                elif 'town' in osm_data[0]['address']:
-                    entry['city'] = osm_data[0]['address']['town']
-                elif 'municipality' in osm_data[0]['address']:
-                    entry['city'] = osm_data[0]['address']['municipality']
-                elif 'city' in osm_data[0]['address']:
-                    entry['city'] = osm_data[0]['address']['city']
-                else:
-                    entry['city'] = ""
-                if 'country' in osm_data[0]['address']: entry['country'] = osm_data[0]['address']['country']
-                if 'country_code' in osm_data[0]['address']: entry['country_code'] = osm_data[0]['address']['country_code']
-
-            for tag in node.findall('tag'):
-                print(tag.get('v'))
-                if tag.get('k') == 'website': entry['website'] = tag.get('v')
-                if tag.get('k') == 'email': entry['email'] = tag.get('v')
-                if tag.get('k') == 'phone': entry['phone'] = tag.get('v')
-                if tag.get('k') == 'wikidata': entry['wikidata'] = tag.get('v')
-                if tag.get('k') == 'description': entry['description'] = tag.get('v')
-
-            entry['tags'] = 'osm:museum;type:a classer'
+    tmp_file = args.output + '.tmp'
+    writer = RowWriter(tmp_file, fieldnames, args.format)
+    writer.writerows(rows.values())
+    writer.finish(sync=True)
+    os.replace(tmp_file, args.output)
+    metrics.row(len(rows))
+    metrics.count('created_or_modified', len(touched))
+    metrics.count('deleted', deleted)
 
+    metrics.info('updated {} with {} created or modified and {} deleted museums, {} lookup requests'.format(args.output, len(touched), deleted, num_requests))
+
+def main():
+
+    args = parse_args()
+    args.output = output_name(args.output, args.format)
+    metrics.configure(instrumentation.level(args), report=args.report)
+    #locator = Nominatim(user_agent="fruseumpy-data/osm", timeout=10)
+
+    fieldnames = ['osm_id', 'osm_type', 'musee_id', 'name', 'number', 'street', 'postal_code',
+                  'city', 'country', 'country_code', 'lat', 'lon', 'website', 'email', 'phone', 'fax', 'tags', 'description', 'date_added',
+                  'wikidata_id', 'mhs_id', 'museofile_id']
+
+    http = connection_pool(args.workers, args.timeout)
+    cache = GeoCache(args.cache, ttl=args.cache_ttl * 86400 if args.cache_ttl else None, max_entries=args.cache_size)
+    engine = GeocodingEngine(workers=args.workers, rate=args.rate, retries=args.retries,
+                             retry_on=RETRY_ON)
+    nominatim = args.nominatim.rstrip('/')
+    reverse = None
+    if args.reverse:
+        # numpy is only needed for the offline reverse geocoding
+        from fruseum.reverse import ReverseGeocoder
+        reverse = ReverseGeocoder.load(args.reverse)
+
+    if args.update:
+        apply_changes(args, http, nominatim, cache, engine, reverse, fieldnames)
+        metrics.info(engine.summary())
+        metrics.info(cache.summary())
+        cache.close()
+        metrics.close()
+        return
+
+    output = CheckpointedOutput(args.output, fieldnames, resume=args.resume, batch_size=args.commit_every, output_format=args.format)
+    if output.resumed:
+        metrics.info(f"{bcolors.WARNING}Resuming after element #", output.offset, "with", len(output.ids), f"osm ids already written.{bcolors.ENDC}")
+
+    num_rows = 0
+    num_requests = 0
+    batch_size = min(max(1, args.batch_size), 50)
+    if args.input.endswith('.pbf'):
+        # tourism=museum nodes, ways and relations filtered in a single pass
+        elements = read_pbf_elements(args.input, workers=args.pbf_workers)
+    elif args.stream:
+        # Each pass parses the file again, memory staying flat
+        elements = read_xml_elements(lambda: stream_elements(args.input))
+    else:
+        elements = read_xml_elements(load_elements(args.input))
+
+    # Nodes, then ways: batches are looked up concurrently but written in order
+    batches = iter_batches(elements, batch_size, output)
+    for batch, (requests, entries) in engine.map(lambda batch: convert_batch(http, nominatim, cache, engine, batch, reverse), batches):
+        for element, entry in zip(batch, entries):
+            metrics.debug(f"{bcolors.OKGREEN}Row #", num_rows, f"{bcolors.ENDC}")
             num_rows += 1
             # add to csv
-            csv_writer.writerow(entry)
-            entry = create_entry()
+            with metrics.stage('write'):
+                output.writerow(element['type'] + element['id'], entry, element['offset'])
+            metrics.row()
+        num_requests += requests
+
+    output.close()
 
-        print('wrote {} rows to {}'.format(num_rows, args.output))
+    metrics.info('wrote {} rows to {} with {} lookup requests'.format(num_rows, args.output, num_requests))
+    metrics.info(engine.summary())
+    metrics.info(cache.summary())
+    cache.close()
+    metrics.close()
 
 if __name__ == '__main__':
     main()
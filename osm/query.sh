@@ -10,11 +10,20 @@ osmosis \
  --read-xml raw/france-latest.osm \
  --tf accept-ways tourism=museum \
  --tf reject-relations \
- --tf --used-node \
+ --used-node \
  --write-xml museums-data/france-ways.osm
 
 osmosis \
+ --read-xml raw/france-latest.osm \
+ --tf accept-relations tourism=museum \
+ --used-way \
+ --used-node \
+ --write-xml museums-data/france-relations.osm
+
+osmosis \
+ --rx museums-data/france-relations.osm \
  --rx museums-data/france-ways.osm \
- --rx museums-data/france-nodes \
+ --rx museums-data/france-nodes.osm \
+ --merge \
  --merge \
  --wx museums-data/france-merged.osm
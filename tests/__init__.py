@@ -0,0 +1 @@
+# Tests of the fruseum helpers and converters, run with python3 -m pytest
@@ -0,0 +1,36 @@
+import importlib.util
+import os.path
+import sys
+import pytest
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+from nominatim_stub import NominatimStub
+
+def load_script(path, name):
+    # The converters are scripts with dashes in their names, not modules
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    # No progress line at exit, on a stream pytest has closed by then
+    module.metrics.configure('quiet')
+    return module
+
+@pytest.fixture
+def nominatim():
+    # Local fake nominatim (see bench/nominatim_stub.py), without latency nor errors
+    stub = NominatimStub(('127.0.0.1', 0))
+    stub.start()
+    yield stub
+    stub.shutdown()
+    stub.server_close()
+
+@pytest.fixture(scope='session')
+def osm2csv():
+    return load_script('osm/osm2csv.py', 'osm2csv')
+
+@pytest.fixture(scope='session')
+def localisation():
+    return load_script('localisation/localisation-musees.py', 'localisation_musees')
@@ -0,0 +1,95 @@
+import struct
+import zlib
+
+# Minimal .osm.pbf encoder for the tests: a header blob and data blobs made
+# of one primitive block each (string table, dense nodes, ways, relations)
+
+def varint(value):
+    data = b''
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            data += bytes([byte | 0x80])
+        else:
+            return data + bytes([byte])
+
+def zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+def field(number, value):
+    # Varint field for an int, length delimited field for bytes
+    if isinstance(value, int):
+        return varint(number << 3) + varint(value)
+    return varint(number << 3 | 2) + varint(len(value)) + value
+
+def packed(values):
+    return b''.join(varint(value) for value in values)
+
+def deltas(values):
+    result = []
+    previous = 0
+    for value in values:
+        result.append(zigzag(value - previous))
+        previous = value
+    return result
+
+class BlockWriter:
+    # nodes: [(id, lat, lon, tags)], ways: [(id, refs, tags)],
+    # relations: [(id, [(type, ref, role)], tags)], tags being dicts
+    def __init__(self):
+        self.strings = {'': 0}
+
+    def string(self, value):
+        return self.strings.setdefault(value, len(self.strings))
+
+    def tags(self, tags):
+        return [self.string(key) for key in tags], [self.string(value) for value in tags.values()]
+
+    def dense(self, nodes):
+        keys_vals = []
+        for _, _, _, tags in nodes:
+            for key, value in tags.items():
+                keys_vals += [self.string(key), self.string(value)]
+            keys_vals.append(0)
+        info = field(1, packed([1] * len(nodes))) + field(2, packed(deltas([1600000000] * len(nodes))))
+        return (field(1, packed(deltas([node[0] for node in nodes]))) + field(5, info) +
+                field(8, packed(deltas([round(node[1] * 10000000) for node in nodes]))) +
+                field(9, packed(deltas([round(node[2] * 10000000) for node in nodes]))) +
+                field(10, packed(keys_vals)))
+
+    def way(self, way_id, refs, tags):
+        keys, values = self.tags(tags)
+        return (field(1, way_id) + field(2, packed(keys)) + field(3, packed(values)) +
+                field(4, field(2, 1600001000)) + field(8, packed(deltas(refs))))
+
+    def relation(self, relation_id, members, tags):
+        keys, values = self.tags(tags)
+        types = {'N': 0, 'W': 1, 'R': 2}
+        return (field(1, relation_id) + field(2, packed(keys)) + field(3, packed(values)) +
+                field(8, packed([self.string(role) for _, _, role in members])) +
+                field(9, packed(deltas([ref for _, ref, _ in members]))) +
+                field(10, packed([types[member_type] for member_type, _, _ in members])))
+
+    def block(self, nodes=(), ways=(), relations=()):
+        groups = b''
+        if nodes:
+            groups += field(2, field(2, self.dense(nodes)))
+        for way in ways:
+            groups += field(2, field(3, self.way(*way)))
+        for relation in relations:
+            groups += field(2, field(4, self.relation(*relation)))
+        table = b''.join(field(1, value.encode('utf-8')) for value in self.strings)
+        return field(1, table) + groups
+
+def blob(blob_type, data):
+    body = field(2, len(data)) + field(3, zlib.compress(data))
+    header = field(1, blob_type.encode()) + field(3, len(body))
+    return struct.pack('>I', len(header)) + header + body
+
+def write_pbf(filename, blocks):
+    # blocks: [dict(nodes=..., ways=..., relations=...)], one blob each
+    with open(filename, 'wb') as pbf_file:
+        pbf_file.write(blob('OSMHeader', b''))
+        for block in blocks:
+            pbf_file.write(blob('OSMData', BlockWriter().block(**block)))
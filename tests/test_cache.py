@@ -0,0 +1,95 @@
+import threading
+import time
+import urllib3
+from geopy.geocoders import Nominatim
+from fruseum.cache import GeoCache
+from fruseum.geocoder import GeocodingEngine
+
+def elements(*keys):
+    return [{'type': key[0], 'id': key[1:], 'timestamp': None, 'tags': [('tourism', 'museum')]} for key in keys]
+
+def test_convert_batch_uses_the_cache(nominatim, osm2csv, tmp_path):
+    engine = GeocodingEngine(workers=1, rate=0)
+    cache = GeoCache(str(tmp_path / 'cache.sqlite'))
+    http = urllib3.PoolManager()
+    requests, entries = osm2csv.convert_batch(http, nominatim.url, cache, engine, elements('N1', 'N2'))
+    assert requests == 1
+    assert [entry['osm_id'] for entry in entries] == ['1', '2']
+    assert all(entry['city'] for entry in entries)
+
+    requests, cached = osm2csv.convert_batch(http, nominatim.url, cache, engine, elements('N1', 'N2', 'N3'))
+    assert requests == 1
+    assert nominatim.stats['lookup'] == 2
+    assert nominatim.stats['ids'] == 3
+    assert [entry['city'] for entry in cached[:2]] == [entry['city'] for entry in entries]
+    cache.close()
+
+def test_localisation_geocode(nominatim, localisation, tmp_path):
+    host, port = nominatim.server_address[:2]
+    locator = Nominatim(user_agent='fruseum-tests', domain='{}:{}'.format(host, port), scheme='http')
+    engine = GeocodingEngine(workers=1, rate=0)
+    cache = GeoCache(str(tmp_path / 'cache.sqlite'))
+
+    raw = localisation.geocode(locator, cache, engine, 'Musée Ingres Montauban')
+    assert raw['address']['country_code'] == 'fr'
+    again = localisation.geocode(locator, cache, engine, 'musee  INGRES montauban')
+    assert again == raw
+    assert nominatim.stats['search'] == 1
+
+    nominatim.miss_rate = 1.0
+    assert localisation.geocode(locator, cache, engine, 'Nowhere') is None
+    assert cache.get('search', 'nowhere') == (True, None)
+    cache.close()
+
+def test_cache_ttl_and_eviction(tmp_path):
+    cache = GeoCache(str(tmp_path / 'cache.sqlite'), ttl=3600, max_entries=2)
+    for key in ('a', 'b', 'c'):
+        cache.set('search', key, {'key': key})
+        time.sleep(0.01)
+    cache.evict()
+    assert cache.get('search', 'a') == (False, None)
+    assert cache.get('search', 'c') == (True, {'key': 'c'})
+    cache.delete('search', 'c')
+    assert cache.get('search', 'c') == (False, None)
+
+    cache.ttl = -1
+    assert cache.get('search', 'b') == (False, None)
+    cache.close()
+
+def test_cache_is_shared_by_threads(tmp_path):
+    cache = GeoCache(str(tmp_path / 'cache.sqlite'))
+    def work(number):
+        for key in range(20):
+            cache.set('lookup', '{}-{}'.format(number, key), key)
+    threads = [threading.Thread(target=work, args=(number,)) for number in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.get('lookup', '3-19') == (True, 19)
+    cache.close()
+
+def test_cache_is_shared_by_connections(tmp_path):
+    # A hit of one connection must not lock the file for the others
+    first = GeoCache(str(tmp_path / 'cache.sqlite'))
+    second = GeoCache(str(tmp_path / 'cache.sqlite'))
+    second.db.execute('PRAGMA busy_timeout = 100')
+    first.set('search', 'a', 1)
+    assert first.get('search', 'a') == (True, 1)
+    second.set('search', 'b', 2)
+    assert first.get('search', 'b') == (True, 2)
+    first.close()
+    second.close()
+
+def test_eviction_keeps_the_entries_hit(tmp_path):
+    cache = GeoCache(str(tmp_path / 'cache.sqlite'), max_entries=2)
+    for key in ('a', 'b'):
+        cache.set('search', key, key)
+        time.sleep(0.01)
+    assert cache.get('search', 'a') == (True, 'a')
+    time.sleep(0.01)
+    cache.set('search', 'c', 'c')
+    cache.evict()
+    assert cache.get('search', 'b') == (False, None)
+    assert cache.get('search', 'a') == (True, 'a')
+    cache.close()
@@ -0,0 +1,91 @@
+import json
+import os.path
+import pytest
+from fruseum.checkpoint import CheckpointedOutput
+from fruseum.writers import read_rows
+
+FIELDS = ['osm_id', 'name']
+
+def entries(start, stop):
+    return [(str(number), {'osm_id': str(number), 'name': 'Musée {}'.format(number)}) for number in range(start, stop)]
+
+def crash(output):
+    # Stop writing without close, as a killed run would
+    output.file.close()
+    output.journal_file.close()
+
+@pytest.mark.parametrize('output_format', ['csv', 'jsonl.gz', 'geojson'])
+def test_resume_after_crash(tmp_path, output_format):
+    filename = str(tmp_path / ('out.' + output_format))
+    output = CheckpointedOutput(filename, FIELDS, batch_size=3, output_format=output_format)
+    for offset, (key, entry) in enumerate(entries(0, 8)):
+        output.writerow(key, entry, offset)
+    crash(output)
+
+    # Rows 6 and 7 were not committed: they are written again
+    output = CheckpointedOutput(filename, FIELDS, resume=True, batch_size=3, output_format=output_format)
+    assert output.resumed
+    assert output.offset == 5
+    assert output.rows == 6
+    for offset, (key, entry) in enumerate(entries(0, 10)):
+        if offset > output.offset and not output.done(key):
+            output.writerow(key, entry, offset)
+    output.close()
+
+    assert read_rows(filename)[1] == [entry for _, entry in entries(0, 10)]
+
+def test_no_journal_starts_over(tmp_path):
+    filename = str(tmp_path / 'out.csv')
+    output = CheckpointedOutput(filename, FIELDS, resume=True)
+    assert not output.resumed
+    for key, entry in entries(0, 2):
+        output.writerow(key, entry, 0)
+    output.close()
+    assert len(read_rows(filename)[1]) == 2
+
+def test_done(tmp_path):
+    output = CheckpointedOutput(str(tmp_path / 'out.csv'), FIELDS, batch_size=2)
+    output.writerow('1', entries(1, 2)[0][1], 0)
+    assert not output.done('1')
+    output.commit()
+    assert output.done('1')
+    output.close()
+
+def test_previous_output_kept_until_close(tmp_path):
+    filename = str(tmp_path / 'out.csv')
+    with open(filename, 'w') as previous:
+        previous.write('osm_id,name\r\n0,Musée 0\r\n')
+    output = CheckpointedOutput(filename, FIELDS, batch_size=1)
+    for offset, (key, entry) in enumerate(entries(1, 4)):
+        output.writerow(key, entry, offset)
+    crash(output)
+    assert read_rows(filename)[1] == [entries(0, 1)[0][1]]
+
+    output = CheckpointedOutput(filename, FIELDS, resume=True, batch_size=1)
+    output.close()
+    assert read_rows(filename)[1] == [entry for _, entry in entries(1, 4)]
+    assert not os.path.exists(filename + '.part')
+    assert not os.path.exists(filename + '.journal')
+
+def test_journal_appends_new_ids(tmp_path):
+    filename = str(tmp_path / 'out.csv')
+    output = CheckpointedOutput(filename, FIELDS, batch_size=2)
+    for offset, (key, entry) in enumerate(entries(0, 6)):
+        output.writerow(key, entry, offset)
+    crash(output)
+    with open(filename + '.journal', 'rb') as journal:
+        lines = journal.readlines()
+    # The header commit, then one line per batch of two ids
+    assert len(lines) == 4
+    assert all(len(json.loads(line)['ids']) == 2 for line in lines[1:])
+
+    # A line torn by a crash is ignored and dropped
+    with open(filename + '.journal', 'ab') as journal:
+        journal.write(b'{"offset": 7, "si')
+    output = CheckpointedOutput(filename, FIELDS, resume=True, batch_size=2)
+    assert output.offset == 5
+    assert output.ids == {str(number) for number in range(6)}
+    output.writerow('6', entries(6, 7)[0][1], 6)
+    output.commit()
+    crash(output)
+    assert CheckpointedOutput(filename, FIELDS, resume=True).ids == {str(number) for number in range(7)}
@@ -0,0 +1,80 @@
+import csv
+import os.path
+import pytest
+import unidecode
+from fruseum.classifier import RULES, UNCLASSIFIED, Classifier, classify, classify_all
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+def elif_chain(name):
+    # The chain of localisation-musees.py the rules replaced
+    name = unidecode.unidecode(name).casefold()
+    if 'archeologique' in name:
+        return 'type:musee archeologique;art:prehistoire'
+    elif 'antique' in name:
+        return 'type:musee archeologique;art:antiquite'
+    elif 'arts decoratifs' in name:
+        return 'type:musee d\'arts decoratifs'
+    elif 'agricole' in name:
+        return 'type:musee technique et industriel'
+    elif 'outil' in name:
+        return 'type:musee technique et industriel'
+    elif 'ouvrier' in name:
+        return 'type:musee d\'arts populaires'
+    elif 'populaire' in name:
+        return 'type:musee d\'arts populaires'
+    elif 'prehistoire' in name:
+        return 'type:musee archeologique;art:prehistoire'
+    elif 'atelier' in name:
+        return 'type:atelier d\'artiste'
+    elif 'beaux-arts' in name:
+        return 'type:musee de beaux-arts'
+    elif 'ecomusee' in name:
+        return 'type:ecomusee'
+    elif 'geologie' in name:
+        return 'type:musee d\'histoire naturelle'
+    elif 'industrie' in name:
+        return 'type:musee technique et industriel'
+    elif 'technique' in name:
+        return 'type:musee technique et industriel'
+    elif 'histoire' in name:
+        return 'type:musee historique'
+    elif 'historique' in name:
+        return 'type:musee historique'
+    elif 'museum' in name:
+        return 'type:museum'
+    elif 'musee' in name:
+        return 'type:musee'
+    else:
+        return 'type:a classer'
+
+def shipped_names():
+    # Names of the Musées de France list and of the osm museums of France
+    names = []
+    for filename, column in (('localisation/liste-et-localisation-des-musees-de-france.csv', 'NOM DU MUSEE'),
+                             ('osm/tag-museums/france-museums.csv', 'name')):
+        with open(os.path.join(ROOT, filename), newline='', encoding='utf-8-sig') as csv_inputfile:
+            names.extend(row[column] for row in csv.DictReader(csv_inputfile) if row[column])
+    return names
+
+def test_same_tags_as_the_elif_chain():
+    names = shipped_names()
+    assert len(names) > 4000
+    assert classify_all(names) == [elif_chain(name) for name in names]
+
+@pytest.mark.parametrize('name', [
+    'Musée de la Préhistoire',           # prehistoire before histoire
+    'Musée d\'histoire et d\'archéologique',
+    'Écomusée des techniques agricoles',
+    'Muséum d\'histoire naturelle',
+    'MUSÉE DES BEAUX-ARTS',
+    'Atelier populaire',
+    'Château',
+])
+def test_overlapping_keywords(name):
+    assert classify(name) == elif_chain(name)
+
+def test_default():
+    assert classify('') == UNCLASSIFIED
+    assert classify(None) == UNCLASSIFIED
+    assert Classifier(RULES, default='type:autre').classify('Château') == 'type:autre'
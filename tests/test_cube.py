@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from fruseum.attendance import AttendanceStoreWriter, load_store
+from fruseum.cube import AttendanceCube
+
+# Rows of the national csv: ref, name, region, city, year, department, date, payant, gratuit, total
+ROWS = [
+    ['M1', 'Louvre', 'ILE-DE-FRANCE', 'Paris', '2014', 'PARIS', '01/02/2003', '8000', '1000', '9000'],
+    ['M2', 'Orsay', 'ILE-DE-FRANCE', 'Paris', '2014', 'PARIS', '01/02/2003', '3000', '500', '3500'],
+    ['M3', 'Ingres', 'MIDI-PYRENEES', 'Montauban', '2014', 'TARN-ET-GARONNE', '01/02/2003', '20', '10', '30'],
+    ['M1', 'Louvre', 'ILE-DE-FRANCE', 'Paris', '2015', 'PARIS', '01/02/2003', '7000', '1600', '8600'],
+    ['M2', 'Orsay', 'ILE-DE-FRANCE', 'Paris', '2015', 'PARIS', '01/02/2003', '', '', ''],
+    ['M3', 'Ingres', 'MIDI-PYRENEES', 'Montauban', '2015', 'TARN-ET-GARONNE', '01/02/2003', '30', '30', '60'],
+]
+
+def test_queries():
+    cube = AttendanceCube()
+    cube.append(ROWS)
+    assert list(cube.years) == [2014, 2015]
+    assert cube.history('M1') == {2014: 9000, 2015: 8600}
+    assert cube.missing_years() == {'M2': [2015]}
+    assert cube.top(2014, n=2) == [('M1', 9000), ('M2', 3500)]
+    assert cube.top(2015, level='region') == [('ILE-DE-FRANCE', 8600), ('MIDI-PYRENEES', 60)]
+    assert cube.top_growth(2015, n=1) == [('M3', 1.0)]
+    assert cube.free_share()[2] == pytest.approx([1 / 3, 0.5])
+    with pytest.raises(KeyError):
+        cube.year_column(2013)
+
+def test_append_in_any_order():
+    cube = AttendanceCube()
+    cube.append(ROWS[3:])
+    cube.append(ROWS[:3])
+    reference = AttendanceCube()
+    reference.append(ROWS)
+    assert list(cube.years) == [2014, 2015]
+    for level in ('museum', 'region', 'department'):
+        assert np.array_equal(cube.matrix(level=level), reference.matrix(level=level), equal_nan=True)
+    with pytest.raises(ValueError):
+        cube.append(ROWS[:1])
+
+def test_from_store(tmp_path):
+    writer = AttendanceStoreWriter()
+    for row in ROWS:
+        writer.append(row)
+    writer.write(str(tmp_path / 'store'))
+    store = load_store(str(tmp_path / 'store'))
+    assert len(store) == len(ROWS)
+    assert store.decode('museum', store['museum'][2]) == 'M3'
+
+    cube = AttendanceCube.from_store(store)
+    reference = AttendanceCube()
+    reference.append(ROWS)
+    assert cube.museums == reference.museums
+    assert np.array_equal(cube.matrix('payant'), reference.matrix('payant'), equal_nan=True)
+    assert np.array_equal(cube.matrix('total', 'department'), reference.matrix('total', 'department'))
+
+# Museums moved to the new regions of the 2016 reform
+REFORM = [
+    ['M3', 'Ingres', 'MIDI-PYRENEES', 'Montauban', '2015', 'TARN-ET-GARONNE', '01/02/2003', '', '', '60'],
+    ['M4', 'Fabre', 'LANGUEDOC-ROUSSILLON', 'Montpellier', '2015', 'HERAULT', '01/02/2003', '', '', '200'],
+    ['M3', 'Ingres', 'OCCITANIE', 'Montauban', '2016', 'TARN-ET-GARONNE', '01/02/2003', '', '', '70'],
+    ['M4', 'Fabre', 'OCCITANIE', 'Montpellier', '2016', 'HERAULT', '01/02/2003', '', '', '210'],
+    ['M5', 'Matisse', 'HAUTS-DE-FRANCE', 'Le Cateau', '2017', 'NORD', '01/02/2003', '', '', '50'],
+    ['M3', 'Ingres', 'OCCITANIE', 'Montauban', '2017', 'TARN-ET-GARONNE', '01/02/2003', '', '', '80'],
+]
+
+@pytest.mark.parametrize('batches', [[REFORM], [REFORM[:2], REFORM[2:]], [REFORM[2:], REFORM[:2]]])
+def test_region_reform(batches):
+    cube = AttendanceCube()
+    for batch in batches:
+        cube.append(batch)
+    regions = {region: dict(zip(cube.years.tolist(), values.tolist()))
+               for region, values in zip(cube.regions, cube.matrix(level='region'))}
+    assert regions['MIDI-PYRENEES'] == {2015: 60, 2016: 0, 2017: 0}
+    assert regions['LANGUEDOC-ROUSSILLON'] == {2015: 200, 2016: 0, 2017: 0}
+    assert regions['OCCITANIE'] == {2015: 0, 2016: 280, 2017: 80}
+    assert regions['HAUTS-DE-FRANCE'] == {2015: 0, 2016: 0, 2017: 50}
+    assert np.array_equal(cube.matrix(level='region').sum(axis=0), np.nansum(cube.matrix(), axis=0))
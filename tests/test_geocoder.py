@@ -0,0 +1,53 @@
+import time
+import pytest
+from fruseum.geocoder import GeocodingEngine, RetryableError, TokenBucket
+
+def test_engine_keeps_input_order():
+    engine = GeocodingEngine(workers=4, rate=0)
+    def slow(item):
+        time.sleep((10 - item) / 1000)
+        return item * 2
+    assert list(engine.map(slow, range(10))) == [(item, item * 2) for item in range(10)]
+
+def test_engine_retries_then_succeeds():
+    engine = GeocodingEngine(workers=2, rate=0, retries=3, backoff=0)
+    attempts = []
+    def flaky(item):
+        attempts.append(item)
+        if len(attempts) < 3:
+            raise RetryableError('busy')
+        return item
+    assert list(engine.map(flaky, ['a'])) == [('a', 'a')]
+    assert engine.retried == 2
+    assert engine.failed == 0
+
+def test_engine_gives_up_after_the_retries():
+    engine = GeocodingEngine(workers=1, rate=0, retries=2, backoff=0)
+    def failing(item):
+        raise RetryableError('busy')
+    with pytest.raises(RetryableError):
+        list(engine.map(failing, ['a']))
+    assert engine.retried == 2
+    assert engine.failed == 1
+
+def test_retry_does_not_stall_the_other_items():
+    # Item 0 waits 0.5s for its retry while the 99 others take 0.5s on two workers
+    engine = GeocodingEngine(workers=2, rate=0, retries=1, backoff=0.5)
+    failed = []
+    def work(item):
+        if item == 0 and not failed:
+            failed.append(item)
+            raise RetryableError('busy')
+        time.sleep(0.01)
+        return item
+    start = time.monotonic()
+    assert [item for item, _ in engine.map(work, range(100))] == list(range(100))
+    assert time.monotonic() - start < 0.85
+    assert engine.retried == 1
+
+def test_token_bucket_limits_the_rate():
+    bucket = TokenBucket(rate=50)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.09
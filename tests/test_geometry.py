@@ -0,0 +1,57 @@
+import pytest
+from fruseum.geometry import NodeIndex, assemble_rings, relation_centroid, ring_centroid, way_centroid
+
+def square(nodes, first, lat, lon, size):
+    # Closed way of four nodes first..first+3
+    for offset, (dlat, dlon) in enumerate(((0, 0), (0, size), (size, size), (size, 0))):
+        nodes.add(first + offset, lat + dlat, lon + dlon)
+    return [first, first + 1, first + 2, first + 3, first]
+
+def test_node_index_unsorted():
+    nodes = NodeIndex()
+    for node_id in (5, 3, 9, 1):
+        nodes.add(node_id, node_id / 10, -node_id / 10)
+    assert len(nodes) == 4
+    with pytest.raises(ValueError):
+        nodes.get(3)
+    nodes.add(2, 0.2, -0.2)
+    nodes.sort()
+    assert nodes.get(3) == (0.3, -0.3)
+    assert nodes.get(4) is None
+    assert nodes.get('2') == (0.2, -0.2)
+    assert nodes.get(9) == (0.9, -0.9)
+
+def test_ring_centroid():
+    points = [(0, 0), (0, 2), (2, 2), (2, 0), (0, 0)]
+    assert ring_centroid(points) == (4, 1, 1)
+    assert ring_centroid(points[:-1]) is None
+    assert ring_centroid([(0, 0), (0, 1), (0, 2), (0, 0)]) is None
+
+def test_way_centroid():
+    nodes = NodeIndex()
+    refs = square(nodes, 1, 48, 2, 1)
+    nodes.sort()
+    assert way_centroid(refs, nodes) == pytest.approx((48.5, 2.5))
+    # Open way: mean of its nodes
+    assert way_centroid(refs[:2], nodes) == pytest.approx((48, 2.5))
+    assert way_centroid([100], nodes) is None
+
+def test_assemble_rings():
+    assert assemble_rings([[1, 2, 3], [3, 4, 1]]) == [[1, 2, 3, 4, 1]]
+    assert assemble_rings([[1, 2, 3], [1, 4, 3]]) == [[1, 2, 3, 4, 1]]
+    assert assemble_rings([[1, 2, 3], [5, 6]]) is None
+
+def test_relation_centroid_with_hole():
+    nodes = NodeIndex()
+    ways = {100: square(nodes, 1, 0, 0, 4), 101: square(nodes, 10, 0, 0, 2)}
+    nodes.sort()
+    # Outer square (0, 0)-(4, 4) minus the inner square (0, 0)-(2, 2)
+    members = [('W', 100, 'outer'), ('W', 101, 'inner')]
+    lat, lon = relation_centroid(members, ways, nodes)
+    assert (lat, lon) == pytest.approx((7 / 3, 7 / 3))
+
+def test_relation_centroid_without_ring():
+    nodes = NodeIndex()
+    nodes.add(1, 10, 20)
+    nodes.add(2, 12, 22)
+    assert relation_centroid([('N', 1, ''), ('N', 2, ''), ('W', 5, '')], {}, nodes) == pytest.approx((11, 21))
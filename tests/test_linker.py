@@ -0,0 +1,27 @@
+from fruseum.linker import Linker
+
+def osm_row(osm_id, osm_type, name, **columns):
+    return dict(osm_id=osm_id, osm_type=osm_type, name=name, lat='1', lon='2', city='', tags='', **columns)
+
+def test_find_osm_by_type():
+    osm = [osm_row('7', 'node', 'Entrée du musée'), osm_row('7', 'way', 'Musée'), osm_row('8', 'way', 'Autre musée')]
+    linker = Linker([], osm)
+    assert linker.find_osm({'osm_id': '7', 'osm_type': 'way'})['name'] == 'Musée'
+    assert linker.find_osm({'osm_id': '7', 'osm_type': 'node'})['name'] == 'Entrée du musée'
+    assert linker.find_osm({'osm_id': '7', 'osm_type': 'relation'}) is None
+    # Without a type, only an id used by a single osm row is linked
+    assert linker.find_osm({'osm_id': '7'}) is None
+    assert linker.find_osm({'osm_id': '8'})['name'] == 'Autre musée'
+
+def test_find_osm_in_an_untyped_file():
+    linker = Linker([], [dict(osm_row('7', '', 'Musée'), osm_type=None)])
+    assert linker.find_osm({'osm_id': '7', 'osm_type': 'way'})['name'] == 'Musée'
+    assert linker.find_osm({'osm_id': '7'})['name'] == 'Musée'
+
+def test_merge_by_wikidata():
+    museums = [{'id': 'M1', 'osm_id': '', 'osm_type': '', 'name': 'Musée Ingres', 'wikidata': 'Q1', 'tags': ''}]
+    osm = [osm_row('7', 'way', 'Musée Ingres Bourdelle', wikidata_id='Q1', website='https://museeingresbourdelle.com')]
+    merged = Linker(museums, osm).merge({})
+    assert len(merged) == 1
+    assert (merged[0]['osm_id'], merged[0]['osm_type'], merged[0]['website']) == ('7', 'way', 'https://museeingresbourdelle.com')
+    assert merged[0]['sources'] == 'mdf;osm'
@@ -0,0 +1,39 @@
+import pytest
+import urllib3
+from fruseum.geocoder import GeocodingEngine, RetryableError
+
+def elements(*keys):
+    return [{'type': key[0], 'id': key[1:], 'timestamp': None, 'tags': [('tourism', 'museum')]} for key in keys]
+
+def test_lookup_batch(nominatim, osm2csv):
+    engine = GeocodingEngine(workers=1, rate=0)
+    results = osm2csv.lookup_batch(urllib3.PoolManager(), nominatim.url, engine, elements('N1', 'W2', 'R3'))
+    assert sorted(results) == ['N1', 'R3', 'W2']
+    assert results['W2']['osm_type'] == 'way'
+    assert nominatim.stats['lookup'] == 1
+    assert nominatim.stats['ids'] == 3
+
+def test_lookup_retries_on_503(nominatim, osm2csv):
+    nominatim.error_rate = 1.0
+    engine = GeocodingEngine(workers=1, rate=0, retries=2, backoff=0)
+    http = urllib3.PoolManager()
+    with pytest.raises(RetryableError):
+        list(engine.map(lambda batch: osm2csv.lookup_batch(http, nominatim.url, engine, batch), [elements('N1')]))
+    assert nominatim.stats['errors'] == 3
+    assert engine.requests == 3
+
+def test_lookup_retries_on_timeouts(nominatim, osm2csv):
+    nominatim.latency = 0.3
+    engine = GeocodingEngine(workers=1, rate=0, retries=1, backoff=0, retry_on=osm2csv.RETRY_ON)
+    http = osm2csv.connection_pool(1, 0.05)
+    with pytest.raises(osm2csv.RETRY_ON):
+        list(engine.map(lambda batch: osm2csv.lookup_batch(http, nominatim.url, engine, batch), [elements('N1')]))
+    assert engine.retried == 1
+    assert engine.failed == 1
+
+def test_lookup_retries_on_refused_connections(osm2csv):
+    engine = GeocodingEngine(workers=1, rate=0, retries=2, backoff=0, retry_on=osm2csv.RETRY_ON)
+    http = osm2csv.connection_pool(1, 1)
+    with pytest.raises(osm2csv.RETRY_ON):
+        list(engine.map(lambda batch: osm2csv.lookup_batch(http, 'http://127.0.0.1:9', engine, batch), [elements('N1')]))
+    assert engine.retried == 2
@@ -0,0 +1,43 @@
+import pytest
+from fruseum.matcher import match, score, tokens
+
+def museum(museum_id, name, postal_code='', city='', lat=None, lon=None):
+    # Museum as read by read_museums
+    words = tokens(name)
+    return {'id': museum_id, 'name': name, 'postal_code': postal_code, 'city': city, 'lat': lat, 'lon': lon,
+            'tokens': words, 'sorted': ' '.join(sorted(words))}
+
+def test_tokens():
+    assert tokens('Musée des Beaux-Arts de Lyon') == ['beaux', 'arts', 'lyon']
+    assert tokens('Musée municipal') == []
+    assert tokens(None) == []
+
+def test_score():
+    a = museum('M1', 'Musée des Beaux-Arts', '69001', 'Lyon', 45.7670, 4.8340)
+    b = museum('1', 'Musée des beaux arts', '69001', 'Lyon', 45.7675, 4.8338)
+    confidence, name, km = score(a, b)
+    assert name == 1.0
+    assert confidence == 1.0
+    assert km == pytest.approx(0.057, abs=0.001)
+    # Same name, only the postal code in common
+    confidence, name, km = score(museum('M1', 'Musée des Beaux-Arts', '69001'), museum('1', 'Beaux-Arts', '69001'))
+    assert (confidence, name, km) == (0.875, 1.0, None)
+
+def test_score_of_a_name_without_tokens():
+    a = museum('M1', 'Musée municipal', '69001', 'Lyon', 45.7670, 4.8340)
+    b = museum('1', '', '69001', 'Lyon', 45.7670, 4.8340)
+    confidence, name, km = score(a, b)
+    assert name == 0.0
+    assert confidence == 0.25
+
+def test_match():
+    mdf = [museum('M1', 'Musée des Beaux-Arts', '69001', 'Lyon', 45.7670, 4.8340),
+           museum('M2', 'Musée Gadagne', '69005', 'Lyon', 45.7630, 4.8270),
+           museum('M3', 'Musée municipal', '69005', 'Lyon', 45.7600, 4.8260)]
+    osm = [museum('2', 'Gadagne', '69005', 'Lyon', 45.7631, 4.8271),
+           museum('1', 'Musée des beaux arts', '69001', 'Lyon', 45.7675, 4.8338),
+           # Next to M3 but without a name: the location alone does not match
+           museum('3', '', '69005', 'Lyon', 45.7600, 4.8260)]
+    matches, comparisons = match(mdf, osm)
+    assert [(a['id'], b['id']) for a, b, confidence, km in matches] == [('M1', '1'), ('M2', '2')]
+    assert comparisons > 0
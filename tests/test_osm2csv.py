@@ -0,0 +1,130 @@
+import argparse
+import pytest
+import urllib3
+from fruseum.cache import GeoCache
+from fruseum.geocoder import GeocodingEngine
+from fruseum.writers import read_rows
+from tests.pbfwriter import write_pbf
+
+# A museum node, a museum way, and a multipolygon museum whose outer way
+# (building=yes) and entrance node are tagged too, as query.sh keeps them
+OSM = '''<?xml version='1.0' encoding='UTF-8'?>
+<osm version="0.6">
+ <node id="1" lat="48.0" lon="2.0"/>
+ <node id="2" lat="48.0" lon="3.0"/>
+ <node id="3" lat="49.0" lon="3.0"/>
+ <node id="4" lat="49.0" lon="2.0"><tag k="entrance" v="main"/></node>
+ <node id="5" lat="45.5" lon="4.5" timestamp="2020-01-01T00:00:00Z"><tag k="tourism" v="museum"/><tag k="name" v="Musée A"/></node>
+ <node id="6" lat="50.0" lon="5.0"/>
+ <node id="7" lat="50.0" lon="6.0"/>
+ <node id="8" lat="51.0" lon="6.0"/>
+ <node id="9" lat="40.0" lon="1.0"/>
+ <way id="10"><nd ref="1"/><nd ref="2"/><nd ref="3"/><nd ref="4"/><nd ref="1"/><tag k="building" v="yes"/></way>
+ <way id="11"><nd ref="6"/><nd ref="7"/><nd ref="8"/><nd ref="6"/><tag k="tourism" v="museum"/></way>
+ <way id="12"><nd ref="9"/><nd ref="1"/></way>
+ <relation id="20"><member type="way" ref="10" role="outer"/><member type="node" ref="4" role="entrance"/><tag k="type" v="multipolygon"/><tag k="tourism" v="museum"/></relation>
+</osm>
+'''
+
+@pytest.fixture
+def osm_file(tmp_path):
+    filename = tmp_path / 'museums.osm'
+    filename.write_text(OSM)
+    return str(filename)
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_read_xml_elements(osm2csv, osm_file, stream):
+    if stream:
+        elements = osm2csv.read_xml_elements(lambda: osm2csv.stream_elements(osm_file))
+    else:
+        elements = osm2csv.read_xml_elements(osm2csv.load_elements(osm_file))
+    elements = {element['type'] + element['id']: element for element in elements}
+    assert list(elements) == ['N5', 'W11', 'R20']
+    assert (elements['N5']['lat'], elements['N5']['lon']) == ('45.5000000', '4.5000000')
+    assert float(elements['W11']['lat']) == pytest.approx(50 + 1 / 3)
+    assert float(elements['R20']['lat']) == pytest.approx(48.5)
+    assert float(elements['R20']['lon']) == pytest.approx(2.5)
+
+def test_locate_elements_reads_only_the_wanted_nodes(osm2csv, osm_file, monkeypatch):
+    added = []
+    add = osm2csv.NodeIndex.add
+    def record(index, node_id, lat, lon):
+        added.append(node_id)
+        add(index, node_id, lat, lon)
+    monkeypatch.setattr(osm2csv.NodeIndex, 'add', record)
+    list(osm2csv.read_xml_elements(osm2csv.load_elements(osm_file)))
+    assert sorted(added, key=int) == ['1', '2', '3', '4', '6', '7', '8']
+
+CHANGES = '''<osmChange version="0.6">
+<create>
+ <node id="40" lat="1.0" lon="1.0"/><node id="41" lat="1.0" lon="2.0"/><node id="42" lat="2.0" lon="2.0"/>
+ <way id="7"><nd ref="40"/><nd ref="41"/><nd ref="42"/><nd ref="40"/><tag k="tourism" v="museum"/></way>
+</create>
+<delete>
+ <node id="3"/>
+</delete>
+</osmChange>
+'''
+
+def apply(osm2csv, nominatim, tmp_path, output, osc=CHANGES, fieldnames=('osm_id', 'osm_type', 'musee_id', 'name', 'lat', 'lon')):
+    changes = tmp_path / 'changes.osc'
+    changes.write_text(osc)
+    args = argparse.Namespace(input=str(changes), output=str(output), batch_size=50, format='csv')
+    engine = GeocodingEngine(workers=1, rate=0)
+    cache = GeoCache(str(tmp_path / 'cache.sqlite'))
+    fieldnames = list(fieldnames)
+    osm2csv.apply_changes(args, urllib3.PoolManager(), nominatim.url, cache, engine, None, fieldnames)
+    cache.close()
+    return read_rows(str(output))
+
+def test_apply_changes_keys_by_type(osm2csv, nominatim, tmp_path):
+    output = tmp_path / 'museums.csv'
+    output.write_text('osm_id,osm_type,musee_id,name,lat,lon\r\n'
+                      '3,node,M1,Musée nœud,1,1\r\n'
+                      '3,way,M2,Musée chemin,2,2\r\n'
+                      '7,node,M3,Autre musée,3,3\r\n')
+    fieldnames, rows = apply(osm2csv, nominatim, tmp_path, output)
+    assert fieldnames == ['osm_id', 'osm_type', 'musee_id', 'name', 'lat', 'lon']
+    # node 3 is deleted but not way 3, way 7 is added next to node 7
+    assert [(row['osm_type'], row['osm_id'], row['musee_id']) for row in rows] == [('way', '3', 'M2'), ('node', '7', 'M3'), ('way', '7', '')]
+    assert float(rows[2]['lat']) == pytest.approx(4 / 3)
+
+def test_apply_changes_to_an_untyped_output(osm2csv, nominatim, tmp_path):
+    output = tmp_path / 'museums.csv'
+    output.write_text('osm_id,musee_id,name,lat,lon\r\n3,M1,Musée,1,1\r\n7,M2,Musée,2,2\r\n')
+    fieldnames, rows = apply(osm2csv, nominatim, tmp_path, output)
+    assert fieldnames == ['osm_id', 'osm_type', 'musee_id', 'name', 'lat', 'lon']
+    assert [(row['osm_type'], row['osm_id'], row['musee_id']) for row in rows] == [('way', '7', 'M2')]
+
+def test_apply_changes_updates_rows_in_place(osm2csv, nominatim, tmp_path):
+    output = tmp_path / 'museums.csv'
+    output.write_text('osm_id,osm_type,musee_id,name,website,phone,wikidata_id,lat,lon\r\n'
+                      '1,node,M1,Premier musée,,,,1,1\r\n'
+                      '2,node,M2,Musée,https://musee.fr,01 23 45 67 89,,2,2\r\n'
+                      '3,node,M3,Dernier musée,,,,3,3\r\n')
+    osc = ('<osmChange version="0.6"><modify>'
+           '<node id="2" lat="2.5" lon="2.5"><tag k="tourism" v="museum"/><tag k="name" v="Musée renommé"/><tag k="wikidata" v="Q42"/></node>'
+           '</modify></osmChange>')
+    fieldnames, rows = apply(osm2csv, nominatim, tmp_path, output, osc,
+                             ('osm_id', 'osm_type', 'musee_id', 'name', 'website', 'phone', 'wikidata_id', 'lat', 'lon'))
+    assert [row['osm_id'] for row in rows] == ['1', '2', '3']
+    # The id linked by hand is kept, the removed tags are not
+    assert (rows[1]['musee_id'], rows[1]['website'], rows[1]['phone']) == ('M2', '', '')
+    assert rows[1]['wikidata_id'] == 'Q42'
+
+def test_same_coordinates_from_pbf_and_xml(osm2csv, osm_file, tmp_path):
+    # The museums of OSM written as a pbf
+    museum = {'tourism': 'museum'}
+    nodes = [(1, 48.0, 2.0, {}), (2, 48.0, 3.0, {}), (3, 49.0, 3.0, {}), (4, 49.0, 2.0, {'entrance': 'main'}),
+             (5, 45.5, 4.5, dict(museum, name='Musée A')), (6, 50.0, 5.0, {}), (7, 50.0, 6.0, {}), (8, 51.0, 6.0, {})]
+    ways = [(10, [1, 2, 3, 4, 1], {'building': 'yes'}), (11, [6, 7, 8, 6], museum)]
+    relations = [(20, [('W', 10, 'outer'), ('N', 4, 'entrance')], dict(museum, type='multipolygon'))]
+    pbf = str(tmp_path / 'museums.osm.pbf')
+    write_pbf(pbf, [dict(nodes=nodes, ways=ways, relations=relations)])
+
+    def coordinates(elements):
+        return {element['type'] + element['id']: (element['lat'], element['lon']) for element in elements}
+    from_xml = coordinates(osm2csv.read_xml_elements(osm2csv.load_elements(osm_file)))
+    from_pbf = coordinates(osm2csv.read_pbf_elements(pbf, workers=1))
+    assert from_xml == from_pbf
+    assert from_pbf['N5'] == ('45.5000000', '4.5000000')
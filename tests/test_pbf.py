@@ -0,0 +1,37 @@
+import pytest
+from fruseum.pbf import read_elements
+from tests.pbfwriter import write_pbf
+
+MUSEUM = {'tourism': 'museum'}
+
+@pytest.fixture
+def pbf(tmp_path):
+    filename = str(tmp_path / 'test.osm.pbf')
+    write_pbf(filename, [
+        dict(nodes=[(1, 0.0, 0.0, {'highway': 'bus_stop'})]),
+        dict(nodes=[(10, 48.0, 2.0, {}), (11, 48.5, 2.5, dict(MUSEUM, name='Musée X')), (12, 48.0, 3.0, {}), (13, 49.0, 3.0, {})],
+             ways=[(20, [10, 12, 13, 10], dict(MUSEUM, name='Grand Musée'))],
+             relations=[(30, [('W', 20, 'outer'), ('N', 12, '')], dict(MUSEUM, type='multipolygon'))]),
+    ])
+    return filename
+
+def test_read_elements(pbf):
+    elements = list(read_elements(pbf, workers=1))
+    assert [(element['type'], element['id']) for element in elements] == [('N', '11'), ('W', '20'), ('R', '30')]
+    node, way, relation = elements
+    assert ('name', 'Musée X') in node['tags']
+    assert (float(node['lat']), float(node['lon'])) == (48.5, 2.5)
+    assert node['timestamp'].startswith('2020-09-13')
+    # Centroid of the triangle (48, 2), (48, 3), (49, 3)
+    assert float(way['lat']) == pytest.approx(48 + 1 / 3)
+    assert float(way['lon']) == pytest.approx(2 + 2 / 3)
+    assert (relation['lat'], relation['lon']) == (way['lat'], way['lon'])
+
+def test_read_elements_without_geometry(pbf):
+    elements = list(read_elements(pbf, workers=1, geometry=False))
+    assert [element['id'] for element in elements] == ['11', '20', '30']
+    assert elements[1].get('lat') is None
+
+def test_read_elements_other_tag(pbf):
+    elements = list(read_elements(pbf, key='highway', value='bus_stop', workers=1))
+    assert [(element['type'], element['id']) for element in elements] == [('N', '1')]
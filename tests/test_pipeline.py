@@ -0,0 +1,92 @@
+import argparse
+import os.path
+import re
+import pytest
+from fruseum import pipeline
+from fruseum.pipeline import Stage, run, select
+
+@pytest.fixture
+def stages(tmp_path, monkeypatch):
+    # source -> a (stage 'first') -> b (stage 'second'), the commands only
+    # write their output
+    paths = {name: str(tmp_path / name) for name in ('source', 'a', 'b', 'code.py')}
+    for name in ('source', 'code.py'):
+        with open(paths[name], 'w') as source:
+            source.write(name)
+    calls = []
+    def call(command, cwd):
+        name, output = command[-2:]
+        calls.append(name)
+        with open(output, 'w') as output_file:
+            output_file.write('{} {}'.format(name, len(calls)))
+        return 0
+    monkeypatch.setattr(pipeline.subprocess, 'call', call)
+    stages = [Stage('first', ['first', paths['a']], [paths['source']], [paths['a']], [paths['code.py']]),
+              Stage('second', ['second', paths['b']], [paths['a']], [paths['b']], [paths['code.py']])]
+    return stages, paths, calls, str(tmp_path / 'state.json')
+
+def test_runs_only_what_changed(stages):
+    stages, paths, calls, state_file = stages
+    state = pipeline.load_state(state_file)
+    assert run(stages, state, state_file) == set()
+    assert calls == ['first', 'second']
+    assert run(stages, pipeline.load_state(state_file), state_file) == set()
+    assert calls == ['first', 'second']
+
+    with open(paths['source'], 'w') as source:
+        source.write('changed')
+    run(stages, pipeline.load_state(state_file), state_file)
+    assert calls == ['first', 'second', 'first', 'second']
+
+def test_existing_outputs_are_adopted(stages):
+    stages, paths, calls, state_file = stages
+    for name in ('a', 'b'):
+        with open(paths[name], 'w') as output:
+            output.write('shipped')
+    run(stages, pipeline.load_state(state_file), state_file)
+    assert calls == []
+    state = pipeline.load_state(state_file)
+    assert sorted(state['stages']) == ['first', 'second']
+
+    run(stages, state, state_file, force=True)
+    assert calls == ['first', 'second']
+
+def test_unnamed_dependency_is_kept(stages):
+    stages, paths, calls, state_file = stages
+    run(stages, pipeline.load_state(state_file), state_file)
+    with open(paths['source'], 'w') as source:
+        source.write('changed')
+
+    # first is out of date but only second was named
+    selected = select(stages, ['second'])
+    assert [stage.name for stage in selected] == ['first', 'second']
+    run(selected, pipeline.load_state(state_file), state_file, targets={'second'})
+    assert calls == ['first', 'second']
+
+    run(selected, pipeline.load_state(state_file), state_file, targets={'first', 'second'})
+    assert calls == ['first', 'second', 'first', 'second']
+
+def test_missing_dependency_output_is_built(stages):
+    stages, paths, calls, state_file = stages
+    run(stages, pipeline.load_state(state_file), state_file)
+    os.remove(paths['a'])
+    run(stages, pipeline.load_state(state_file), state_file, targets={'second'})
+    assert calls == ['first', 'second', 'first', 'second']
+
+def imported_modules(path, seen=None):
+    # fruseum modules imported by a file, transitively
+    seen = set() if seen is None else seen
+    with open(os.path.join(pipeline.ROOT, path)) as source:
+        for line in source:
+            match = re.match(r'from fruseum(?:\.(\w+))? import (\w+)', line)
+            if match:
+                module = 'fruseum/{}.py'.format(match.group(1) or match.group(2))
+                if module not in seen:
+                    seen.add(module)
+                    imported_modules(module, seen)
+    return seen
+
+def test_stage_code_covers_the_imports():
+    args = argparse.Namespace(osm_input='osm/museums-data/france-merged.osm', nominatim=None, reverse=None, workers=None, rate=None)
+    for stage in pipeline.build_stages(args):
+        assert imported_modules(stage.code[0]) - {'fruseum/metrics.py'} <= set(stage.code), stage.name
@@ -0,0 +1,41 @@
+import time
+from fruseum import server
+from fruseum.server import MuseumIndexes, MuseumServer
+
+CSV = 'id,osm_id,name,street,postal_code,city,lat,lon\r\nM1,1,Musée Ingres,,82000,Montauban,44.0158,1.3553\r\n'
+
+def test_watch_survives_a_failed_reload(tmp_path, monkeypatch, capsys):
+    localisation = tmp_path / 'localisation.csv'
+    localisation.write_text(CSV)
+    httpd = MuseumServer(('127.0.0.1', 0), str(localisation), [], str(tmp_path), reload_interval=0.02)
+    first = httpd.indexes
+    load = MuseumIndexes.load
+    calls = []
+    def flaky(*args):
+        # The first reload fails with an error the loader does not expect
+        calls.append(args)
+        if len(calls) == 1:
+            raise KeyError('lat')
+        return load(*args)
+    monkeypatch.setattr(server.MuseumIndexes, 'load', flaky)
+    httpd.start_watching()
+
+    localisation.write_text(CSV + 'M2,2,Musée Fabre,,34000,Montpellier,43.6114,3.8803\r\n')
+    deadline = time.monotonic() + 5
+    while httpd.indexes is first and time.monotonic() < deadline:
+        time.sleep(0.02)
+    httpd.server_close()
+    assert len(calls) >= 2
+    assert len(httpd.indexes.records) == 2
+    assert 'reload failed' in capsys.readouterr().err
+
+def test_name_prefix(tmp_path):
+    localisation = tmp_path / 'localisation.csv'
+    localisation.write_text(CSV + 'M2,2,Musée Fabre,,34000,Montpellier,43.6114,3.8803\r\n'
+                                  'M3,3,Musée des Beaux-Arts de Montauban,,82000,Montauban,44.0170,1.3540\r\n')
+    indexes = MuseumIndexes.load(str(localisation), [], str(tmp_path))
+    assert [record['id'] for record in indexes.name_prefix('MUSÉE', 10)] == ['M3', 'M2', 'M1']
+    assert [record['id'] for record in indexes.name_prefix('musee', 2)] == ['M3', 'M2']
+    assert [record['id'] for record in indexes.name_prefix('ingres', 10)] == ['M1']
+    assert [record['id'] for record in indexes.name_prefix('montauban', 10)] == ['M3']
+    assert indexes.name_prefix('louvre', 10) == []
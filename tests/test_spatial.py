@@ -0,0 +1,57 @@
+import random
+import pytest
+from fruseum.spatial import SpatialIndex, haversine
+
+@pytest.fixture(scope='module')
+def points():
+    # Museums spread over metropolitan France, some of them packed in a city
+    rng = random.Random(7)
+    lats = [rng.uniform(42.0, 51.0) for _ in range(1500)] + [rng.gauss(48.8566, 0.02) for _ in range(500)]
+    lons = [rng.uniform(-5.0, 8.0) for _ in range(1500)] + [rng.gauss(2.3522, 0.03) for _ in range(500)]
+    return lats, lons
+
+@pytest.fixture(scope='module')
+def index(points):
+    lats, lons = points
+    labels = [str(position) for position in range(len(lats))]
+    return SpatialIndex(lats, lons, labels, [''] * len(lats), [0] * len(lats), ['museums.csv'])
+
+def brute_force(points, lat, lon):
+    # (distance, id) of every point, nearest first
+    lats, lons = points
+    distances = haversine(lat, lon, lats, lons)
+    return sorted((float(distance), str(position)) for position, distance in enumerate(distances))
+
+QUERIES = [(48.8566, 2.3522), (45.764, 4.8357), (43.2965, 5.3698), (50.5, -4.5), (41.0, 9.5), (55.0, 0.0)]
+
+@pytest.mark.parametrize('lat, lon', QUERIES)
+@pytest.mark.parametrize('k', [1, 5, 40])
+def test_knn_is_brute_force(index, points, lat, lon, k):
+    expected = brute_force(points, lat, lon)[:k]
+    found = index.knn(lat, lon, k)
+    assert [result['id'] for result in found] == [position for _, position in expected]
+    assert [result['distance'] for result in found] == pytest.approx([distance for distance, _ in expected])
+
+@pytest.mark.parametrize('lat, lon', QUERIES)
+@pytest.mark.parametrize('km', [0.5, 5, 60])
+def test_radius_is_brute_force(index, points, lat, lon, km):
+    expected = [position for distance, position in brute_force(points, lat, lon) if distance <= km]
+    assert [result['id'] for result in index.radius(lat, lon, km)] == expected
+
+def test_bbox_is_brute_force(index, points):
+    lats, lons = points
+    found = index.bbox(48.5, 2.0, 49.0, 2.6)
+    expected = {str(position) for position, (lat, lon) in enumerate(zip(lats, lons)) if 48.5 <= lat <= 49.0 and 2.0 <= lon <= 2.6}
+    assert {result['id'] for result in found} == expected
+    assert len(found) == len(expected)
+
+def test_knn_of_a_small_index():
+    index = SpatialIndex([48.0, 49.0], [2.0, 2.0], ['a', 'b'], ['', ''], [0, 0], ['museums.csv'])
+    assert [result['id'] for result in index.knn(48.2, 2.0, k=5)] == ['a', 'b']
+
+def test_save_and_load(index, tmp_path):
+    filename = str(tmp_path / 'index.npz')
+    index.save(filename)
+    loaded = SpatialIndex.load(filename)
+    assert len(loaded) == len(index)
+    assert loaded.knn(48.8566, 2.3522, 10) == index.knn(48.8566, 2.3522, 10)
@@ -0,0 +1,61 @@
+import pytest
+from fruseum.writers import BatchEncoder, FORMATS, RowWriter, has_footer, output_name, parse_format, read_rows, row_type
+
+FIELDS = ['osm_id', 'name', 'lat', 'lon']
+ROWS = [
+    {'osm_id': '1', 'name': 'Musée d\'Orsay', 'lat': '48.86', 'lon': '2.3265'},
+    {'osm_id': '2', 'name': 'Louvre, "aile Richelieu"', 'lat': '48.861', 'lon': '2.3358'},
+    {'osm_id': '3', 'name': 'Sans position', 'lat': '', 'lon': ''},
+]
+
+def test_row_type():
+    Entry = row_type(FIELDS)
+    entry = Entry()
+    entry['name'] = 'Musée'
+    assert entry['lat'] is None
+    assert entry.get('name') == 'Musée'
+    assert 'lon' in entry and 'city' not in entry
+    with pytest.raises(KeyError):
+        entry['city'] = 'Paris'
+    assert list(entry.keys()) == FIELDS
+
+def test_formats():
+    assert parse_format('csv') == ('csv', None)
+    assert parse_format('geojson.zst') == ('geojson', 'zstd')
+    assert has_footer('geojson.gz') and not has_footer('jsonl')
+    assert output_name('musees.csv', 'jsonl.gz') == 'musees.jsonl.gz'
+    with pytest.raises(ValueError):
+        parse_format('xml')
+
+@pytest.mark.parametrize('output_format', FORMATS)
+def test_round_trip(tmp_path, output_format):
+    if output_format.endswith('.zst'):
+        pytest.importorskip('zstandard')
+    filename = str(tmp_path / ('out.' + output_format))
+    Entry = row_type(FIELDS)
+    writer = RowWriter(filename, FIELDS, output_format)
+    first = Entry()
+    for field in FIELDS:
+        first[field] = ROWS[0][field]
+    writer.writerow(first)
+    writer.close()
+
+    # Appended to the closed file, without a second header
+    writer = RowWriter(filename, FIELDS, output_format, append=True, rows=1)
+    writer.writerows(ROWS[1:])
+    writer.finish()
+
+    fieldnames, rows = read_rows(filename)
+    assert fieldnames == FIELDS
+    assert rows == ROWS
+
+@pytest.mark.parametrize('output_format', ['csv.gz', 'geojson'])
+def test_batches_concatenate(tmp_path, output_format):
+    encoder = BatchEncoder(FIELDS, output_format)
+    filename = str(tmp_path / ('out.' + output_format))
+    with open(filename, 'wb') as output:
+        output.write(encoder.header())
+        output.write(encoder.rows(ROWS[:1], True))
+        output.write(encoder.rows(ROWS[1:], False))
+        output.write(encoder.footer())
+    assert read_rows(filename)[1] == ROWS